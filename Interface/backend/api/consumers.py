@@ -7,6 +7,12 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.utils import timezone
 
+from .metrics import WEBSOCKET_CONNECTIONS
+from .tracing import get_tracer, now_ms
+
+# Most latencies accepted from one client report
+MAX_REPORT_SAMPLES = 500
+
 
 class SensorDataConsumer(AsyncWebsocketConsumer):
     """
@@ -26,6 +32,7 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
         )
         
         await self.accept()
+        WEBSOCKET_CONNECTIONS.labels(self.group_name).inc()
         
         # Send initial connection confirmation
         await self.send(text_data=json.dumps({
@@ -35,6 +42,9 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
     
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
+        if getattr(self, "group_name", None) is None:
+            return
+        WEBSOCKET_CONNECTIONS.labels(self.group_name).dec()
         await self.channel_layer.group_discard(
             self.group_name,
             self.channel_name
@@ -56,19 +66,42 @@ class SensorDataConsumer(AsyncWebsocketConsumer):
                 # Client can subscribe to specific baseboards or sensors
                 # For now, all clients receive all updates
                 pass
+            
+            elif message_type == "latency_report":
+                # Display latencies measured by the client from update traces
+                get_tracer().report(
+                    self._latencies(data.get("display_ms")),
+                    self._latencies(data.get("total_ms")),
+                )
                 
         except json.JSONDecodeError:
             pass
     
+    @staticmethod
+    def _latencies(values):
+        if not isinstance(values, list):
+            return []
+        return [
+            float(v) for v in values[:MAX_REPORT_SAMPLES]
+            if isinstance(v, (int, float)) and not isinstance(v, bool)
+        ]
+    
     async def sensor_update(self, event):
         """
         Handle sensor update messages from the channel layer.
         
         This is called when the MQTT service broadcasts sensor data.
         """
+        data = event["data"]
+        trace = data.get("trace")
+        if trace is not None:
+            # Stamp a copy: the event may be shared with other consumers
+            trace = {**trace, "delivered": now_ms()}
+            get_tracer().between('delivery', trace, 'sent', 'delivered')
+            data = {**data, "trace": trace}
         await self.send(text_data=json.dumps({
             "type": "sensor_update",
-            "data": event["data"]
+            "data": data
         }))
     
     async def baseboard_status(self, event):
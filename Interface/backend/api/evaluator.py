@@ -0,0 +1,190 @@
+"""
+Streaming threshold and rate-of-change evaluation for sensor readings.
+
+Keeps a small amount of rolling state per sensor so every incoming reading
+is evaluated in O(1) without querying history:
+
+- an EWMA of the value, used for threshold comparison so single spikes
+  do not flap the status
+- least-squares slope over a sliding time window, maintained with running
+  sums, reported as the sensor's rate of change
+- hysteresis on warning/critical transitions
+"""
+
+import threading
+from collections import deque
+
+from django.conf import settings
+
+
+LEVEL_ACTIVE = 'active'
+LEVEL_WARNING = 'warning'
+LEVEL_CRITICAL = 'critical'
+
+LEVELS = (LEVEL_ACTIVE, LEVEL_WARNING, LEVEL_CRITICAL)
+
+# Re-base the time origin of the running sums after this many seconds
+# to keep the slope computation numerically stable
+REBASE_SECONDS = 3600
+
+
+class Evaluation:
+    """Result of evaluating one reading."""
+
+    __slots__ = ('status', 'previous_status', 'rate_of_change', 'smoothed')
+
+    def __init__(self, status, previous_status, rate_of_change, smoothed):
+        self.status = status
+        self.previous_status = previous_status
+        self.rate_of_change = rate_of_change
+        self.smoothed = smoothed
+
+    @property
+    def transition(self):
+        return self.status != self.previous_status
+
+
+class _SensorState:
+    """Rolling state for one sensor."""
+
+    __slots__ = ('ewma', 'level', 'window', 'origin',
+                 'sum_t', 'sum_v', 'sum_tt', 'sum_tv')
+
+    def __init__(self, level):
+        self.ewma = None
+        self.level = level
+        self.window = deque()
+        self.origin = None
+        self.sum_t = 0.0
+        self.sum_v = 0.0
+        self.sum_tt = 0.0
+        self.sum_tv = 0.0
+
+    def push(self, t, v):
+        if self.origin is None:
+            self.origin = t
+        elif t - self.origin > REBASE_SECONDS:
+            self._rebase(t)
+        x = t - self.origin
+        self.window.append((x, v))
+        self.sum_t += x
+        self.sum_v += v
+        self.sum_tt += x * x
+        self.sum_tv += x * v
+
+    def evict(self, t, window_seconds, max_samples):
+        cutoff = t - self.origin - window_seconds
+        window = self.window
+        while window and (window[0][0] < cutoff or len(window) > max_samples):
+            x, v = window.popleft()
+            self.sum_t -= x
+            self.sum_v -= v
+            self.sum_tt -= x * x
+            self.sum_tv -= x * v
+
+    def slope(self):
+        n = len(self.window)
+        if n < 2:
+            return 0.0
+        denom = n * self.sum_tt - self.sum_t * self.sum_t
+        if denom <= 1e-12:
+            return 0.0
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denom
+
+    def _rebase(self, t):
+        shift = t - self.origin
+        self.origin = t
+        self.window = deque((x - shift, v) for x, v in self.window)
+        self.sum_t = sum(x for x, _ in self.window)
+        self.sum_v = sum(v for _, v in self.window)
+        self.sum_tt = sum(x * x for x, _ in self.window)
+        self.sum_tv = sum(x * v for x, v in self.window)
+
+
+class SensorEvaluator:
+    """
+    Incremental per-sensor status and rate-of-change evaluator.
+
+    Thresholds are read from the ``Sensor`` instance on every call, so
+    edits made through the API take effect on the next reading.
+    """
+
+    def __init__(self):
+        self.alpha = getattr(settings, 'SENSOR_EWMA_ALPHA', 0.3)
+        self.window_seconds = getattr(settings, 'SENSOR_RATE_WINDOW', 60)
+        self.max_samples = getattr(settings, 'SENSOR_RATE_MAX_SAMPLES', 600)
+        self.warning_band = getattr(settings, 'SENSOR_WARNING_BAND', 0.1)
+        self.hysteresis = getattr(settings, 'SENSOR_HYSTERESIS', 0.02)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def update(self, sensor, value, timestamp):
+        """
+        Feed one reading and return the resulting ``Evaluation``.
+
+        Args:
+            sensor: Sensor model instance
+            value: Converted reading value
+            timestamp: Sample time in epoch seconds
+        """
+        with self._lock:
+            state = self._states.get(sensor.id)
+            if state is None:
+                level = sensor.status if sensor.status in LEVELS else LEVEL_ACTIVE
+                state = _SensorState(level)
+                self._states[sensor.id] = state
+
+            if state.ewma is None:
+                state.ewma = value
+            else:
+                state.ewma += self.alpha * (value - state.ewma)
+
+            state.push(timestamp, value)
+            state.evict(timestamp, self.window_seconds, self.max_samples)
+
+            previous = state.level
+            state.level = self._classify(sensor, state.ewma, previous)
+            return Evaluation(
+                status=state.level,
+                previous_status=previous,
+                rate_of_change=f"{state.slope():+.4g}/s",
+                smoothed=state.ewma,
+            )
+
+    def reset(self, sensor_id):
+        """Drop rolling state for a sensor (e.g. after it went offline)."""
+        with self._lock:
+            self._states.pop(sensor_id, None)
+
+    def _classify(self, sensor, value, current):
+        """Map a smoothed value to a level, applying hysteresis."""
+        low = sensor.min_threshold
+        high = sensor.max_threshold
+        if low is None and high is None:
+            return LEVEL_ACTIVE
+
+        if low is not None and high is not None:
+            span = abs(high - low)
+        else:
+            span = abs(high if high is not None else low)
+        span = span or 1.0
+
+        # Distance beyond the nearest threshold (positive = out of range)
+        excess = float('-inf')
+        if high is not None:
+            excess = max(excess, value - high)
+        if low is not None:
+            excess = max(excess, low - value)
+
+        band = span * self.warning_band
+        hyst = span * self.hysteresis
+
+        if excess > 0:
+            return LEVEL_CRITICAL
+        if current == LEVEL_CRITICAL and excess > -hyst:
+            return LEVEL_CRITICAL
+        if excess > -band:
+            return LEVEL_WARNING
+        if current in (LEVEL_CRITICAL, LEVEL_WARNING) and excess > -band - hyst:
+            return LEVEL_WARNING
+        return LEVEL_ACTIVE
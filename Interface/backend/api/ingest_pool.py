@@ -0,0 +1,148 @@
+"""
+Worker pool for MQTT message ingest.
+
+paho delivers every message on its single network thread, so any work done
+in ``on_message`` delays socket reads and keepalives. The pool lets the
+callback only enqueue the raw message; worker threads decode, store and
+broadcast it. The handler also gets the arrival time (epoch seconds) for
+latency tracing.
+
+Messages are sharded by baseboard id (the second topic level), one queue
+per worker. All messages from a baseboard are therefore handled by the same
+worker in arrival order, which keeps readings of each sensor ordered while
+different baseboards are processed in parallel.
+"""
+
+import logging
+import queue
+import threading
+import time
+import zlib
+
+from django.db import close_old_connections
+
+from .structured_log import sampled
+
+
+logger = logging.getLogger(__name__)
+
+
+# Smoothing factor for the average processing lag
+LAG_EWMA_ALPHA = 0.1
+
+
+class _Shard:
+    """Queue and counters for one worker."""
+
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.processed = 0
+        self.failed = 0
+        self.last_lag = 0.0
+        self.avg_lag = 0.0
+        self.max_lag = 0.0
+
+
+class IngestPool:
+    """
+    Fixed pool of worker threads draining per-baseboard-sharded queues.
+
+    Args:
+        handler: Callable ``handler(topic, payload_bytes, received_at)`` run
+            on a worker, received_at in epoch seconds
+        workers: Number of worker threads (one queue each)
+        max_queue: Capacity of each worker's queue; when full, messages are
+            dropped and counted rather than blocking the network thread
+    """
+
+    def __init__(self, handler, workers=4, max_queue=10000):
+        self.handler = handler
+        self.shards = [_Shard(max_queue) for _ in range(max(1, workers))]
+        self.dropped = 0
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the worker threads (idempotent)."""
+        if self._threads:
+            return
+        for index, shard in enumerate(self.shards):
+            thread = threading.Thread(
+                target=self._run, args=(shard,), name=f"mqtt-ingest-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Ingest pool started with %d workers", len(self.shards))
+
+    def stop(self, timeout=5.0):
+        """Ask workers to finish queued messages and exit."""
+        for shard in self.shards:
+            shard.queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def shard_for(self, topic):
+        """Pick the shard for a topic of the form ``xiot/<baseboard>/...``."""
+        parts = topic.split("/", 2)
+        key = parts[1] if len(parts) > 1 else topic
+        # crc32 rather than hash() so the mapping is stable across restarts
+        return self.shards[zlib.crc32(key.encode()) % len(self.shards)]
+
+    def submit(self, topic, payload):
+        """
+        Queue a raw message for processing. Called from the network thread,
+        so it never blocks: waiting here would also hold up keepalives.
+
+        Returns:
+            bool: False if the message was dropped because the queue was full
+        """
+        try:
+            self.shard_for(topic).queue.put_nowait((topic, payload, time.monotonic(), time.time()))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            sampled(logger, logging.WARNING, "queue_full", "Ingest queue full, dropped message on %s",
+                    topic, dropped=self.dropped)
+            return False
+
+    def _run(self, shard):
+        while True:
+            item = shard.queue.get()
+            if item is None:
+                break
+            topic, payload, enqueued_at, received_at = item
+
+            # Drop connections the database has closed while we were idle
+            close_old_connections()
+            try:
+                self.handler(topic, payload, received_at)
+            except Exception as e:
+                shard.failed += 1
+                sampled(logger, logging.ERROR, "worker_error", "Ingest worker error on %s: %s",
+                        topic, e)
+
+            lag = time.monotonic() - enqueued_at
+            shard.processed += 1
+            shard.last_lag = lag
+            shard.avg_lag += LAG_EWMA_ALPHA * (lag - shard.avg_lag)
+            if lag > shard.max_lag:
+                shard.max_lag = lag
+
+    def stats(self):
+        """Queue depths and processing lag (enqueue to handled), in ms."""
+        depths = [shard.queue.qsize() for shard in self.shards]
+        return {
+            'workers': len(self.shards),
+            'queue_depth': sum(depths),
+            'queue_depth_per_worker': depths,
+            'processed': sum(shard.processed for shard in self.shards),
+            'failed': sum(shard.failed for shard in self.shards),
+            'dropped': self.dropped,
+            'lag_ms': {
+                'last': round(max(shard.last_lag for shard in self.shards) * 1000, 2),
+                'avg': round(max(shard.avg_lag for shard in self.shards) * 1000, 2),
+                'max': round(max(shard.max_lag for shard in self.shards) * 1000, 2),
+            },
+        }
@@ -0,0 +1,456 @@
+"""
+Django management command benchmarking end-to-end MQTT ingest.
+
+Simulates a fleet of PI-xxx baseboards publishing the sensors and status
+payloads of the Pi's MQTTPublisher. An in-process broker stand-in delivers
+the messages to the MQTT service's on_message callback, as paho would from
+its network loop, and the service stores them in a freshly created test
+database (the configured database is not touched).
+
+The offered load is raised step by step until the service saturates: it
+handles less than SATURATION_RATIO of the offered messages, drops messages,
+or its 95th percentile ingest latency (publish to stored) exceeds
+--max-latency. Each step reports messages and reading rows per second and
+latency percentiles.
+
+Usage:
+    python manage.py bench_ingest
+    python manage.py bench_ingest --baseboards 2000 --sensors 4 --step 5
+    python manage.py bench_ingest --backend paho --workers 8 --format batch --samples 10
+    python manage.py bench_ingest --rates 200,500,1000
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from api.wire_format import encode_binary
+
+
+# A step is saturated when fewer than this share of offered messages are handled
+SATURATION_RATIO = 0.9
+
+# Sensor types cycled through on each simulated baseboard: (type, unit, scale)
+SENSOR_TYPES = [
+    ('temperature', '°C', 330.0),
+    ('humidity', '%', 100.0),
+    ('light', 'lux', 1000.0),
+    ('vibration', 'g', 16.0),
+]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class SimulatedBaseboard:
+    """One PI-xxx publisher: its topics and slowly drifting raw readings."""
+
+    def __init__(self, identifier, n_sensors, rng):
+        self.identifier = identifier
+        self.rng = rng
+        self.sensor_topic = f"xiot/{identifier}/sensors"
+        self.status_topic = f"xiot/{identifier}/status"
+        self.sensors = []
+        for s in range(n_sensors):
+            sensor_type, unit, scale = SENSOR_TYPES[s % len(SENSOR_TYPES)]
+            self.sensors.append({
+                "i2c_address": f"0x{0x08 + s:02X}",
+                "name": f"{sensor_type.title()} Sensor {s + 1}",
+                "type": sensor_type,
+                "unit": unit,
+                "scale": scale,
+                "raw": rng.randint(200, 800),
+            })
+
+    def _next_raw(self, sensor):
+        sensor["raw"] = min(1023, max(0, sensor["raw"] + self.rng.randint(-3, 3)))
+        return sensor["raw"]
+
+    def status_payload(self, status="online"):
+        return json.dumps({
+            "baseboard_id": self.identifier,
+            "status": status,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+        }).encode()
+
+    def sensor_payload(self):
+        """Single-sample payload, as MQTTPublisher.publish_sensor_data sends."""
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        readings = []
+        for sensor in self.sensors:
+            raw = self._next_raw(sensor)
+            readings.append({
+                "i2c_address": sensor["i2c_address"],
+                "name": sensor["name"],
+                "type": sensor["type"],
+                "raw_value": raw,
+                "value": round((raw / 1023.0) * sensor["scale"], 2),
+                "unit": sensor["unit"],
+                "status": "active",
+                "timestamp": timestamp,
+            })
+        return json.dumps({
+            "baseboard_id": self.identifier,
+            "sensors": readings,
+            "timestamp": timestamp,
+        }).encode()
+
+    def batch_payload(self, n_samples, binary=False):
+        """Batched (version 2) payload, as MQTTPublisher.publish_sensor_batch sends."""
+        now = datetime.now(dt_timezone.utc)
+        base_time = int((now - timedelta(seconds=n_samples)).timestamp() * 1000)
+        sensors = []
+        for sensor in self.sensors:
+            raws = [self._next_raw(sensor) for _ in range(n_samples)]
+            sensors.append({
+                "i2c_address": sensor["i2c_address"],
+                "name": sensor["name"],
+                "type": sensor["type"],
+                "unit": sensor["unit"],
+                "status": "active",
+                "t": [i * 1000 for i in range(n_samples)],
+                "v": [round((raw / 1023.0) * sensor["scale"], 2) for raw in raws],
+                "raw": raws,
+            })
+        payload = {
+            "baseboard_id": self.identifier,
+            "version": 2,
+            "base_time": base_time,
+            "sensors": sensors,
+            "timestamp": now.isoformat().replace('+00:00', 'Z'),
+        }
+        if binary:
+            return encode_binary(payload)
+        return json.dumps(payload).encode()
+
+
+class BrokerStandIn:
+    """
+    Delivers published messages to the service like a broker connection.
+
+    For the paho backend, on_message is called on the publishing thread (as
+    on paho's network thread); for the asyncio backend it is scheduled on
+    the service's event loop (as from loop_read).
+    """
+
+    def __init__(self, service, loop=None):
+        self.service = service
+        self.loop = loop
+        # id(payload) -> (payload, publish time) until the service has handled it
+        self.pending = {}
+        self.published = 0
+
+    def publish(self, topic, payload):
+        msg = mqtt.MQTTMessage(topic=topic.encode())
+        msg.payload = payload
+        self.pending[id(payload)] = (payload, time.perf_counter())
+        self.published += 1
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.service._on_message, None, None, msg)
+        else:
+            self.service._on_message(None, None, msg)
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks MQTT ingest throughput and latency with a simulated baseboard fleet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseboards', type=int, default=1000,
+                            help='Simulated baseboards (default: 1000)')
+        parser.add_argument('--sensors', type=int, default=4,
+                            help='Sensors per baseboard (default: 4)')
+        parser.add_argument('--format', choices=['single', 'batch', 'binary'], default='single',
+                            help='Sensor payload format (default: single)')
+        parser.add_argument('--samples', type=int, default=5,
+                            help='Samples per sensor in batch/binary payloads (default: 5)')
+        parser.add_argument('--backend', choices=['asyncio', 'paho'],
+                            default=getattr(settings, 'MQTT_INGEST_BACKEND', 'asyncio'),
+                            help='Ingest backend (default: MQTT_INGEST_BACKEND)')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker threads for the paho backend (default: MQTT_INGEST_WORKERS)')
+        parser.add_argument('--start-rate', type=float, default=100.0,
+                            help='First offered load in messages/s (default: 100)')
+        parser.add_argument('--max-rate', type=float, default=20000.0,
+                            help='Stop ramping at this load (default: 20000)')
+        parser.add_argument('--rates', default='',
+                            help='Comma-separated loads to run instead of doubling from --start-rate')
+        parser.add_argument('--step', type=float, default=5.0,
+                            help='Seconds of publishing per load step (default: 5)')
+        parser.add_argument('--drain-timeout', type=float, default=30.0,
+                            help='Seconds to wait for a step backlog to clear (default: 30)')
+        parser.add_argument('--max-latency', type=float, default=1000.0,
+                            help='p95 ingest latency in ms that counts as saturated (default: 1000)')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds between messages of one real baseboard, to express '
+                                 'throughput as a fleet size (default: 1.0)')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--verbose', action='store_true',
+                            help="Show the service's own log output, per-message DEBUG lines included")
+
+    def handle(self, *args, **options):
+        if options['baseboards'] < 1 or options['sensors'] < 1:
+            raise CommandError('--baseboards and --sensors must be at least 1')
+        if options['rates']:
+            rates = [float(rate) for rate in options['rates'].split(',') if rate.strip()]
+        else:
+            rates = []
+            rate = options['start_rate']
+            while rate <= options['max_rate']:
+                rates.append(rate)
+                rate *= 2
+
+        # Readings go to a throwaway test database (a file for SQLite, so
+        # worker threads write to it like they would to the real one)
+        tmpdir = None
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST'].get('NAME'):
+            tmpdir = tempfile.mkdtemp(prefix='xiot-bench-')
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self._run(rates, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmpdir:
+                with contextlib.suppress(OSError):
+                    os.rmdir(tmpdir)
+
+    def _run(self, rates, options):
+        from api.models import SensorReading
+
+        rng = random.Random(options['seed'])
+        fleet = [
+            SimulatedBaseboard(f"PI-{i + 1:03d}", options['sensors'], rng)
+            for i in range(options['baseboards'])
+        ]
+        self._register(fleet)
+
+        out = sys.stdout if options['verbose'] else open(os.devnull, 'w')
+        logging.getLogger('api').setLevel(logging.DEBUG if options['verbose'] else logging.ERROR)
+        with contextlib.redirect_stdout(out):
+            service, broker, shutdown = self._start_service(options)
+        latencies = []
+        original = service._process_message
+
+        def timed(topic, data, *args):
+            try:
+                original(topic, data, *args)
+            finally:
+                entry = broker.pending.pop(id(data), None)
+                if entry is not None:
+                    latencies.append(time.perf_counter() - entry[1])
+
+        service._process_message = timed
+        if service.ingest is not None:
+            service.ingest.handler = timed
+
+        if options['format'] == 'single':
+            make_payload = SimulatedBaseboard.sensor_payload
+            rows_per_message = options['sensors']
+        else:
+            binary = options['format'] == 'binary'
+            make_payload = lambda board: board.batch_payload(options['samples'], binary)  # noqa: E731
+            rows_per_message = options['sensors'] * options['samples']
+
+        self.stdout.write(
+            f"{len(fleet)} baseboards x {options['sensors']} sensors, {options['format']} payloads "
+            f"({rows_per_message} readings/message), {options['backend']} backend"
+            + (f" with {len(service.ingest.shards)} workers" if service.ingest else "")
+        )
+
+        results = []
+        try:
+            with contextlib.redirect_stdout(out):
+                # Every baseboard announces itself, as the Pi does on connect
+                start = time.perf_counter()
+                for board in fleet:
+                    broker.publish(board.status_topic, board.status_payload())
+                self._drain(service, broker, options['drain_timeout'])
+            self.stdout.write(
+                f"Status: {len(fleet)} messages handled in {time.perf_counter() - start:.2f}s"
+            )
+            latencies.clear()
+
+            self.stdout.write(
+                f"{'offered/s':>10}{'handled/s':>11}{'rows/s':>10}{'p50 ms':>9}{'p95 ms':>9}"
+                f"{'p99 ms':>9}{'max ms':>9}{'dropped':>9}"
+            )
+            for rate in rates:
+                rows_before = SensorReading.objects.count()
+                dropped_before = self._dropped(service)
+                step_start = time.perf_counter()
+                published = self._publish(broker, fleet, make_payload, rate, options['step'], out)
+                publish_time = time.perf_counter() - step_start
+                with contextlib.redirect_stdout(out):
+                    self._drain(service, broker, options['drain_timeout'])
+                elapsed = time.perf_counter() - step_start
+
+                step_latencies = sorted(latencies)
+                latencies.clear()
+                rows = SensorReading.objects.count() - rows_before
+                result = {
+                    'rate': rate,
+                    'offered': published / publish_time,
+                    'handled': len(step_latencies) / elapsed,
+                    'rows': rows / elapsed,
+                    'p50': percentile(step_latencies, 0.50) * 1000,
+                    'p95': percentile(step_latencies, 0.95) * 1000,
+                    'p99': percentile(step_latencies, 0.99) * 1000,
+                    'max': (step_latencies[-1] if step_latencies else 0.0) * 1000,
+                    'dropped': self._dropped(service) - dropped_before,
+                }
+                result['saturated'] = (
+                    result['handled'] < SATURATION_RATIO * result['offered']
+                    or result['dropped'] > 0
+                    or result['p95'] > options['max_latency']
+                )
+                results.append(result)
+                self.stdout.write(
+                    f"{result['offered']:>10,.0f}{result['handled']:>11,.0f}{result['rows']:>10,.0f}"
+                    f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['p99']:>9.1f}"
+                    f"{result['max']:>9.1f}{result['dropped']:>9}"
+                    + ("  saturated" if result['saturated'] else "")
+                )
+                if result['offered'] < SATURATION_RATIO * rate:
+                    self.stdout.write(self.style.WARNING(
+                        f"Publisher reached only {result['offered']:,.0f} of {rate:,.0f} messages/s; "
+                        "the load generator is the bottleneck"
+                    ))
+                    break
+                if result['saturated']:
+                    break
+        finally:
+            with contextlib.redirect_stdout(out):
+                shutdown()
+            if out is not sys.stdout:
+                out.close()
+
+        self._summary(results, options)
+
+    def _register(self, fleet):
+        """Create the fleet's baseboards and sensors in the test database."""
+        from api.models import Baseboard, Sensor
+
+        Baseboard.objects.bulk_create([
+            Baseboard(name=f"Bench {board.identifier}", identifier=board.identifier, status='offline')
+            for board in fleet
+        ], batch_size=500)
+        ids = dict(Baseboard.objects.values_list('identifier', 'id'))
+        Sensor.objects.bulk_create([
+            Sensor(
+                baseboard_id=ids[board.identifier],
+                name=sensor["name"],
+                sensor_type=sensor["type"],
+                i2c_address=sensor["i2c_address"],
+                unit=sensor["unit"],
+                status='inactive',
+            )
+            for board in fleet
+            for sensor in board.sensors
+        ], batch_size=500)
+
+    def _start_service(self, options):
+        """Create the ingest service; returns (service, broker, shutdown)."""
+        if options['backend'] == 'asyncio':
+            from api.mqtt_async import AsyncMQTTService
+
+            service = AsyncMQTTService()
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(
+                target=loop.run_until_complete, args=(service.run(connect=False),),
+                name='bench-ingest-loop', daemon=True,
+            )
+            thread.start()
+            # Wait until run() has set up its queue and consumer
+            asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout=10)
+
+            def shutdown():
+                service.stop()
+                thread.join(10)
+                loop.close()
+
+            return service, BrokerStandIn(service, loop), shutdown
+
+        from api.mqtt_service import MQTTService
+
+        overrides = {}
+        if options['workers'] is not None:
+            overrides['MQTT_INGEST_WORKERS'] = options['workers']
+        with override_settings(**overrides):
+            service = MQTTService()
+        if service.ingest:
+            service.ingest.start()
+
+        def shutdown():
+            if service.ingest:
+                service.ingest.stop()
+
+        return service, BrokerStandIn(service), shutdown
+
+    def _publish(self, broker, fleet, make_payload, rate, duration, out):
+        """Publish round-robin over the fleet at `rate` messages/s; returns the count."""
+        interval = 1.0 / rate
+        count = 0
+        start = time.perf_counter()
+        next_time = start
+        with contextlib.redirect_stdout(out):
+            while True:
+                now = time.perf_counter()
+                if now - start >= duration:
+                    break
+                if now < next_time:
+                    time.sleep(min(next_time - now, 0.01))
+                    continue
+                board = fleet[count % len(fleet)]
+                broker.publish(board.sensor_topic, make_payload(board))
+                count += 1
+                next_time += interval
+        return count
+
+    def _dropped(self, service):
+        stats = service.ingest_stats()
+        return stats['dropped'] if stats else 0
+
+    def _drain(self, service, broker, timeout):
+        """Wait until every message not dropped has been handled."""
+        deadline = time.perf_counter() + timeout
+        while len(broker.pending) > self._dropped(service) and time.perf_counter() < deadline:
+            time.sleep(0.01)
+
+    def _summary(self, results, options):
+        sustained = [r for r in results if not r['saturated']]
+        if sustained:
+            best = max(sustained, key=lambda r: r['handled'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Sustained: {best['handled']:,.0f} messages/s, {best['rows']:,.0f} rows/s, "
+                f"p95 {best['p95']:.1f} ms (~{best['handled'] * options['interval']:,.0f} baseboards "
+                f"publishing every {options['interval']:g}s)"
+            ))
+        saturated = [r for r in results if r['saturated']]
+        if saturated:
+            first = saturated[0]
+            self.stdout.write(self.style.WARNING(
+                f"Saturation at ~{first['offered']:,.0f} messages/s offered "
+                f"(handled {first['handled']:,.0f}/s, p95 {first['p95']:.1f} ms, "
+                f"{first['dropped']} dropped)"
+            ))
+        elif results:
+            self.stdout.write("Not saturated at the highest load; raise --max-rate")
@@ -0,0 +1,117 @@
+"""
+Django management command comparing sensor payload encodings.
+
+Builds the same set of samples as single-sample JSON messages, batched
+(version 2) JSON and the binary wire format, then reports payload size
+and decode throughput for each.
+
+Usage:
+    python manage.py bench_payload
+    python manage.py bench_payload --sensors 8 --samples 50 --iterations 2000
+"""
+
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+
+from api.wire_format import decode_payload, encode_binary
+
+
+class Command(BaseCommand):
+    help = 'Compares size and decode throughput of sensor payload formats'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sensors', type=int, default=4,
+                            help='Sensors per baseboard (default: 4)')
+        parser.add_argument('--samples', type=int, default=5,
+                            help='Samples per sensor in each batch (default: 5)')
+        parser.add_argument('--iterations', type=int, default=5000,
+                            help='Decode iterations per format (default: 5000)')
+
+    def handle(self, *args, **options):
+        n_sensors = options['sensors']
+        n_samples = options['samples']
+        iterations = options['iterations']
+
+        base = datetime(2025, 12, 24, 12, 0, tzinfo=dt_timezone.utc)
+        base_time = int(base.timestamp() * 1000)
+
+        # Single-sample JSON messages, as published before batching
+        single = []
+        for i in range(n_samples):
+            timestamp = (base + timedelta(seconds=i)).isoformat().replace('+00:00', 'Z')
+            sensors = []
+            for s in range(n_sensors):
+                raw = random.randint(0, 1023)
+                sensors.append({
+                    "i2c_address": f"0x{0x08 + s:02X}",
+                    "name": "Temperature Sensor",
+                    "type": "temperature",
+                    "raw_value": raw,
+                    "value": round((raw / 1023.0) * 330, 2),
+                    "unit": "°C",
+                    "status": "active",
+                    "timestamp": timestamp,
+                })
+            single.append(json.dumps({
+                "baseboard_id": "PI-001",
+                "sensors": sensors,
+                "timestamp": timestamp,
+            }).encode())
+
+        # The same samples as one batched payload
+        batch = {
+            "baseboard_id": "PI-001",
+            "version": 2,
+            "base_time": base_time,
+            "sensors": [],
+        }
+        for s in range(n_sensors):
+            entry = {
+                "i2c_address": f"0x{0x08 + s:02X}",
+                "name": "Temperature Sensor",
+                "type": "temperature",
+                "unit": "°C",
+                "status": "active",
+                "t": [],
+                "v": [],
+                "raw": [],
+            }
+            for i in range(n_samples):
+                sample = json.loads(single[i])["sensors"][s]
+                entry["t"].append(i * 1000)
+                entry["v"].append(sample["value"])
+                entry["raw"].append(sample["raw_value"])
+            batch["sensors"].append(entry)
+        batch_json = json.dumps(batch).encode()
+        batch_binary = encode_binary(batch)
+
+        total_samples = n_sensors * n_samples
+        formats = [
+            ('json (1 msg/sample set)', single),
+            ('json v2 batch', [batch_json]),
+            ('binary batch', [batch_binary]),
+        ]
+
+        self.stdout.write(
+            f"{n_sensors} sensors x {n_samples} samples = {total_samples} samples, "
+            f"{iterations} decode iterations"
+        )
+        self.stdout.write(f"{'format':<26}{'bytes':>10}{'B/sample':>10}{'decode/s':>14}{'samples/s':>14}")
+
+        for name, messages in formats:
+            size = sum(len(m) for m in messages)
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for message in messages:
+                    decode_payload(message)
+            elapsed = time.perf_counter() - start
+            decodes = iterations * len(messages) / elapsed
+            samples = iterations * total_samples / elapsed
+            self.stdout.write(
+                f"{name:<26}{size:>10}{size / total_samples:>10.1f}"
+                f"{decodes:>14,.0f}{samples:>14,.0f}"
+            )
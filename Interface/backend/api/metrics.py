@@ -0,0 +1,327 @@
+"""
+Prometheus-style metrics for the backend's hot paths.
+
+Metrics are module-level counters, gauges and histograms updated inline
+where events happen, and rendered in the Prometheus text exposition format
+only when ``/metrics`` is scraped. An update is a cached dict lookup for the
+label values plus an add under that series' lock, so it is cheap enough to
+do per MQTT message:
+
+    MQTT_MESSAGES.labels('sensors').inc()
+    DB_FLUSH_SECONDS.observe(elapsed)
+
+Values that already live elsewhere (ingest queue depth, reading latency
+histograms from ``tracing``) are read by collectors at scrape time instead
+of being updated twice.
+"""
+
+import bisect
+import math
+import threading
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; suits DB writes, group_send and broker publishes
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Topic kinds counted per message; anything else is counted as 'other'
+TOPIC_KINDS = ('sensors', 'status', 'calibration', 'i2c_stats')
+
+
+def topic_kind(topic):
+    """Last level of an ``xiot/<baseboard>/<kind>`` topic, for use as a label."""
+    kind = topic.rsplit('/', 1)[-1]
+    return kind if kind in TOPIC_KINDS else 'other'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Registry:
+    """Metrics and scrape-time collectors rendered by ``/metrics``."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector):
+        """Add a callable returning exposition lines (HELP/TYPE included)."""
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics):
+            lines.extend(metric.render())
+        for collector in list(self._collectors):
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                lines.append(f'# collector {getattr(collector, "__name__", collector)} failed: {e}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """
+    A metric family: one series per combination of label values.
+
+    Each series is a single value; Histogram overrides ``_new_series``.
+    """
+
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics are exported (as 0) before their first update
+            self.labels()
+        if registry is not None:
+            registry.register(self)
+
+    def labels(self, *values):
+        """The series for these label values (positional, in labelnames order)."""
+        series = self._series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f'{self.name} expects labels {self.labelnames}, got {values}')
+            with self._lock:
+                series = self._series.setdefault(values, self._new_series())
+        return series
+
+    def _new_series(self):
+        return _Value()
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {_escape(self.documentation)}',
+            f'# TYPE {self.name} {self.type}',
+        ]
+        for values, series in sorted(self._series.items()):
+            lines.extend(series.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = float(value)
+
+    def render(self, name, labelnames, values):
+        return [f'{name}{_label_text(labelnames, values)} {_format_value(self.value)}']
+
+
+class Counter(_Metric):
+    """Monotonically increasing count (use the ``_total`` suffix)."""
+
+    type = 'counter'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    type = 'gauge'
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'count', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, count, total = list(self.counts), self.count, self.sum
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + (math.inf,), counts):
+            cumulative += bucket_count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f'{name}_bucket{_label_text(labelnames, values, le)} {cumulative}')
+        lines.append(f'{name}_sum{_label_text(labelnames, values)} {_format_value(total)}')
+        lines.append(f'{name}_count{_label_text(labelnames, values)} {count}')
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=REGISTRY):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_series(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+# =============================================================================
+# Backend metrics
+# =============================================================================
+
+MQTT_MESSAGES = Counter(
+    'xiot_mqtt_messages_total', 'MQTT messages received, by topic kind', ['topic'])
+MQTT_MESSAGE_FAILURES = Counter(
+    'xiot_mqtt_message_failures_total',
+    'MQTT messages that could not be decoded or stored, by topic kind', ['topic'])
+UNKNOWN_BASEBOARDS = Counter(
+    'xiot_unknown_baseboard_messages_total', 'Messages from baseboards that are not registered')
+UNKNOWN_SENSORS = Counter(
+    'xiot_unknown_sensor_readings_total',
+    'Readings for sensors not registered on their baseboard', ['baseboard'])
+DB_LOCKED_ERRORS = Counter(
+    'xiot_db_locked_errors_total',
+    'Message writes that failed because the database was locked, by topic kind', ['topic'])
+
+DB_FLUSH_ROWS = Histogram(
+    'xiot_db_flush_rows', 'Sensor readings written per bulk insert',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 5000))
+DB_FLUSH_SECONDS = Histogram(
+    'xiot_db_flush_seconds', 'Duration of sensor reading bulk inserts')
+INGEST_BATCH_MESSAGES = Histogram(
+    'xiot_ingest_batch_messages', 'Messages stored per database batch (asyncio ingest)',
+    buckets=(1, 2, 5, 10, 25, 50, 100, 200, 500, 1000))
+
+WEBSOCKET_CONNECTIONS = Gauge(
+    'xiot_websocket_connections', 'Open WebSocket connections, by group', ['group'])
+BROADCAST_SECONDS = Histogram(
+    'xiot_broadcast_seconds', 'Channel layer group_send duration (fan-out), by message type',
+    ['type'])
+
+ACTUATOR_COMMANDS = Counter(
+    'xiot_actuator_commands_total', 'Actuator commands, by command and result',
+    ['command', 'result'])
+ACTUATOR_COMMAND_SECONDS = Histogram(
+    'xiot_actuator_command_seconds', 'Time to publish an actuator command to the broker',
+    ['command'])
+
+
+def _ingest_collector():
+    from .mqtt_service import get_ingest_stats
+
+    stats = get_ingest_stats()
+    if stats is None:
+        return []
+    backend = _escape(stats['backend'])
+    return [
+        '# HELP xiot_ingest_queue_depth Messages waiting for ingest processing',
+        '# TYPE xiot_ingest_queue_depth gauge',
+        f'xiot_ingest_queue_depth{{backend="{backend}"}} {stats["queue_depth"]}',
+        '# HELP xiot_ingest_processed_total Messages processed by the ingest service',
+        '# TYPE xiot_ingest_processed_total counter',
+        f'xiot_ingest_processed_total{{backend="{backend}"}} {stats["processed"]}',
+        '# HELP xiot_ingest_dropped_total Messages dropped because the ingest queue was full',
+        '# TYPE xiot_ingest_dropped_total counter',
+        f'xiot_ingest_dropped_total{{backend="{backend}"}} {stats["dropped"]}',
+    ]
+
+
+def _log_collector():
+    from .structured_log import dropped_records
+
+    return [
+        '# HELP xiot_log_records_dropped_total Log records dropped because the log queue was full',
+        '# TYPE xiot_log_records_dropped_total counter',
+        f'xiot_log_records_dropped_total {dropped_records()}',
+    ]
+
+
+def _latency_collector():
+    """Reading latency stages from the tracer, in seconds."""
+    from .tracing import get_tracer
+
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return []
+    snapshot = tracer.snapshot()
+    name = 'xiot_reading_latency_seconds'
+    lines = [
+        f'# HELP {name} Live reading latency per stage, I2C read to browser display',
+        f'# TYPE {name} histogram',
+    ]
+    bounds = [ms / 1000.0 for ms in snapshot['buckets_ms']] + [math.inf]
+    for stage, histogram in snapshot['stages'].items():
+        cumulative = 0
+        for bound, count in zip(bounds, histogram['buckets'].values()):
+            cumulative += count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{_format_value(bound)}"}} {cumulative}')
+        total = histogram['sum_ms'] / 1000.0
+        lines.append(f'{name}_sum{{stage="{stage}"}} {_format_value(total)}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {histogram["count"]}')
+    return lines
+
+
+REGISTRY.register_collector(_ingest_collector)
+REGISTRY.register_collector(_latency_collector)
+REGISTRY.register_collector(_log_collector)
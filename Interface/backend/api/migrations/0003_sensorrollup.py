@@ -0,0 +1,32 @@
+# Generated by Django 5.2 on 2026-10-18 09:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_actuator_i2c_address_alter_actuator_actuator_type_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SensorRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_start', models.DateTimeField()),
+                ('window_end', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('mean_value', models.FloatField()),
+                ('rms_value', models.FloatField()),
+                ('sensor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='api.sensor')),
+            ],
+            options={
+                'ordering': ['-window_end'],
+                'indexes': [models.Index(fields=['sensor', '-window_end'], name='api_sensorr_sensor__c27d5b_idx')],
+            },
+        ),
+    ]
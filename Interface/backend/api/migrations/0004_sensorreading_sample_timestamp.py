@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:31
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_sensorrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_sensorreading_sample_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='calibration',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='sensorreading',
+            name='raw_value',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:50
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_sensor_calibration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BusStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('source', models.CharField(choices=[('service', 'I2C bus service'), ('direct', 'Direct bus access')], default='direct', max_length=20)),
+                ('bus', models.IntegerField(default=1)),
+                ('clock_hz', models.IntegerField(blank=True, null=True)),
+                ('interval', models.FloatField(help_text='Seconds covered by this report')),
+                ('transactions', models.IntegerField(default=0)),
+                ('transactions_per_s', models.FloatField(default=0.0)),
+                ('bytes_per_s', models.FloatField(default=0.0)),
+                ('utilisation', models.FloatField(default=0.0, help_text='Fraction of time the bus was busy')),
+                ('errors', models.IntegerField(default=0)),
+                ('retries', models.IntegerField(default=0)),
+                ('queue_depth', models.IntegerField(default=0)),
+                ('ops', models.JSONField(blank=True, default=dict)),
+                ('devices', models.JSONField(blank=True, default=dict)),
+                ('baseboard', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bus_stats', to='api.baseboard')),
+            ],
+            options={
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['baseboard', '-timestamp'], name='api_busstat_baseboa_705304_idx')],
+            },
+        ),
+    ]
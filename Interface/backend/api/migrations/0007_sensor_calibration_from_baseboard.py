@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_busstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensor',
+            name='calibration_from_baseboard',
+            field=models.BooleanField(default=False),
+        ),
+    ]
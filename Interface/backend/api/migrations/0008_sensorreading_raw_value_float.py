@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_sensor_calibration_from_baseboard'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sensorreading',
+            name='raw_value',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_sensorreading_raw_value_float'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sensorreading',
+            name='channels',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Baseboard(models.Model):
@@ -61,6 +62,11 @@ class Sensor(models.Model):
     max_threshold = models.FloatField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='inactive')
     rate_of_change = models.CharField(max_length=20, blank=True)
+    # Declarative raw -> value conversion, see api/calibration.py
+    calibration = models.JSONField(default=dict, blank=True)
+    # Set when the baseboard publishes the calibration; it converts live
+    # readings with it, so the API cannot change it
+    calibration_from_baseboard = models.BooleanField(default=False)
     last_reading = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -124,7 +130,13 @@ class SensorReading(models.Model):
     """Stores historical sensor readings."""
     sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='readings')
     value = models.FloatField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # The number calibration was applied to, in 10-bit ADC counts; fractional
+    # for oversampling (block protocol) adapters
+    raw_value = models.FloatField(null=True, blank=True)
+    # Every raw ADC channel of a multi-channel (block protocol) adapter
+    channels = models.JSONField(null=True, blank=True)
+    # Sample time reported by the Pi (may be backfilled after an outage)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp']
@@ -133,6 +145,56 @@ class SensorReading(models.Model):
         ]
 
 
+class SensorRollup(models.Model):
+    """Stores window summaries aggregated on the edge."""
+    sensor = models.ForeignKey(Sensor, on_delete=models.CASCADE, related_name='rollups')
+    window_start = models.DateTimeField()
+    window_end = models.DateTimeField()
+    count = models.IntegerField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    mean_value = models.FloatField()
+    rms_value = models.FloatField()
+
+    class Meta:
+        ordering = ['-window_end']
+        indexes = [
+            models.Index(fields=['sensor', '-window_end']),
+        ]
+
+
+class BusStats(models.Model):
+    """Stores periodic I2C bus activity reports from a baseboard."""
+    SOURCE_CHOICES = [
+        ('service', 'I2C bus service'),
+        ('direct', 'Direct bus access'),
+    ]
+
+    baseboard = models.ForeignKey(Baseboard, on_delete=models.CASCADE, related_name='bus_stats')
+    timestamp = models.DateTimeField(default=timezone.now)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='direct')
+    bus = models.IntegerField(default=1)
+    clock_hz = models.IntegerField(null=True, blank=True)
+    # Rates and counts over the reporting interval
+    interval = models.FloatField(help_text='Seconds covered by this report')
+    transactions = models.IntegerField(default=0)
+    transactions_per_s = models.FloatField(default=0.0)
+    bytes_per_s = models.FloatField(default=0.0)
+    utilisation = models.FloatField(default=0.0, help_text='Fraction of time the bus was busy')
+    errors = models.IntegerField(default=0)
+    retries = models.IntegerField(default=0)
+    queue_depth = models.IntegerField(default=0)
+    # Cumulative counters per SMBus method and per device address
+    ops = models.JSONField(default=dict, blank=True)
+    devices = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['baseboard', '-timestamp']),
+        ]
+
+
 class Event(models.Model):
     """Stores system events and logs."""
     SEVERITY_CHOICES = [
@@ -0,0 +1,355 @@
+"""
+asyncio MQTT ingest service for XIOT
+
+Runs the paho client on the ASGI server's event loop instead of paho's own
+network thread. Socket readiness is driven by the loop (``add_reader`` /
+``add_writer``), broadcasts await ``channel_layer.group_send`` directly, and
+database work is handed to a single-thread executor in batches of queued
+messages, each committed as one transaction, so the loop never blocks on the
+database.
+
+Selected with ``MQTT_INGEST_BACKEND = 'asyncio'`` (the default); set it to
+``'paho'`` for the threaded ``MQTTService``.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import paho.mqtt.client as mqtt
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .metrics import BROADCAST_SECONDS, INGEST_BATCH_MESSAGES
+from .mqtt_service import MQTTService, get_mqtt_service
+from .structured_log import sampled
+
+
+logger = logging.getLogger(__name__)
+
+
+# Smoothing factor for the average processing lag
+LAG_EWMA_ALPHA = 0.1
+
+
+class AsyncMQTTService(MQTTService):
+    """
+    MQTT service driven by an asyncio event loop.
+
+    Message handlers are shared with ``MQTTService``; only the network
+    loop, queueing and broadcasting differ.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+
+        self.batch_size = getattr(settings, 'MQTT_ASYNC_BATCH_SIZE', 200)
+        self.max_queue = getattr(settings, 'MQTT_INGEST_QUEUE_SIZE', 10000)
+        # One DB thread keeps batches, and so per-sensor readings, in order
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='mqtt-db')
+
+        self.loop = None
+        self._loop_thread = None
+        self._queue = None
+        self._task = None
+        self._consumer = None
+        self._misc = None
+        self._sock_fd = None
+        self._reconnecting = False
+        self._stopping = False
+        # Broadcasts collected by the DB thread, sent from the loop
+        self._pending_broadcasts = []
+        # Set when the message being stored fails, to roll back its savepoint
+        self._failed = False
+
+        self.processed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.last_lag = 0.0
+        self.avg_lag = 0.0
+        self.max_lag = 0.0
+
+    def _create_ingest_pool(self):
+        # Messages are queued on the event loop instead of a thread pool
+        return None
+
+    # ------------------------------------------------------------------
+    # Event loop integration
+    # ------------------------------------------------------------------
+
+    def _in_loop(self, callback, *args):
+        """Run callback on the event loop thread (paho may call from the connect executor)."""
+        if threading.get_ident() == self._loop_thread:
+            callback(*args)
+        else:
+            self.loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._in_loop(self._watch_socket, sock.fileno())
+
+    def _on_socket_close(self, client, userdata, sock):
+        self._in_loop(self._unwatch_socket)
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._in_loop(self._watch_writes, sock.fileno())
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._in_loop(self._unwatch_writes, sock.fileno())
+
+    def _watch_socket(self, fd):
+        self._sock_fd = fd
+        self.loop.add_reader(fd, self.client.loop_read)
+        if self._misc is None or self._misc.done():
+            self._misc = self.loop.create_task(self._misc_loop())
+
+    def _unwatch_socket(self):
+        # Use the fd saved at open time; the socket may already be closed
+        if self._sock_fd is not None:
+            self.loop.remove_reader(self._sock_fd)
+            self.loop.remove_writer(self._sock_fd)
+            self._sock_fd = None
+        if self._misc is not None:
+            self._misc.cancel()
+            self._misc = None
+
+    def _watch_writes(self, fd):
+        self.loop.add_writer(fd, self.client.loop_write)
+
+    def _unwatch_writes(self, fd):
+        self.loop.remove_writer(fd)
+
+    async def _misc_loop(self):
+        """Keepalive pings and timeouts, normally done by paho's loop thread."""
+        while self.client.loop_misc() == mqtt.MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+    # ------------------------------------------------------------------
+    # Connection
+    # ------------------------------------------------------------------
+
+    async def _connect(self, reconnect=False):
+        """Connect (or reconnect) with exponential backoff until stopped."""
+        delay = 1
+        while not self._stopping:
+            try:
+                # Socket connect blocks on DNS/TCP, keep it off the loop
+                if reconnect:
+                    await self.loop.run_in_executor(None, self.client.reconnect)
+                else:
+                    await self.loop.run_in_executor(
+                        None, self.client.connect, self.broker, self.port, 60
+                    )
+                return True
+            except (OSError, ValueError) as e:
+                logger.warning("Connection error: %s (retrying in %ss)", e, delay)
+                reconnect = False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+        return False
+
+    def _on_disconnect(self, client, userdata, rc):
+        super()._on_disconnect(client, userdata, rc)
+        if not self._stopping and not self._reconnecting:
+            self._in_loop(self._schedule_reconnect)
+
+    def _schedule_reconnect(self):
+        self._reconnecting = True
+        task = self.loop.create_task(self._reconnect())
+        task.add_done_callback(lambda _: setattr(self, '_reconnecting', False))
+
+    async def _reconnect(self):
+        await asyncio.sleep(1)
+        await self._connect(reconnect=True)
+
+    # ------------------------------------------------------------------
+    # Ingest
+    # ------------------------------------------------------------------
+
+    def _on_message(self, client, userdata, msg):
+        """Queue a raw message; called from loop_read on the event loop."""
+        try:
+            self._queue.put_nowait((msg.topic, msg.payload, time.monotonic(), time.time()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            sampled(logger, logging.WARNING, "queue_full", "Ingest queue full, dropped message on %s",
+                    msg.topic, dropped=self.dropped)
+
+    async def _consume(self):
+        """Drain the queue in batches: DB work in the executor, broadcasts on the loop."""
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            broadcasts = await self.loop.run_in_executor(self.executor, self._store_batch, batch)
+            for message in broadcasts:
+                try:
+                    start = time.perf_counter()
+                    await self.channel_layer.group_send("sensor_updates", message)
+                    elapsed = time.perf_counter() - start
+                    BROADCAST_SECONDS.labels(message["type"]).observe(elapsed)
+                    self.tracer.observe('broadcast', elapsed * 1000)
+                except Exception as e:
+                    sampled(logger, logging.ERROR, "broadcast", "WebSocket broadcast error: %s", e)
+
+            now = time.monotonic()
+            INGEST_BATCH_MESSAGES.observe(len(batch))
+            self.batches += 1
+            self.processed += len(batch)
+            for _, _, enqueued_at, _ in batch:
+                lag = now - enqueued_at
+                self.avg_lag += LAG_EWMA_ALPHA * (lag - self.avg_lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+            self.last_lag = now - batch[-1][2]
+
+    def _store_batch(self, batch):
+        """Process a batch of messages on the DB thread; return queued broadcasts."""
+        close_old_connections()
+        self._pending_broadcasts = []
+        # One commit per batch; a savepoint per message undoes only the
+        # writes of a message that failed part-way
+        with transaction.atomic():
+            for topic, data, _, received_at in batch:
+                with transaction.atomic():
+                    self._failed = False
+                    self._process_message(topic, data, received_at)
+                    if self._failed:
+                        transaction.set_rollback(True)
+        broadcasts, self._pending_broadcasts = self._pending_broadcasts, []
+        return broadcasts
+
+    def _message_failed(self, kind):
+        super()._message_failed(kind)
+        self._failed = True
+
+    def _group_send(self, message):
+        # Sent by _consume once the batch is stored
+        self._pending_broadcasts.append(message)
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    async def run(self, connect=True):
+        """
+        Connect and process messages until stopped.
+
+        With connect=False no broker connection is made; messages are only
+        those passed to ``_on_message`` on the loop (bench_ingest).
+        """
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._consumer = self.loop.create_task(self._consume())
+
+        if connect:
+            logger.info("Connecting to %s:%s (asyncio)...", self.broker, self.port)
+            await self._connect()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+
+    def ensure_started(self, loop=None):
+        """
+        Start the service if it is not running yet.
+
+        Args:
+            loop: Event loop to run on (default: the running loop). It need
+                not be running yet; the service starts when it does.
+        """
+        if self._task is None:
+            self._task = (loop or asyncio.get_running_loop()).create_task(self.run())
+
+    def start(self):
+        """Run the service on a new event loop (blocking), e.g. from mqtt_subscribe."""
+        asyncio.run(self.run())
+
+    def _shutdown(self):
+        self._stopping = True
+        if self.connected:
+            self.client.disconnect()
+        if self._consumer is not None:
+            self._consumer.cancel()
+        self.executor.shutdown(wait=False)
+
+    def stop(self):
+        """Stop the service; safe to call from any thread."""
+        if self.loop is not None and self.loop.is_running():
+            self._in_loop(self._shutdown)
+
+    async def stop_async(self):
+        """Stop the service from the event loop and wait for it to finish."""
+        if self.loop is None:
+            return
+        self._shutdown()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def ingest_stats(self):
+        """Queue depth, batching and processing lag (enqueue to broadcast), in ms."""
+        return {
+            'backend': 'asyncio',
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'avg_batch_size': round(self.processed / self.batches, 2) if self.batches else None,
+            'lag_ms': {
+                'last': round(self.last_lag * 1000, 2),
+                'avg': round(self.avg_lag * 1000, 2),
+                'max': round(self.max_lag * 1000, 2),
+            },
+        }
+
+
+class MQTTIngestMiddleware:
+    """
+    ASGI wrapper that runs the asyncio MQTT service on the server's loop.
+
+    Servers that speak the lifespan protocol start and stop it there. Daphne
+    does not, so the service is scheduled on the asyncio loop under its
+    Twisted reactor, and at the latest started on the first request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.service = get_mqtt_service()
+        self._start_with_reactor()
+
+    def _start_with_reactor(self):
+        if 'twisted.internet.reactor' not in sys.modules:
+            return
+        from twisted.internet import reactor
+        from twisted.internet.asyncioreactor import AsyncioSelectorReactor
+        if isinstance(reactor, AsyncioSelectorReactor):
+            # callWhenRunning fires before the reactor's asyncio loop runs,
+            # so hand the loop over explicitly; the task starts with it
+            loop = reactor._asyncioEventloop
+            reactor.callWhenRunning(self.service.ensure_started, loop)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        self.service.ensure_started()
+        await self.app(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.service.ensure_started()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.service.stop_async()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -7,18 +7,34 @@ stores readings in database, and broadcasts to WebSocket clients.
 Run with: python manage.py mqtt_subscribe
 """
 
-import json
+import logging
 import time
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 import paho.mqtt.client as mqtt
 from django.conf import settings
+from django.db import OperationalError, connection, transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 
-from .models import Baseboard, Sensor, SensorReading, Event
+from .calibration import CalibrationError, convert, convert_array, validate
+from .evaluator import SensorEvaluator
+from .ingest_pool import IngestPool
+from .metrics import (
+    BROADCAST_SECONDS, DB_FLUSH_ROWS, DB_FLUSH_SECONDS, DB_LOCKED_ERRORS, MQTT_MESSAGE_FAILURES,
+    MQTT_MESSAGES, UNKNOWN_BASEBOARDS, UNKNOWN_SENSORS, topic_kind,
+)
+from .models import Baseboard, BusStats, Sensor, SensorReading, SensorRollup, Event
+from .readings_cache import get_readings_cache
+from .structured_log import sampled
+from .tracing import get_tracer, now_ms
+from .wire_format import PayloadError, decode_payload
+
+
+logger = logging.getLogger(__name__)
 
 
 class MQTTService:
@@ -43,7 +59,7 @@ class MQTTService:
             clean_session=True,
             protocol=mqtt.MQTTv311
         )
-        print(f"[MQTT] Client ID: {unique_id}", flush=True)
+        logger.info("Client ID: %s", unique_id)
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
@@ -55,18 +71,39 @@ class MQTTService:
             self.client.username_pw_set(self.username, self.password)
         
         self.channel_layer = get_channel_layer()
+        self.evaluator = SensorEvaluator()
+        self.tracer = get_tracer()
         self.connected = False
+        
+        self.ingest = self._create_ingest_pool()
+    
+    def _create_ingest_pool(self):
+        """Decode/store/broadcast off the network thread (0 workers = inline)."""
+        workers = getattr(settings, 'MQTT_INGEST_WORKERS', None)
+        if workers is None:
+            # Concurrent SQLite writers only queue on the database lock
+            workers = 1 if connection.vendor == 'sqlite' else 4
+        if workers <= 0:
+            return None
+        return IngestPool(
+            self._process_message,
+            workers=workers,
+            max_queue=getattr(settings, 'MQTT_INGEST_QUEUE_SIZE', 10000),
+        )
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback when connected to broker."""
         if rc == 0:
-            print(f"[MQTT] Connected to broker at {self.broker}:{self.port}", flush=True)
+            logger.info("Connected to broker at %s:%s", self.broker, self.port)
             self.connected = True
             
             # Subscribe to all XIOT topics
             client.subscribe("xiot/+/sensors", qos=1)
             client.subscribe("xiot/+/status", qos=1)
-            print("[MQTT] Subscribed to xiot/+/sensors and xiot/+/status", flush=True)
+            client.subscribe("xiot/+/calibration", qos=1)
+            client.subscribe("xiot/+/i2c_stats", qos=0)
+            logger.info("Subscribed to xiot/+/sensors, xiot/+/status, xiot/+/calibration "
+                        "and xiot/+/i2c_stats")
         else:
             error_messages = {
                 1: "Incorrect protocol version",
@@ -76,96 +113,383 @@ class MQTTService:
                 5: "Not authorized"
             }
             msg = error_messages.get(rc, f"Unknown error {rc}")
-            print(f"[MQTT] Connection failed: {msg}", flush=True)
+            logger.error("Connection failed: %s", msg)
     
     def _on_disconnect(self, client, userdata, rc):
         """Callback when disconnected from broker."""
         self.connected = False
         if rc == 0:
-            print("[MQTT] Disconnected cleanly", flush=True)
+            logger.info("Disconnected cleanly")
         else:
-            print(f"[MQTT] Unexpected disconnect (rc={rc}), will reconnect...", flush=True)
+            logger.warning("Unexpected disconnect (rc=%s), will reconnect...", rc)
     
     def _on_message(self, client, userdata, msg):
-        """Callback when message received."""
+        """Callback when message received (runs on paho's network thread)."""
+        if self.ingest:
+            self.ingest.submit(msg.topic, msg.payload)
+        else:
+            self._process_message(msg.topic, msg.payload, time.time())
+    
+    def _process_message(self, topic, data, received_at=None):
+        """Decode a raw message (received at epoch seconds) and dispatch it by topic."""
+        kind = topic_kind(topic)
+        MQTT_MESSAGES.labels(kind).inc()
         try:
-            topic = msg.topic
-            payload = json.loads(msg.payload.decode())
-            
-            print(f"[MQTT] Message on {topic}", flush=True)
+            payload = decode_payload(data)
+            sampled(logger, logging.DEBUG, kind, "Message on %s", topic)
             
             # Determine message type from topic
             if "/sensors" in topic:
-                self._handle_sensor_data(payload)
+                self._handle_sensor_data(payload, received_at)
             elif "/status" in topic:
                 self._handle_status_update(payload)
+            elif "/calibration" in topic:
+                self._handle_calibration(payload)
+            elif "/i2c_stats" in topic:
+                self._handle_i2c_stats(payload)
                 
-        except json.JSONDecodeError as e:
-            print(f"[MQTT] JSON decode error: {e}", flush=True)
+        except PayloadError as e:
+            self._message_failed(kind)
+            sampled(logger, logging.WARNING, "decode", "Payload decode error: %s", e, topic=topic)
         except Exception as e:
-            print(f"[MQTT] Error processing message: {e}", flush=True)
+            self._message_failed(kind)
+            sampled(logger, logging.ERROR, "process", "Error processing message: %s", e, topic=topic)
     
-    def _handle_sensor_data(self, payload):
-        """Process incoming sensor data."""
+    def _handle_sensor_data(self, payload, arrived_at=None):
+        """Process incoming sensor data (single-sample or batched payloads)."""
         baseboard_id = payload.get("baseboard_id")
         sensors_data = payload.get("sensors", [])
+        backfill = bool(payload.get("backfill"))
+        batched = payload.get("version") == 2
+        received_at = timezone.now()
+        trace = self.tracer.start(payload, arrived_at)
         
-        print(f"[MQTT] Received sensor data from {baseboard_id}: {len(sensors_data)} sensors", flush=True)
+        sampled(logger, logging.DEBUG, "received", "Received %ssensor data from %s: %d sensors",
+                'backfilled ' if backfill else '', baseboard_id, len(sensors_data),
+                baseboard=baseboard_id)
         
         # Update database
         try:
             baseboard = Baseboard.objects.filter(identifier=baseboard_id).first()
             
             if baseboard:
-                baseboard.last_seen = timezone.now()
+                baseboard.last_seen = received_at
                 baseboard.status = 'online'
                 baseboard.save(update_fields=['last_seen', 'status'])
                 
                 for sensor_data in sensors_data:
-                    self._update_sensor(baseboard, sensor_data)
+                    if batched:
+                        self._update_sensor_batch(
+                            baseboard, sensor_data, payload.get("base_time"), received_at
+                        )
+                    else:
+                        self._update_sensor(baseboard, sensor_data, received_at)
             else:
-                print(f"[MQTT] Unknown baseboard: {baseboard_id}", flush=True)
+                UNKNOWN_BASEBOARDS.inc()
+                sampled(logger, logging.WARNING, ('baseboard', baseboard_id),
+                        "Unknown baseboard: %s", baseboard_id, baseboard=baseboard_id)
                 
         except Exception as e:
-            print(f"[MQTT] Database error: {e}", flush=True)
+            self._database_error('sensors', e)
         
-        # Broadcast to WebSocket clients
-        self._broadcast_sensor_update(payload)
-    
-    def _update_sensor(self, baseboard, sensor_data):
-        """Update sensor in database and store reading."""
-        i2c_address = sensor_data.get("i2c_address")
-        value = sensor_data.get("value")
-        status = sensor_data.get("status", "active")
+        if trace is not None:
+            self.tracer.stored(trace)
         
+        # Broadcast to WebSocket clients (replayed history is not live data)
+        if not backfill:
+            if batched:
+                payload = self._latest_samples(payload)
+            if trace is not None:
+                trace["sent"] = now_ms()
+                payload["trace"] = trace
+            self._broadcast_sensor_update(payload)
+    
+    def _sample_time(self, timestamp, received_at):
+        """Parse a sample timestamp from the Pi, falling back to arrival time."""
+        sample_time = parse_datetime(timestamp) if timestamp else None
+        if sample_time is None:
+            return received_at
+        if timezone.is_naive(sample_time):
+            sample_time = timezone.make_aware(sample_time, dt_timezone.utc)
+        # Never accept samples from the future (Pi clock skew)
+        return min(sample_time, received_at)
+    
+    def _batch_times(self, base_time, offsets, received_at):
+        """Expand a base time (epoch ms) plus per-sample offsets into datetimes."""
+        if base_time is None:
+            return [received_at] * len(offsets)
+        return [
+            min(datetime.fromtimestamp((base_time + offset) / 1000.0, tz=dt_timezone.utc), received_at)
+            for offset in offsets
+        ]
+    
+    def _message_failed(self, kind):
+        """Count a message of this topic kind that could not be fully processed."""
+        MQTT_MESSAGE_FAILURES.labels(kind).inc()
+    
+    def _database_error(self, kind, error):
+        """Count and log a failed write for a message of this topic kind."""
+        self._message_failed(kind)
+        if isinstance(error, OperationalError) and 'locked' in str(error):
+            DB_LOCKED_ERRORS.labels(kind).inc()
+        sampled(logger, logging.ERROR, "database", "Database error: %s", error)
+    
+    def _find_sensor(self, baseboard, i2c_address):
         sensor = Sensor.objects.filter(
             baseboard=baseboard,
             i2c_address=i2c_address
         ).first()
+        if not sensor:
+            UNKNOWN_SENSORS.labels(baseboard.identifier).inc()
+            sampled(logger, logging.WARNING, ('sensor', baseboard.identifier, i2c_address),
+                    "Sensor %s not found on baseboard %s", i2c_address, baseboard.identifier,
+                    baseboard=baseboard.identifier, i2c_address=i2c_address)
+        return sensor
+    
+    def _update_sensor(self, baseboard, sensor_data, received_at=None):
+        """Update sensor in database and store reading."""
+        received_at = received_at or timezone.now()
+        sensor = self._find_sensor(baseboard, sensor_data.get("i2c_address"))
+        if not sensor:
+            return
         
-        if sensor:
-            if value is not None:
-                sensor.current_value = value
-                sensor.status = status
-                sensor.last_reading = timezone.now()
-                sensor.save(update_fields=['current_value', 'status', 'last_reading'])
-                
-                SensorReading.objects.create(
-                    sensor=sensor,
-                    value=value
-                )
-            else:
-                sensor.status = 'offline'
-                sensor.save(update_fields=['status'])
-        else:
-            print(f"[MQTT] Sensor {i2c_address} not found on baseboard {baseboard.identifier}", flush=True)
+        sample_time = self._sample_time(sensor_data.get("timestamp"), received_at)
+        value = sensor_data.get("value")
+        raw = sensor_data.get("raw_value")
+        if value is None and raw is not None and sensor_data.get("status") != "offline":
+            # Raw-only reading: convert with the sensor's stored calibration
+            value = convert(sensor.calibration, raw)
+            sensor_data["value"] = value
+        
+        stored = self._apply_samples(
+            sensor, [(sample_time, value, raw, sensor_data.get("channels"))], sensor_data
+        )
+        
+        # Edge-aggregated window summary
+        aggregate = sensor_data.get("aggregate")
+        if aggregate and stored:
+            self._store_rollup(sensor, aggregate)
+    
+    def _update_sensor_batch(self, baseboard, sensor_data, base_time, received_at):
+        """Store every sample of one sensor from a batched (version 2) payload."""
+        sensor = self._find_sensor(baseboard, sensor_data.get("i2c_address"))
+        if not sensor:
+            return
+        
+        offsets = sensor_data.get("t", [])
+        raws = sensor_data.get("raw") or [None] * len(offsets)
+        values = sensor_data.get("v")
+        if values is None:
+            # Raw-only batch: convert the whole column at once
+            values = self._convert_raws(sensor, raws)
+            sensor_data["v"] = values
+        channels = sensor_data.get("ch") or [None] * len(offsets)
+        times = self._batch_times(base_time, offsets, received_at)
+        self._apply_samples(sensor, list(zip(times, values, raws, channels)), sensor_data)
+    
+    def _convert_raws(self, sensor, raws):
+        """Convert a column of raw values (None = offline) with the sensor's calibration."""
+        present = [i for i, raw in enumerate(raws) if raw is not None]
+        values = [None] * len(raws)
+        if present:
+            converted = convert_array(sensor.calibration, [raws[i] for i in present])
+            for i, value in zip(present, converted.tolist()):
+                values[i] = value
+        return values
+    
+    def _apply_samples(self, sensor, samples, sensor_data):
+        """
+        Store time-ordered (timestamp, value, raw, channels) samples for a
+        sensor and advance its live state.
+        
+        Samples older than the sensor's latest reading only extend history.
+        Returns the number of readings stored.
+        """
+        last_reading = sensor.last_reading
+        readings = [
+            SensorReading(sensor=sensor, value=value, raw_value=raw, channels=channels,
+                          timestamp=sample_time)
+            for sample_time, value, raw, channels in samples
+            if value is not None
+        ]
+        if readings:
+            start = time.perf_counter()
+            SensorReading.objects.bulk_create(readings)
+            DB_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            DB_FLUSH_ROWS.observe(len(readings))
+        
+        if readings:
+            # Re-aggregate cached history buckets the readings fall into, once
+            # they are committed and visible to queries
+            oldest = min(r.timestamp for r in readings)
+            transaction.on_commit(lambda: get_readings_cache().reopen(sensor.id, oldest))
+        
+        fresh = [(t, v) for t, v, _, _ in samples if last_reading is None or t >= last_reading]
+        if not fresh:
+            return len(readings)
+        
+        result = None
+        for sample_time, value in fresh:
+            if value is None:
+                result = None
+                continue
+            # Derive status and rate of change from rolling state
+            result = self.evaluator.update(sensor, value, sample_time.timestamp())
+            if result.transition:
+                self._record_transition(sensor, value, result)
+        
+        sample_time, value = fresh[-1]
+        if value is None:
+            self.evaluator.reset(sensor.id)
+            sensor.status = 'offline'
+            sensor.save(update_fields=['status'])
+            return len(readings)
+        
+        sensor.current_value = value
+        sensor.status = result.status
+        sensor.rate_of_change = result.rate_of_change
+        sensor.last_reading = sample_time
+        sensor.save(update_fields=['current_value', 'status', 'rate_of_change', 'last_reading'])
+        
+        # Annotate broadcast so clients see the evaluated state; binary
+        # payloads do not carry descriptive fields, so fill them in too
+        sensor_data["alert_status"] = result.status
+        sensor_data["rate_of_change"] = result.rate_of_change
+        sensor_data.setdefault("name", sensor.name)
+        sensor_data.setdefault("type", sensor.sensor_type)
+        sensor_data.setdefault("unit", sensor.unit)
+        return len(readings)
+    
+    def _latest_samples(self, payload):
+        """Reduce a batched payload to the single-sample shape clients expect."""
+        base_time = payload.get("base_time")
+        sensors = []
+        for sensor_data in payload.get("sensors", []):
+            offsets = sensor_data.get("t") or [0]
+            values = sensor_data.get("v") or [None]
+            latest = {
+                key: value for key, value in sensor_data.items()
+                if key not in ("t", "v", "raw")
+            }
+            latest["value"] = values[-1]
+            latest["status"] = sensor_data.get("status", "active" if values[-1] is not None else "offline")
+            if base_time is not None:
+                latest["timestamp"] = datetime.fromtimestamp(
+                    (base_time + offsets[-1]) / 1000.0, tz=dt_timezone.utc
+                ).isoformat()
+            sensors.append(latest)
+        return {
+            "baseboard_id": payload.get("baseboard_id"),
+            "sensors": sensors,
+            "timestamp": payload.get("timestamp"),
+        }
+    
+    def _store_rollup(self, sensor, aggregate):
+        """Store a min/max/mean/RMS window summary published by the Pi."""
+        now = timezone.now()
+        window_end = parse_datetime(aggregate.get("window_end") or "") or now
+        window_start = parse_datetime(aggregate.get("window_start") or "") or window_end
+        
+        SensorRollup.objects.create(
+            sensor=sensor,
+            window_start=window_start,
+            window_end=window_end,
+            count=aggregate.get("count", 0),
+            min_value=aggregate["min"],
+            max_value=aggregate["max"],
+            mean_value=aggregate["mean"],
+            rms_value=aggregate["rms"],
+        )
+    
+    def _record_transition(self, sensor, value, result):
+        """Log a sensor status transition as an event."""
+        severity = {
+            'critical': 'critical',
+            'warning': 'warning',
+        }.get(result.status, 'info')
+        
+        Event.objects.create(
+            source=f'sensor:{sensor.name}',
+            event_type='sensor_status_change',
+            message=(
+                f"{sensor.name} changed from {result.previous_status} to {result.status} "
+                f"(value {value:.2f}{sensor.unit}, trend {result.rate_of_change})"
+            ),
+            severity=severity
+        )
+    
+    def _handle_calibration(self, payload):
+        """Mirror the calibrations a baseboard is using onto its sensors."""
+        baseboard_id = payload.get("baseboard_id")
+        calibrations = payload.get("sensors", {})
+        
+        try:
+            baseboard = Baseboard.objects.filter(identifier=baseboard_id).first()
+            if not baseboard:
+                UNKNOWN_BASEBOARDS.inc()
+                sampled(logger, logging.WARNING, ('baseboard', baseboard_id),
+                        "Unknown baseboard: %s", baseboard_id, baseboard=baseboard_id)
+                return
+            
+            for i2c_address, spec in calibrations.items():
+                sensor = self._find_sensor(baseboard, i2c_address)
+                if not sensor:
+                    continue
+                try:
+                    spec = validate(spec)
+                except CalibrationError as e:
+                    logger.warning("Invalid calibration for %s/%s: %s", baseboard_id, i2c_address, e)
+                    continue
+                if sensor.calibration != spec or not sensor.calibration_from_baseboard:
+                    sensor.calibration = spec
+                    sensor.calibration_from_baseboard = True
+                    sensor.save(update_fields=['calibration', 'calibration_from_baseboard'])
+                    logger.info("Calibration updated for %s: %s", sensor.name, spec)
+        except Exception as e:
+            self._database_error('calibration', e)
+    
+    def _handle_i2c_stats(self, payload):
+        """Store a periodic I2C bus activity report."""
+        baseboard_id = payload.get("baseboard_id")
+        
+        try:
+            baseboard = Baseboard.objects.filter(identifier=baseboard_id).first()
+            if not baseboard:
+                UNKNOWN_BASEBOARDS.inc()
+                sampled(logger, logging.WARNING, ('baseboard', baseboard_id),
+                        "Unknown baseboard: %s", baseboard_id, baseboard=baseboard_id)
+                return
+            
+            timestamp = self._sample_time(payload.get("timestamp"), timezone.now())
+            BusStats.objects.create(
+                baseboard=baseboard,
+                timestamp=timestamp,
+                source=payload.get("source", "direct"),
+                bus=payload.get("bus", 1),
+                clock_hz=payload.get("clock_hz"),
+                interval=payload.get("interval_s", 0.0),
+                transactions=payload.get("transactions", 0),
+                transactions_per_s=payload.get("transactions_per_s", 0.0),
+                bytes_per_s=payload.get("bytes_per_s", 0.0),
+                utilisation=payload.get("utilisation", 0.0),
+                errors=payload.get("errors", 0),
+                retries=payload.get("retries", 0),
+                queue_depth=payload.get("queue_depth") or 0,
+                ops=payload.get("ops", {}),
+                devices=payload.get("devices", {}),
+            )
+            
+            retention = timedelta(days=getattr(settings, 'I2C_STATS_RETENTION_DAYS', 7))
+            BusStats.objects.filter(baseboard=baseboard, timestamp__lt=timestamp - retention).delete()
+        except Exception as e:
+            self._database_error('i2c_stats', e)
     
     def _handle_status_update(self, payload):
         """Process baseboard status update."""
         baseboard_id = payload.get("baseboard_id")
         status = payload.get("status")
         
-        print(f"[MQTT] Status update from {baseboard_id}: {status}", flush=True)
+        logger.info("Status update from %s: %s", baseboard_id, status)
         
         try:
             baseboard = Baseboard.objects.filter(identifier=baseboard_id).first()
@@ -181,36 +505,42 @@ class MQTTService:
                     severity='info' if status == 'online' else 'warning'
                 )
         except Exception as e:
-            print(f"[MQTT] Database error: {e}", flush=True)
+            self._database_error('status', e)
         
         self._broadcast_status_update(payload)
     
     def _broadcast_sensor_update(self, data):
         """Broadcast sensor data to all connected WebSocket clients."""
-        try:
-            async_to_sync(self.channel_layer.group_send)(
-                "sensor_updates",
-                {
-                    "type": "sensor_update",
-                    "data": data
-                }
-            )
-            print(f"[MQTT] Broadcast sent to WebSocket clients", flush=True)
-        except Exception as e:
-            print(f"[MQTT] WebSocket broadcast error: {e}", flush=True)
+        self._group_send({
+            "type": "sensor_update",
+            "data": data
+        })
     
     def _broadcast_status_update(self, data):
         """Broadcast status update to all connected WebSocket clients."""
+        self._group_send({
+            "type": "baseboard_status",
+            "data": data
+        })
+    
+    def _group_send(self, message):
+        """Send a message to the sensor_updates group from a worker thread."""
         try:
-            async_to_sync(self.channel_layer.group_send)(
-                "sensor_updates",
-                {
-                    "type": "baseboard_status",
-                    "data": data
-                }
-            )
+            start = time.perf_counter()
+            async_to_sync(self.channel_layer.group_send)("sensor_updates", message)
+            elapsed = time.perf_counter() - start
+            BROADCAST_SECONDS.labels(message["type"]).observe(elapsed)
+            self.tracer.observe('broadcast', elapsed * 1000)
+            sampled(logger, logging.DEBUG, message["type"], "Broadcast sent to WebSocket clients",
+                    type=message["type"])
         except Exception as e:
-            print(f"[MQTT] WebSocket broadcast error: {e}", flush=True)
+            sampled(logger, logging.ERROR, "broadcast", "WebSocket broadcast error: %s", e)
+    
+    def ingest_stats(self):
+        """Worker pool queue depth and lag, or None when processing inline."""
+        if self.ingest is None:
+            return None
+        return {'backend': 'paho', **self.ingest.stats()}
     
     def connect(self):
         """Connect to MQTT broker."""
@@ -218,23 +548,27 @@ class MQTTService:
             self.client.connect(self.broker, self.port, keepalive=60)
             return True
         except Exception as e:
-            print(f"[MQTT] Connection error: {e}", flush=True)
+            logger.error("Connection error: %s", e)
             return False
     
     def start(self):
         """Start the MQTT client loop."""
-        print(f"[MQTT] Connecting to {self.broker}:{self.port}...", flush=True)
+        logger.info("Connecting to %s:%s...", self.broker, self.port)
+        if self.ingest:
+            self.ingest.start()
         if self.connect():
-            print("[MQTT] Starting message loop...", flush=True)
+            logger.info("Starting message loop...")
             # loop_forever handles reconnection automatically
             self.client.loop_forever(retry_first_connection=True)
         else:
-            print("[MQTT] Failed to connect!", flush=True)
+            logger.error("Failed to connect!")
     
     def stop(self):
         """Stop the MQTT client."""
         self.client.loop_stop()
         self.client.disconnect()
+        if self.ingest:
+            self.ingest.stop()
 
 
 # Singleton instance
@@ -242,8 +576,19 @@ _mqtt_service = None
 
 
 def get_mqtt_service():
-    """Get or create the MQTT service instance."""
+    """Get or create the MQTT service instance for MQTT_INGEST_BACKEND."""
     global _mqtt_service
     if _mqtt_service is None:
-        _mqtt_service = MQTTService()
+        if getattr(settings, 'MQTT_INGEST_BACKEND', 'asyncio') == 'asyncio':
+            from .mqtt_async import AsyncMQTTService
+            _mqtt_service = AsyncMQTTService()
+        else:
+            _mqtt_service = MQTTService()
     return _mqtt_service
+
+
+def get_ingest_stats():
+    """Ingest queue metrics, or None if the service is not running in this process."""
+    if _mqtt_service is None:
+        return None
+    return _mqtt_service.ingest_stats()
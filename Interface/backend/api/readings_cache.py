@@ -0,0 +1,226 @@
+"""
+Cache for downsampled historical sensor readings.
+
+The readings endpoint splits a time range into fixed-width buckets aligned
+to the epoch. Every bucket that ends before the current one is closed and
+can never change, so it is cached per (sensor, range, bucket size). On each
+request only the readings since the last cached boundary are fetched and
+the newest, still-open bucket is recomputed.
+
+Readings can still arrive for a closed bucket: batched payloads carry
+several seconds of Pi-stamped samples, and backfill replays history.
+Ingest calls ``reopen()`` with the oldest stored sample, which drops the
+cached buckets from that one onward so they are re-aggregated.
+
+Database queries run outside the cache lock. Newly closed buckets are only
+merged into an entry if it has not changed since they were queried;
+otherwise they serve that one request and the next one queries again.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+
+
+# Supported time ranges in seconds
+RANGE_SECONDS = {
+    '1h': 3600,
+    '6h': 6 * 3600,
+    '24h': 24 * 3600,
+    '7d': 7 * 86400,
+    '30d': 30 * 86400,
+}
+
+DEFAULT_RANGE = '24h'
+
+# Upper bound on the number of buckets returned for a range
+MAX_POINTS = 500
+
+
+def default_bucket_seconds(range_seconds):
+    """Smallest whole-second bucket that keeps a range within MAX_POINTS."""
+    return max(1, math.ceil(range_seconds / MAX_POINTS))
+
+
+def _epoch(dt):
+    return dt.timestamp()
+
+
+def _from_epoch(seconds):
+    return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+
+
+class _Entry:
+    """Closed buckets for one cache key."""
+
+    __slots__ = ('buckets', 'closed_until', 'fetching_until', 'version')
+
+    def __init__(self):
+        # List of [start, count, total, min, max], ordered by start
+        self.buckets = []
+        # Epoch second up to which all buckets are closed and cached
+        self.closed_until = None
+        # Highest end of closed buckets being queried (outside the lock)
+        self.fetching_until = None
+        # Bumped whenever closed_until moves or a query may have missed readings
+        self.version = 0
+
+
+class ReadingsCache:
+    """
+    LRU cache of closed reading buckets with hit/miss counters.
+    """
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries or getattr(settings, 'READINGS_CACHE_SIZE', 256)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_buckets(self, sensor, time_range, bucket_seconds, now):
+        """
+        Return the buckets covering ``time_range`` ending at ``now``.
+
+        Each bucket is a dict with ``timestamp`` (bucket start), ``value``
+        (mean), ``min``, ``max`` and ``count``. The last bucket may still be
+        open and is always recomputed from the database.
+        """
+        range_seconds = RANGE_SECONDS[time_range]
+        now_s = _epoch(now)
+        open_start = math.floor(now_s / bucket_seconds) * bucket_seconds
+        first_start = math.floor((now_s - range_seconds) / bucket_seconds) * bucket_seconds
+        key = (sensor.id, time_range, bucket_seconds)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                entry = _Entry()
+                self._entries[key] = entry
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+            # Drop buckets that have scrolled out of the window
+            drop = 0
+            while drop < len(entry.buckets) and entry.buckets[drop][0] < first_start:
+                drop += 1
+            if drop:
+                del entry.buckets[:drop]
+
+            fetch_from = first_start
+            if entry.closed_until is not None:
+                fetch_from = max(entry.closed_until, first_start)
+            if fetch_from < open_start:
+                entry.fetching_until = max(entry.fetching_until or open_start, open_start)
+            version = entry.version
+            buckets = [b for b in entry.buckets if b[0] < open_start]
+
+        # Extend closed buckets up to the start of the open bucket
+        if fetch_from < open_start:
+            closed = self._aggregate(sensor, fetch_from, open_start, bucket_seconds)
+            buckets.extend(closed)
+            with self._lock:
+                # Skip if a reopen() or another request changed the entry meanwhile
+                if self._entries.get(key) is entry and entry.version == version:
+                    entry.buckets.extend(closed)
+                    entry.closed_until = open_start
+                    entry.version += 1
+
+        buckets.extend(self._aggregate(sensor, open_start, None, bucket_seconds))
+        return [self._format(b) for b in buckets]
+
+    def reopen(self, sensor_id, since):
+        """
+        Un-close cached buckets of a sensor from the one containing ``since``.
+
+        Called after storing readings timestamped ``since`` or later; buckets
+        before it stay cached.
+        """
+        since_s = _epoch(since)
+        with self._lock:
+            for key, entry in self._entries.items():
+                if key[0] != sensor_id:
+                    continue
+                if entry.fetching_until is not None and since_s < entry.fetching_until:
+                    # Keep a query in flight from caching buckets without them
+                    entry.version += 1
+                if entry.closed_until is None or since_s >= entry.closed_until:
+                    continue
+                bucket_seconds = key[2]
+                start = math.floor(since_s / bucket_seconds) * bucket_seconds
+                keep = 0
+                while keep < len(entry.buckets) and entry.buckets[keep][0] < start:
+                    keep += 1
+                del entry.buckets[keep:]
+                entry.closed_until = start
+                entry.version += 1
+
+    def invalidate(self, sensor_id):
+        """Forget every cached window for a sensor."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == sensor_id]:
+                del self._entries[key]
+
+    def stats(self):
+        """Return cache size and hit/miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+    def _aggregate(self, sensor, start, end, bucket_seconds):
+        """Aggregate readings in [start, end) into buckets."""
+        readings = sensor.readings.filter(timestamp__gte=_from_epoch(start))
+        if end is not None:
+            readings = readings.filter(timestamp__lt=_from_epoch(end))
+        readings = readings.order_by('timestamp').values_list('timestamp', 'value')
+
+        buckets = []
+        current = None
+        for timestamp, value in readings.iterator():
+            bucket_start = math.floor(_epoch(timestamp) / bucket_seconds) * bucket_seconds
+            if current is None or current[0] != bucket_start:
+                current = [bucket_start, 0, 0.0, value, value]
+                buckets.append(current)
+            current[1] += 1
+            current[2] += value
+            if value < current[3]:
+                current[3] = value
+            if value > current[4]:
+                current[4] = value
+        return buckets
+
+    @staticmethod
+    def _format(bucket):
+        start, count, total, low, high = bucket
+        return {
+            'timestamp': _from_epoch(start),
+            'value': total / count,
+            'min': low,
+            'max': high,
+            'count': count,
+        }
+
+
+# Singleton instance
+_readings_cache = None
+
+
+def get_readings_cache():
+    """Get or create the readings cache instance."""
+    global _readings_cache
+    if _readings_cache is None:
+        _readings_cache = ReadingsCache()
+    return _readings_cache
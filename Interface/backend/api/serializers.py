@@ -1,11 +1,28 @@
 from rest_framework import serializers
-from .models import Baseboard, Sensor, Actuator, SensorReading, Event
+from .models import Baseboard, Sensor, Actuator, SensorReading, SensorRollup, BusStats, Event
+from .calibration import CalibrationError, validate as validate_calibration
+
+
+CALIBRATION_MANAGED_ERROR = (
+    "Calibration is managed by the baseboard; change it in the Pi's SENSOR_MAPPINGS"
+)
 
 
 class SensorSerializer(serializers.ModelSerializer):
     class Meta:
         model = Sensor
         fields = '__all__'
+        read_only_fields = ['calibration_from_baseboard']
+
+    def validate_calibration(self, value):
+        try:
+            value = validate_calibration(value)
+        except CalibrationError as e:
+            raise serializers.ValidationError(str(e))
+        sensor = self.instance
+        if sensor is not None and sensor.calibration_from_baseboard and value != sensor.calibration:
+            raise serializers.ValidationError(CALIBRATION_MANAGED_ERROR)
+        return value
 
 
 class ActuatorSerializer(serializers.ModelSerializer):
@@ -59,6 +76,34 @@ class SensorReadingSerializer(serializers.ModelSerializer):
         fields = ['id', 'value', 'timestamp']
 
 
+class SensorReadingBucketSerializer(serializers.Serializer):
+    """Serializer for downsampled reading buckets."""
+    timestamp = serializers.DateTimeField()
+    value = serializers.FloatField()
+    min = serializers.FloatField()
+    max = serializers.FloatField()
+    count = serializers.IntegerField()
+
+
+class SensorRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SensorRollup
+        fields = [
+            'id', 'window_start', 'window_end', 'count',
+            'min_value', 'max_value', 'mean_value', 'rms_value'
+        ]
+
+
+class BusStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BusStats
+        fields = [
+            'id', 'timestamp', 'source', 'bus', 'clock_hz', 'interval',
+            'transactions', 'transactions_per_s', 'bytes_per_s', 'utilisation',
+            'errors', 'retries', 'queue_depth', 'ops', 'devices'
+        ]
+
+
 class EventSerializer(serializers.ModelSerializer):
     class Meta:
         model = Event
@@ -1,3 +1,648 @@
-from django.test import TestCase
+import asyncio
+import ast
+import io
+import json
+import logging
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import OperationalError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from .models import Actuator, Baseboard, BusStats, Event, Sensor, SensorReading
+from . import calibration, structured_log, wire_format
+from .consumers import SensorDataConsumer
+from .evaluator import LEVEL_ACTIVE, LEVEL_CRITICAL, LEVEL_WARNING, SensorEvaluator
+from .ingest_pool import IngestPool
+from .management.commands.bench_ingest import (
+    Command as BenchIngestCommand, SimulatedBaseboard, percentile,
+)
+from .metrics import DB_LOCKED_ERRORS, REGISTRY, Counter, Gauge, Histogram, Registry
+from .mqtt_async import AsyncMQTTService, MQTTIngestMiddleware
+from .mqtt_service import MQTTService
+from .readings_cache import ReadingsCache
+from .tracing import LatencyHistogram, LatencyTracer, now_ms
+
+
+# Modules the Pi and the backend each keep a copy of
+PI_DIR = Path(settings.BASE_DIR).parent.parent / 'Pi'
+SHARED_MODULES = ('calibration.py', 'structured_log.py', 'wire_format.py')
+
+# Aligned to 10 s buckets
+NOW = datetime(2026, 1, 10, 12, 0, 0, tzinfo=dt_timezone.utc)
+
+
+def make_sensor(identifier='PI-001', address='0x08'):
+    baseboard = Baseboard.objects.create(name=identifier, identifier=identifier)
+    sensor = Sensor.objects.create(
+        baseboard=baseboard, name='Temperature', sensor_type='temperature',
+        i2c_address=address, unit='C',
+    )
+    return baseboard, sensor
+
+
+# =============================================================================
+# Shared modules
+# =============================================================================
+
+def batch_payload(**sensor):
+    return {
+        'baseboard_id': 'PI-001',
+        'version': 2,
+        'base_time': 1767000000000,
+        'sensors': [{'i2c_address': '0x08', 'status': 'active', **sensor}],
+    }
+
+
+class WireFormatTests(SimpleTestCase):
+    def test_binary_round_trip(self):
+        payload = batch_payload(t=[0, 1000, 2000], v=[20.5, 21.0, 21.25], raw=[512, 512.25, 513.5])
+        payload['backfill'] = True
+        data = wire_format.encode_binary(payload)
+        self.assertTrue(wire_format.is_binary(data))
+        self.assertEqual(wire_format.decode_payload(data), payload)
+
+    def test_offline_samples_and_missing_raw_values(self):
+        payload = batch_payload(t=[0, 1000], v=[20.5, None], raw=None)
+        decoded = wire_format.decode_payload(wire_format.encode_binary(payload))['sensors'][0]
+        self.assertEqual(decoded['v'], [20.5, None])
+        self.assertEqual(decoded['raw'], [None, None])
+        self.assertEqual(decoded['status'], 'offline')
+
+    def test_json_payloads_pass_through(self):
+        self.assertEqual(wire_format.decode_payload(b'{"version": 2}'), {'version': 2})
+
+    def test_malformed_payloads(self):
+        data = wire_format.encode_binary(batch_payload(t=[0], v=[1.0], raw=[1]))
+        with self.assertRaises(wire_format.PayloadError):
+            wire_format.decode_payload(data[:-4])
+        with self.assertRaises(wire_format.PayloadError):
+            wire_format.decode_payload(data[:1] + bytes([99]) + data[2:])
+        with self.assertRaises(wire_format.PayloadError):
+            wire_format.decode_payload(b'{not json')
+
+
+class CalibrationTests(SimpleTestCase):
+    def test_validate_normalises(self):
+        self.assertEqual(calibration.validate(None), calibration.IDENTITY)
+        self.assertEqual(calibration.validate({'kind': 'linear', 'scale': '2'}),
+                         {'kind': 'linear', 'scale': 2.0, 'offset': 0.0})
+        self.assertEqual(calibration.validate({'kind': 'table', 'points': [[10, 1], [0, 0]]}),
+                         {'kind': 'table', 'points': [[0.0, 0.0], [10.0, 1.0]]})
+
+    def test_validate_rejects_malformed_specs(self):
+        for spec in ([1, 2], {'kind': 'cubic'}, {'kind': 'linear', 'scale': 'x'},
+                     {'kind': 'polynomial', 'coefficients': []},
+                     {'kind': 'table', 'points': [[0, 0]]}):
+            with self.subTest(spec=spec), self.assertRaises(calibration.CalibrationError):
+                calibration.validate(spec)
+
+    def test_convert(self):
+        linear = calibration.validate({'kind': 'linear', 'scale': 0.5, 'offset': 1.0})
+        polynomial = calibration.validate({'kind': 'polynomial', 'coefficients': [1, 2, 3]})
+        table = calibration.validate({'kind': 'table', 'points': [[0, 0], [100, 10]]})
+        self.assertEqual(calibration.convert(linear, 10), 6.0)
+        self.assertEqual(calibration.convert(polynomial, 2), 17.0)
+        self.assertEqual(calibration.convert(table, 50), 5.0)
+        # Clamped outside the table
+        self.assertEqual(calibration.convert(table, 200), 10.0)
+        self.assertIsNone(calibration.convert(linear, None))
+
+    def test_convert_array_matches_convert(self):
+        raws = [0, 1.5, 512.25, 1023]
+        for spec in ({}, {'kind': 'linear', 'scale': 0.3226, 'offset': -5},
+                     {'kind': 'polynomial', 'coefficients': [-40.0, 0.35, -0.00002]},
+                     {'kind': 'table', 'points': [[0, 0], [512, 20], [1023, 100]]}):
+            spec = calibration.validate(spec)
+            with self.subTest(kind=spec['kind']):
+                expected = [calibration.convert(spec, raw) for raw in raws]
+                for value, want in zip(calibration.convert_array(spec, raws).tolist(), expected):
+                    self.assertAlmostEqual(value, want)
+
+
+# =============================================================================
+# Ingest
+# =============================================================================
+
+class MQTTIngestMiddlewareTests(SimpleTestCase):
+    def test_daphne_reactor_startup_schedules_service(self):
+        """Under Daphne the service starts with the reactor, not on the first request."""
+        import twisted.internet
+        from twisted.internet.asyncioreactor import AsyncioSelectorReactor
+
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+        reactor = AsyncioSelectorReactor(eventloop=loop)
+        service = AsyncMQTTService()
+        started = []
+
+        async def run(connect=True):
+            started.append(asyncio.get_running_loop())
+
+        with mock.patch.object(service, 'run', run), \
+                mock.patch('api.mqtt_async.get_mqtt_service', return_value=service), \
+                mock.patch.dict(sys.modules, {'twisted.internet.reactor': reactor}), \
+                mock.patch.object(twisted.internet, 'reactor', reactor, create=True):
+            MQTTIngestMiddleware(app=None)
+            # Reactor startup triggers fire before its asyncio loop runs
+            reactor.fireSystemEvent('startup')
+            loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertEqual(started, [loop])
+
+
+class IngestPoolTests(SimpleTestCase):
+    def test_full_queue_drops_without_blocking(self):
+        """submit() runs on paho's network thread and must return at once."""
+        pool = IngestPool(handler=None, workers=1, max_queue=1)
+        queue = pool.shards[0].queue
+        put = queue.put
+
+        def put_without_blocking(item, block=True, timeout=None):
+            self.assertFalse(block)
+            return put(item, block, timeout)
+
+        with mock.patch.object(queue, 'put', side_effect=put_without_blocking):
+            self.assertTrue(pool.submit('xiot/PI-001/sensors', b'{}'))
+            self.assertFalse(pool.submit('xiot/PI-001/sensors', b'{}'))
+        self.assertEqual(pool.stats()['dropped'], 1)
+
+    def test_one_worker_by_default_on_sqlite(self):
+        self.assertEqual(MQTTService().ingest.stats()['workers'], 1)
+        with override_settings(MQTT_INGEST_WORKERS=3):
+            self.assertEqual(MQTTService().ingest.stats()['workers'], 3)
+
+
+class DatabaseErrorTests(TestCase):
+    def test_lock_errors_are_counted(self):
+        baseboard, sensor = make_sensor()
+        locked = DB_LOCKED_ERRORS.labels('sensors')
+        before = locked.value
+        with mock.patch.object(SensorReading.objects, 'bulk_create',
+                               side_effect=OperationalError('database is locked')):
+            MQTTService()._handle_sensor_data({
+                'baseboard_id': 'PI-001', 'backfill': True,
+                'sensors': [{'i2c_address': '0x08', 'value': 1.0, 'status': 'active'}],
+            })
+        self.assertEqual(locked.value, before + 1)
+
+
+class SensorBatchTests(TestCase):
+    def test_block_channels_are_stored(self):
+        make_sensor()
+        payload = batch_payload(t=[0, 1000], v=[1.0, 2.0], raw=[10.0, 20.25],
+                                ch=[[10, 300], [20, 301]])
+        MQTTService()._handle_sensor_data(
+            wire_format.decode_payload(wire_format.encode_binary(payload))
+        )
+        self.assertEqual(list(SensorReading.objects.order_by('timestamp')
+                              .values_list('raw_value', 'channels')),
+                         [(10.0, [10, 300]), (20.25, [20, 301])])
+
+
+class BusStatsTests(TestCase):
+    def test_report_is_stored_and_old_reports_pruned(self):
+        baseboard, _ = make_sensor()
+        BusStats.objects.create(baseboard=baseboard, timestamp=NOW - timedelta(days=8), interval=60)
+        MQTTService()._handle_i2c_stats({
+            'baseboard_id': 'PI-001', 'timestamp': NOW.isoformat(), 'source': 'service',
+            'interval_s': 60.0, 'transactions': 1200, 'transactions_per_s': 20.0,
+            'utilisation': 0.25, 'queue_depth': 3,
+            'devices': {'0x08': {'transactions': 1200, 'errors': 0}},
+        })
+        stats = BusStats.objects.get()
+        self.assertEqual((stats.source, stats.transactions, stats.utilisation, stats.queue_depth),
+                         ('service', 1200, 0.25, 3))
+        self.assertEqual(stats.devices['0x08']['transactions'], 1200)
+
+
+class BenchIngestTests(TestCase):
+    def test_simulated_payloads_are_stored(self):
+        board = SimulatedBaseboard('PI-001', 2, random.Random(1))
+        BenchIngestCommand()._register([board])
+        service = MQTTService()
+        for payload in (board.sensor_payload(), board.batch_payload(3),
+                        board.batch_payload(3, binary=True)):
+            service._process_message(board.sensor_topic, payload)
+        self.assertEqual(SensorReading.objects.count(), 2 + 2 * 3 + 2 * 3)
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+
+class BatchTransactionTests(TransactionTestCase):
+    def message(self, *values):
+        sensors = [{'i2c_address': f'0x0{8 + i}', 'value': value, 'status': 'active'}
+                   for i, value in enumerate(values)]
+        payload = {'baseboard_id': 'PI-001', 'backfill': True, 'sensors': sensors}
+        return 'xiot/PI-001/sensors', json.dumps(payload).encode(), 0.0, None
+
+    def test_failed_message_rolls_back_alone(self):
+        baseboard, first = make_sensor()
+        Sensor.objects.create(baseboard=baseboard, name='Humidity', sensor_type='humidity',
+                              i2c_address='0x09', unit='%')
+        bulk_create = SensorReading.objects.bulk_create
+
+        def fail_on_four(readings):
+            if readings[0].value == 4.0:
+                raise OperationalError('database is locked')
+            return bulk_create(readings)
+
+        with mock.patch.object(SensorReading.objects, 'bulk_create', side_effect=fail_on_four):
+            AsyncMQTTService()._store_batch([
+                self.message(1.0, 2.0), self.message(3.0, 4.0), self.message(5.0, 6.0),
+            ])
+
+        # 3.0 was written before its message failed and is undone with it
+        self.assertEqual(sorted(SensorReading.objects.values_list('value', flat=True)),
+                         [1.0, 2.0, 5.0, 6.0])
+
+
+@skipUnless(PI_DIR.is_dir(), 'Pi sources not checked out')
+class SharedModuleTests(SimpleTestCase):
+    # The docstring sentence pointing at the other copy
+    COPY_NOTE = re.compile(
+        r'(The backend|The Pi)\s.*?\sthis\s+module\s+in\s.*?keep\s+the\s+two\s+in\s+sync\.', re.DOTALL)
+
+    def split(self, path):
+        """(docstring without the copy note, code after the docstring)"""
+        source = path.read_text()
+        docstring = ast.get_docstring(ast.parse(source), clean=False)
+        end = source.index('"""', source.index('"""') + 3) + 3
+        self.assertRegex(docstring, self.COPY_NOTE)
+        return ' '.join(self.COPY_NOTE.sub('', docstring).split()), source[end:]
+
+    def test_copies_match(self):
+        for name in SHARED_MODULES:
+            with self.subTest(module=name):
+                self.assertEqual(self.split(PI_DIR / name), self.split(Path(__file__).parent / name))
+
+
+class StructuredLogTests(SimpleTestCase):
+    def test_sampler_tracks_a_bounded_number_of_keys(self):
+        sampler = structured_log.Sampler(burst=1, interval=10.0, max_keys=3)
+        with mock.patch('api.structured_log.time.monotonic', return_value=100.0):
+            for key in range(10):
+                self.assertEqual(sampler.allow(key), (True, 0))
+            self.assertEqual(len(sampler._windows), 3)
+            # Newest keys are still rate limited
+            self.assertEqual(sampler.allow(9), (False, 0))
+
+        with mock.patch('api.structured_log.time.monotonic', return_value=200.0):
+            sampler.allow('late')
+        self.assertEqual(list(sampler._windows), ['late'])
+
+    def test_errors_are_never_sampled(self):
+        log = logging.getLogger('api.tests.sampled')
+        with self.assertLogs(log, logging.DEBUG) as logs:
+            for _ in range(structured_log.SAMPLE_BURST * 2):
+                structured_log.sampled(log, logging.WARNING, 'warning', 'warned')
+                structured_log.sampled(log, logging.ERROR, 'error', 'failed')
+        levels = [record.levelno for record in logs.records]
+        self.assertEqual(levels.count(logging.WARNING), structured_log.SAMPLE_BURST)
+        self.assertEqual(levels.count(logging.ERROR), structured_log.SAMPLE_BURST * 2)
+
+    def test_dropped_records_are_exported(self):
+        def exported():
+            for line in REGISTRY.render().splitlines():
+                if line.startswith('xiot_log_records_dropped_total '):
+                    return int(line.split()[1])
+
+        handler = structured_log.AsyncHandler(stream=io.StringIO())
+        self.addCleanup(handler.close)
+        before = exported()
+        log = logging.getLogger('api.tests.dropped')
+        log.addHandler(handler)
+        self.addCleanup(log.removeHandler, handler)
+        with mock.patch.object(handler.queue, 'put_nowait', side_effect=queue.Full):
+            log.error('queue is full')
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(exported(), before + 1)
+
+
+@override_settings(SENSOR_EWMA_ALPHA=1.0, SENSOR_WARNING_BAND=0.1, SENSOR_HYSTERESIS=0.02)
+class SensorEvaluatorTests(SimpleTestCase):
+    def sensor(self, min_threshold=None, max_threshold=None):
+        return SimpleNamespace(id=1, status=LEVEL_ACTIVE, min_threshold=min_threshold,
+                               max_threshold=max_threshold)
+
+    def levels(self, values, **thresholds):
+        sensor = self.sensor(**thresholds)
+        evaluator = SensorEvaluator()
+        return [evaluator.update(sensor, value, t).status for t, value in enumerate(values)]
+
+    def test_hysteresis(self):
+        # Range 0-100: warning within 10 of a threshold, 2 of hysteresis
+        self.assertEqual(
+            self.levels([50, 95, 101, 99, 97, 89, 87], min_threshold=0, max_threshold=100),
+            [LEVEL_ACTIVE, LEVEL_WARNING, LEVEL_CRITICAL, LEVEL_CRITICAL,
+             LEVEL_WARNING, LEVEL_WARNING, LEVEL_ACTIVE],
+        )
+
+    def test_low_threshold_only(self):
+        self.assertEqual(self.levels([50, 9, 10.1], min_threshold=10),
+                         [LEVEL_ACTIVE, LEVEL_CRITICAL, LEVEL_CRITICAL])
+
+    def test_without_thresholds(self):
+        self.assertEqual(self.levels([1e9]), [LEVEL_ACTIVE])
+
+    def test_rate_of_change(self):
+        evaluator = SensorEvaluator()
+        for t in range(10):
+            evaluation = evaluator.update(self.sensor(), 2.0 * t, 1000.0 + t)
+        self.assertEqual(evaluation.rate_of_change, '+2/s')
+
+
+class LatencyTracingTests(SimpleTestCase):
+    def test_pi_and_backend_stages(self):
+        tracer = LatencyTracer()
+        trace = tracer.start({'trace': {'read': 1000.0, 'publish': 1005.0}}, received_at=1.015)
+        tracer.stored(trace)
+        stages = tracer.snapshot()['stages']
+        self.assertEqual((stages['pi']['sum_ms'], stages['broker']['sum_ms']), (5.0, 10.0))
+        self.assertEqual((stages['queue']['count'], stages['db']['count']), (1, 1))
+
+    def test_binary_batches_are_traced_from_the_newest_sample(self):
+        tracer = LatencyTracer()
+        payload = {'base_time': 1000, 'sensors': [{'t': [0, 250]}, {'t': [0, 500]}]}
+        self.assertEqual(tracer.start(payload)['read'], 1500)
+        self.assertIsNone(tracer.start({**payload, 'backfill': True}))
+
+    def test_quantile_stays_within_observed_values(self):
+        histogram = LatencyHistogram()
+        for _ in range(10):
+            histogram.observe(3.0)
+        self.assertEqual(histogram.quantile(0.5), 3.0)
+        self.assertEqual(histogram.snapshot()['buckets']['le_5'], 10)
+
+    def test_consumer_stamps_a_copy_of_the_trace(self):
+        consumer = SensorDataConsumer()
+        sent = []
+
+        async def send(text_data):
+            sent.append(json.loads(text_data))
+
+        consumer.send = send
+        event = {'data': {'sensors': [], 'trace': {'sent': now_ms()}}}
+        asyncio.run(consumer.sensor_update(event))
+        self.assertIn('delivered', sent[0]['data']['trace'])
+        self.assertNotIn('delivered', event['data']['trace'])
+
+
+class ReadingsCacheTests(TestCase):
+    def setUp(self):
+        self.baseboard, self.sensor = make_sensor()
+        for seconds, value in ((-25, 1.0), (-21, 3.0), (-15, 5.0), (-3, 7.0), (2, 9.0)):
+            SensorReading.objects.create(sensor=self.sensor, value=value,
+                                         timestamp=NOW + timedelta(seconds=seconds))
+        self.cache = ReadingsCache()
+
+    def test_buckets_are_aligned_to_the_epoch(self):
+        buckets = self.cache.get_buckets(self.sensor, '1h', 10, NOW + timedelta(seconds=5))
+        self.assertEqual(
+            [(b['timestamp'], b['count'], b['value'], b['min'], b['max']) for b in buckets],
+            [(NOW - timedelta(seconds=30), 2, 2.0, 1.0, 3.0),
+             (NOW - timedelta(seconds=20), 1, 5.0, 5.0, 5.0),
+             (NOW - timedelta(seconds=10), 1, 7.0, 7.0, 7.0),
+             (NOW, 1, 9.0, 9.0, 9.0)],
+        )
+
+    def test_closed_buckets_are_cached_until_invalidated(self):
+        self.cache.get_buckets(self.sensor, '1h', 10, NOW)
+        self.sensor.readings.update(value=0.0)
+
+        cached = self.cache.get_buckets(self.sensor, '1h', 10, NOW)
+        self.assertEqual([b['value'] for b in cached], [2.0, 5.0, 7.0, 0.0])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+        self.cache.invalidate(self.sensor.id)
+        fresh = self.cache.get_buckets(self.sensor, '1h', 10, NOW)
+        self.assertEqual([b['value'] for b in fresh], [0.0, 0.0, 0.0, 0.0])
+
+
+class MetricsTests(SimpleTestCase):
+    def test_text_rendering(self):
+        registry = Registry()
+        messages = Counter('test_messages_total', 'Messages, by topic', ['topic'], registry=registry)
+        messages.labels('sensors').inc(2)
+        messages.labels('say "hi"\n').inc()
+        Gauge('test_connections', 'Open connections', registry=registry)
+        flush = Histogram('test_flush_seconds', 'Flush time', buckets=(0.1, 1), registry=registry)
+        flush.observe(0.05)
+        flush.observe(0.5)
+        registry.register_collector(lambda: ['test_collected 7'])
+
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP test_messages_total Messages, by topic',
+            '# TYPE test_messages_total counter',
+            'test_messages_total{topic="say \\"hi\\"\\n"} 1',
+            'test_messages_total{topic="sensors"} 2',
+            '# HELP test_connections Open connections',
+            '# TYPE test_connections gauge',
+            'test_connections 0',
+            '# HELP test_flush_seconds Flush time',
+            '# TYPE test_flush_seconds histogram',
+            'test_flush_seconds_bucket{le="0.1"} 1',
+            'test_flush_seconds_bucket{le="1"} 2',
+            'test_flush_seconds_bucket{le="+Inf"} 2',
+            'test_flush_seconds_sum 0.55',
+            'test_flush_seconds_count 2',
+            'test_collected 7',
+        ]) + '\n')
+
+    def test_label_count_is_checked(self):
+        counter = Counter('test_total', 'Test', ['topic'], registry=None)
+        with self.assertRaises(ValueError):
+            counter.labels('a', 'b')
+
+    def test_failing_collector_is_reported(self):
+        registry = Registry()
+
+        def broken():
+            raise RuntimeError('boom')
+
+        registry.register_collector(broken)
+        self.assertEqual(registry.render(), '# collector broken failed: boom\n')
+
+
+class LateSampleCacheTests(TestCase):
+    def test_late_batch_reopens_closed_bucket(self):
+        """Samples stored into a bucket a query already closed show up on the next query."""
+        baseboard, sensor = make_sensor()
+        SensorReading.objects.create(sensor=sensor, value=1.0, timestamp=NOW - timedelta(seconds=25))
+        cache = ReadingsCache()
+        before = cache.get_buckets(sensor, '1h', 10, NOW)
+        self.assertEqual([b['count'] for b in before], [1])
+
+        base_time = (NOW - timedelta(seconds=24)).timestamp() * 1000
+        with mock.patch('api.mqtt_service.get_readings_cache', return_value=cache), \
+                self.captureOnCommitCallbacks(execute=True):
+            MQTTService()._update_sensor_batch(
+                baseboard, {'i2c_address': '0x08', 't': [0, 1000], 'v': [2.0, 3.0]},
+                base_time, NOW,
+            )
+
+        after = cache.get_buckets(sensor, '1h', 10, NOW)
+        self.assertEqual([b['count'] for b in after], [3])
+        self.assertEqual(after[0]['value'], 2.0)
+
+    def test_reopen_during_aggregation_is_not_blocked_or_lost(self):
+        """Ingest's reopen() runs while a query aggregates, and wins over it."""
+        baseboard, sensor = make_sensor()
+        SensorReading.objects.create(sensor=sensor, value=1.0, timestamp=NOW - timedelta(seconds=25))
+        cache = ReadingsCache()
+        aggregate = cache._aggregate
+        reopened = []
+
+        def aggregate_during_ingest(sensor, start, end, bucket_seconds):
+            buckets = aggregate(sensor, start, end, bucket_seconds)
+            if end is not None and not reopened:
+                SensorReading.objects.create(sensor=sensor, value=2.0,
+                                             timestamp=NOW - timedelta(seconds=24))
+                ingest = threading.Thread(target=cache.reopen,
+                                          args=(sensor.id, NOW - timedelta(seconds=24)))
+                ingest.start()
+                ingest.join(timeout=5)
+                reopened.append(not ingest.is_alive())
+            return buckets
+
+        with mock.patch.object(cache, '_aggregate', side_effect=aggregate_during_ingest):
+            cache.get_buckets(sensor, '1h', 10, NOW)
+        self.assertEqual(reopened, [True])
+
+        after = cache.get_buckets(sensor, '1h', 10, NOW)
+        self.assertEqual([b['count'] for b in after], [2])
+
+
+class RecalibrateTests(TestCase):
+    def setUp(self):
+        self.baseboard, self.sensor = make_sensor()
+        for raw in (100, 200, 300):
+            SensorReading.objects.create(
+                sensor=self.sensor, value=0.0, raw_value=raw, timestamp=NOW,
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('operator'))
+        self.url = f'/api/sensors/{self.sensor.id}/recalibrate/'
+
+    def values(self):
+        return sorted(self.sensor.readings.values_list('value', flat=True))
+
+    def test_new_spec_converts_history(self):
+        spec = {'kind': 'linear', 'scale': 0.5, 'offset': 1.0}
+        response = self.client.post(self.url, {'calibration': spec}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['readings_updated'], 3)
+        self.assertEqual(self.values(), [51.0, 101.0, 151.0])
+
+    def test_baseboard_managed_calibration_is_not_replaced(self):
+        pi_spec = {'kind': 'linear', 'scale': 0.1, 'offset': 0.0}
+        MQTTService()._handle_calibration({'baseboard_id': 'PI-001', 'sensors': {'0x08': pi_spec}})
+
+        response = self.client.post(
+            self.url, {'calibration': {'kind': 'linear', 'scale': 2.0}}, format='json'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.calibration['scale'], 0.1)
+
+        # Re-converting with the baseboard's own calibration is still allowed
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.values(), [10.0, 20.0, 30.0])
+
+        response = self.client.patch(
+            f'/api/sensors/{self.sensor.id}/', {'calibration': {'kind': 'linear', 'scale': 2.0}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_missing_calibration_is_refused(self):
+        """An uncalibrated sensor is not silently reset to raw counts."""
+        self.sensor.readings.update(value=5.0)
+        for body in ({}, {'calibration': {}}):
+            with self.subTest(body=body):
+                response = self.client.post(self.url, body, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.calibration, {})
+        self.assertEqual(self.values(), [5.0, 5.0, 5.0])
+
+    @override_settings(RECALIBRATE_CHUNK_SIZE=1)
+    def test_failed_recalibration_leaves_spec_and_history(self):
+        original = SensorReading.objects.bulk_update
+        calls = []
+
+        def bulk_update(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('database went away')
+            return original(*args, **kwargs)
+
+        with mock.patch.object(SensorReading.objects, 'bulk_update', side_effect=bulk_update):
+            with self.assertRaises(RuntimeError):
+                self.client.post(self.url, {'calibration': {'kind': 'linear', 'scale': 2.0}},
+                                 format='json')
+
+        self.sensor.refresh_from_db()
+        self.assertEqual(self.sensor.calibration, {})
+        self.assertEqual(self.values(), [0.0, 0.0, 0.0])
+
+
+class BulkDeviceRegistrationTests(TestCase):
+    url = '/api/devices/register/bulk/'
+
+    def register(self, devices, removed=()):
+        return APIClient().post(self.url, {
+            'baseboard_id': 'PI-001', 'devices': devices, 'removed': list(removed),
+        }, format='json')
+
+    def test_devices_are_created_then_updated(self):
+        devices = [
+            {'i2c_address': '0x08', 'device_class': 'sensor', 'device_type': 'temperature'},
+            {'i2c_address': '0x0A', 'device_class': 'actuator', 'device_type': 'led'},
+            {'i2c_address': '0x0B', 'device_class': 'display', 'device_type': 'oled'},
+        ]
+        response = self.register(devices)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['registered'], ['0x08', '0x0A'])
+        self.assertEqual([f['address'] for f in response.data['failed']], ['0x0B'])
+        discovered = Event.objects.filter(event_type__in=['sensor_discovered', 'actuator_discovered'])
+        self.assertEqual(discovered.count(), 2)
+
+        Sensor.objects.filter(i2c_address='0x08').update(status='offline')
+        devices[0]['device_type'] = 'humidity'
+        response = self.register(devices[:2])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], ['0x08', '0x0A'])
+        sensor = Sensor.objects.get(i2c_address='0x08')
+        self.assertEqual((sensor.sensor_type, sensor.status), ('humidity', 'active'))
+        self.assertEqual(Sensor.objects.count(), 1)
+
+    def test_removed_devices_are_marked_once(self):
+        self.register([
+            {'i2c_address': '0x08', 'device_class': 'sensor', 'device_type': 'temperature'},
+            {'i2c_address': '0x0A', 'device_class': 'actuator', 'device_type': 'relay'},
+        ])
+        response = self.register([], removed=['0x08', '0x0A', '0x30'])
+        self.assertEqual(sorted(response.data['removed']), ['0x08', '0x0A'])
+        self.assertEqual(Sensor.objects.get().status, 'offline')
+        self.assertEqual(Actuator.objects.get().status, 'disconnected')
+
+        # Already marked: no second removal event
+        response = self.register([], removed=['0x08'])
+        self.assertEqual(response.data['removed'], [])
+        self.assertEqual(Event.objects.filter(event_type='device_removed').count(), 2)
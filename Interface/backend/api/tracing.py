@@ -0,0 +1,174 @@
+"""
+End-to-end latency tracing for live sensor readings.
+
+A reading passes through these stages, each timed into a histogram:
+
+    pi         I2C read -> MQTT publish on the Pi
+    broker     Pi publish -> message received by the backend
+    queue      received -> ingest processing starts
+    db         processing starts -> readings stored
+    broadcast  channel layer group_send call
+    delivery   handed to group_send -> SensorDataConsumer sends it
+    display    consumer send -> rendered in the browser (client report)
+    total      I2C read -> rendered in the browser (client report)
+
+Traces are dicts of epoch-millisecond timestamps. The Pi adds
+``trace: {read, publish}`` to its sensors payloads; the backend adds
+``received``, ``processed``, ``stored`` and ``sent`` and forwards the trace
+with the WebSocket update, where the consumer adds ``delivered``. Stages
+between two hosts include their clock offset, so negative values are
+counted as zero. Backfilled (replayed) payloads are not traced.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+
+
+STAGES = ('pi', 'broker', 'queue', 'db', 'broadcast', 'delivery', 'display', 'total')
+
+# Histogram bucket upper bounds in milliseconds (plus an overflow bucket)
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def now_ms():
+    """Current wall-clock time in epoch milliseconds."""
+    return time.time() * 1000.0
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with count, sum and max."""
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating within its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = BUCKETS_MS[index - 1] if index else 0.0
+                high = BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max
+                return min(low + (high - low) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 2) if self.count else None,
+            'sum_ms': round(self.total, 3),
+            'p50_ms': _round(self.quantile(0.50)),
+            'p95_ms': _round(self.quantile(0.95)),
+            'p99_ms': _round(self.quantile(0.99)),
+            'max_ms': round(self.max, 2),
+            'buckets': {
+                **{f'le_{bound}': count for bound, count in zip(BUCKETS_MS, self.counts)},
+                'inf': self.counts[-1],
+            },
+        }
+
+
+def _round(value):
+    return None if value is None else round(value, 2)
+
+
+class LatencyTracer:
+    """Per-stage latency histograms, shared by ingest threads and consumers."""
+
+    def __init__(self):
+        self.enabled = getattr(settings, 'LATENCY_TRACING', True)
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stages = {stage: LatencyHistogram() for stage in STAGES}
+
+    def observe(self, stage, ms):
+        """Record a stage latency in milliseconds."""
+        with self._lock:
+            self._stages[stage].observe(max(0.0, ms))
+
+    def between(self, stage, trace, start, end):
+        """Record trace[end] - trace[start] if both timestamps are present."""
+        if trace.get(start) is not None and trace.get(end) is not None:
+            self.observe(stage, trace[end] - trace[start])
+
+    def start(self, payload, received_at=None):
+        """
+        Begin the backend part of a sensors payload's trace.
+
+        Args:
+            payload: Decoded sensors payload
+            received_at: Epoch seconds the message arrived (default: now)
+
+        Returns:
+            The trace dict to stamp further, or None if not traced
+        """
+        if not self.enabled or payload.get("backfill"):
+            return None
+        trace = dict(payload.get("trace") or {})
+        if trace.get("read") is None and payload.get("base_time") is not None:
+            # Binary payloads carry no trace; the newest sample was read at
+            # base_time plus its offset
+            offsets = [max(s.get("t") or [0]) for s in payload.get("sensors", [])]
+            trace["read"] = payload["base_time"] + max(offsets or [0])
+        trace["received"] = received_at * 1000.0 if received_at else now_ms()
+        trace["processed"] = now_ms()
+        self.between('pi', trace, 'read', 'publish')
+        self.between('broker', trace, 'publish', 'received')
+        self.between('queue', trace, 'received', 'processed')
+        return trace
+
+    def stored(self, trace):
+        """Stamp a trace once its readings are in the database."""
+        trace["stored"] = now_ms()
+        self.between('db', trace, 'processed', 'stored')
+
+    def report(self, display_ms=(), total_ms=()):
+        """Record latencies reported by a WebSocket client."""
+        with self._lock:
+            for ms in display_ms:
+                self._stages['display'].observe(max(0.0, ms))
+            for ms in total_ms:
+                self._stages['total'].observe(max(0.0, ms))
+
+    def snapshot(self):
+        """Per-stage histograms and percentiles."""
+        with self._lock:
+            stages = {stage: histogram.snapshot() for stage, histogram in self._stages.items()}
+        return {
+            'enabled': self.enabled,
+            'since': self.started,
+            'buckets_ms': list(BUCKETS_MS),
+            'stages': stages,
+        }
+
+
+# Singleton instance
+_tracer = None
+
+
+def get_tracer():
+    """Get or create the latency tracer instance."""
+    global _tracer
+    if _tracer is None:
+        _tracer = LatencyTracer()
+    return _tracer
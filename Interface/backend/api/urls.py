@@ -10,8 +10,10 @@ router.register(r'actuators', views.ActuatorViewSet)
 urlpatterns = [
     path('', include(router.urls)),
     path('status/', views.SystemStatusView.as_view(), name='system_status'),
+    path('metrics/latency/', views.LatencyMetricsView.as_view(), name='latency_metrics'),
     path('lcd/command/', views.LCDCommandView.as_view(), name='lcd_command'),
     path('devices/register/', views.DeviceRegistrationView.as_view(), name='device_register'),
+    path('devices/register/bulk/', views.BulkDeviceRegistrationView.as_view(), name='device_register_bulk'),
     path('devices/discover/', views.TriggerDiscoveryView.as_view(), name='trigger_discovery'),
 ]
 
@@ -1,18 +1,33 @@
 import json
+import time
 from datetime import timedelta
 import paho.mqtt.publish as mqtt_publish
 from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse
 from django.utils import timezone
 from rest_framework import viewsets, generics, status
 from rest_framework.decorators import action
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from .models import Baseboard, Sensor, Actuator, Event
+from .calibration import CalibrationError, convert_array, validate
+from .metrics import ACTUATOR_COMMAND_SECONDS, ACTUATOR_COMMANDS, CONTENT_TYPE, REGISTRY
+from .models import Baseboard, BusStats, Sensor, SensorReading, Actuator, Event
+from .mqtt_service import get_ingest_stats
+from .readings_cache import (
+    DEFAULT_RANGE, RANGE_SECONDS, default_bucket_seconds, get_readings_cache
+)
 from .serializers import (
-    BaseboardSerializer, BaseboardListSerializer,
-    SensorSerializer, SensorReadingSerializer, ActuatorSerializer, EventSerializer
+    CALIBRATION_MANAGED_ERROR, BaseboardSerializer, BaseboardListSerializer,
+    SensorSerializer, SensorReadingBucketSerializer, SensorRollupSerializer,
+    ActuatorSerializer, BusStatsSerializer, EventSerializer
 )
+from .tracing import get_tracer
+
+# Bus activity reports returned by /baseboards/<id>/i2c_stats/
+I2C_STATS_DEFAULT_LIMIT = 60
+I2C_STATS_MAX_LIMIT = 1440
 
 
 class BaseboardViewSet(viewsets.ModelViewSet):
@@ -25,6 +40,23 @@ class BaseboardViewSet(viewsets.ModelViewSet):
             return BaseboardListSerializer
         return BaseboardSerializer
 
+    @action(detail=True, methods=['get'])
+    def i2c_stats(self, request, pk=None):
+        """Get the latest and recent I2C bus activity reports of a baseboard."""
+        baseboard = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', I2C_STATS_DEFAULT_LIMIT))
+        except ValueError:
+            limit = I2C_STATS_DEFAULT_LIMIT
+        limit = max(1, min(limit, I2C_STATS_MAX_LIMIT))
+
+        reports = list(baseboard.bus_stats.all()[:limit])
+        return Response({
+            'baseboard': baseboard.identifier,
+            'latest': BusStatsSerializer(reports[0]).data if reports else None,
+            'history': BusStatsSerializer(reports, many=True).data,
+        })
+
 
 class SensorViewSet(viewsets.ModelViewSet):
     """ViewSet for managing sensors."""
@@ -41,43 +73,33 @@ class SensorViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['get'])
     def readings(self, request, pk=None):
-        """Get historical readings for a sensor."""
+        """Get downsampled historical readings for a sensor."""
         sensor = self.get_object()
         
         # Time range filter
-        time_range = request.query_params.get('range', '24h')
-        now = timezone.now()
+        time_range = request.query_params.get('range', DEFAULT_RANGE)
+        range_key = time_range if time_range in RANGE_SECONDS else DEFAULT_RANGE
         
-        if time_range == '1h':
-            start_time = now - timedelta(hours=1)
-        elif time_range == '6h':
-            start_time = now - timedelta(hours=6)
-        elif time_range == '24h':
-            start_time = now - timedelta(hours=24)
-        elif time_range == '7d':
-            start_time = now - timedelta(days=7)
-        elif time_range == '30d':
-            start_time = now - timedelta(days=30)
-        else:
-            start_time = now - timedelta(hours=24)
-        
-        readings = sensor.readings.filter(timestamp__gte=start_time).order_by('timestamp')
+        # Bucket size in seconds, never finer than MAX_POINTS buckets per range
+        bucket_seconds = default_bucket_seconds(RANGE_SECONDS[range_key])
+        try:
+            bucket_seconds = max(bucket_seconds, int(request.query_params.get('bucket', 0)))
+        except ValueError:
+            pass
         
-        # Limit to 500 data points for performance
-        total = readings.count()
-        if total > 500:
-            step = total // 500
-            readings = readings[::step][:500]
+        buckets = get_readings_cache().get_buckets(
+            sensor, range_key, bucket_seconds, timezone.now()
+        )
         
-        serializer = SensorReadingSerializer(readings, many=True)
+        serializer = SensorReadingBucketSerializer(buckets, many=True)
         
         # Calculate statistics
-        values = [r.value for r in readings]
+        count = sum(b['count'] for b in buckets)
         stats = {
-            'count': len(values),
-            'min': min(values) if values else None,
-            'max': max(values) if values else None,
-            'avg': sum(values) / len(values) if values else None,
+            'count': count,
+            'min': min(b['min'] for b in buckets) if buckets else None,
+            'max': max(b['max'] for b in buckets) if buckets else None,
+            'avg': sum(b['value'] * b['count'] for b in buckets) / count if count else None,
             'current': sensor.current_value,
         }
         
@@ -92,6 +114,79 @@ class SensorViewSet(viewsets.ModelViewSet):
             'readings': serializer.data,
             'statistics': stats,
             'time_range': time_range,
+            'bucket_seconds': bucket_seconds,
+        })
+
+    @action(detail=True, methods=['get'])
+    def rollups(self, request, pk=None):
+        """Get edge-aggregated window summaries for a sensor."""
+        sensor = self.get_object()
+        
+        time_range = request.query_params.get('range', DEFAULT_RANGE)
+        range_seconds = RANGE_SECONDS.get(time_range, RANGE_SECONDS[DEFAULT_RANGE])
+        start_time = timezone.now() - timedelta(seconds=range_seconds)
+        
+        rollups = sensor.rollups.filter(window_end__gte=start_time).order_by('window_end')
+        
+        return Response({
+            'sensor': sensor.id,
+            'rollups': SensorRollupSerializer(rollups, many=True).data,
+            'time_range': time_range,
+        })
+
+    @action(detail=True, methods=['post'])
+    def recalibrate(self, request, pk=None):
+        """
+        Re-convert stored raw readings with the sensor's calibration.
+        
+        An optional ``calibration`` in the body replaces the stored one first,
+        unless the baseboard manages it (it publishes the calibration it
+        converts live readings with); change those on the Pi. Without one,
+        the stored calibration is re-applied; a sensor with neither is
+        refused rather than reset to raw counts. Readings without a raw value
+        are left unchanged. The new spec and the converted history are
+        committed together.
+        """
+        sensor = self.get_object()
+        
+        spec = request.data.get('calibration') or sensor.calibration
+        if not spec:
+            return Response({'error': 'No calibration given and the sensor has none'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            spec = validate(spec)
+        except CalibrationError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if spec != sensor.calibration and sensor.calibration_from_baseboard:
+            return Response({'error': CALIBRATION_MANAGED_ERROR}, status=status.HTTP_409_CONFLICT)
+        
+        chunk_size = getattr(settings, 'RECALIBRATE_CHUNK_SIZE', 5000)
+        readings = sensor.readings.filter(raw_value__isnull=False).order_by('id')
+        updated = 0
+        last_id = 0
+        with transaction.atomic():
+            if spec != sensor.calibration:
+                sensor.calibration = spec
+                sensor.save(update_fields=['calibration'])
+            
+            while True:
+                chunk = list(readings.filter(id__gt=last_id).only('id', 'raw_value')[:chunk_size])
+                if not chunk:
+                    break
+                values = convert_array(spec, [r.raw_value for r in chunk])
+                for reading, value in zip(chunk, values.tolist()):
+                    reading.value = value
+                SensorReading.objects.bulk_update(chunk, ['value'])
+                updated += len(chunk)
+                last_id = chunk[-1].id
+        
+        get_readings_cache().invalidate(sensor.id)
+        
+        return Response({
+            'sensor': sensor.id,
+            'calibration': spec,
+            'readings_updated': updated,
         })
 
 
@@ -146,12 +241,14 @@ class ActuatorViewSet(viewsets.ModelViewSet):
             # Publish to baseboard-specific topic
             topic = f"xiot/{actuator.baseboard.identifier}/actuators"
             
+            start = time.perf_counter()
             mqtt_publish.single(
                 topic=topic,
                 payload=json.dumps(payload),
                 hostname=mqtt_broker,
                 port=mqtt_port
             )
+            ACTUATOR_COMMAND_SECONDS.labels(command).observe(time.perf_counter() - start)
             
             # Update actuator state
             if command in ['on', 'off']:
@@ -174,6 +271,7 @@ class ActuatorViewSet(viewsets.ModelViewSet):
                 severity='info'
             )
             
+            ACTUATOR_COMMANDS.labels(command, 'sent').inc()
             return Response({
                 'status': 'sent',
                 'actuator': ActuatorSerializer(actuator).data,
@@ -182,12 +280,60 @@ class ActuatorViewSet(viewsets.ModelViewSet):
             })
             
         except Exception as e:
+            ACTUATOR_COMMANDS.labels(command, 'failed').inc()
             return Response(
                 {'error': str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
 
+def i2c_bus_status():
+    """
+    Summarise the latest I2C bus report of every baseboard.
+
+    Reports older than I2C_STATS_STALE_AFTER seconds are ignored; without
+    any recent report the status is 'unknown'.
+    """
+    stale_after = getattr(settings, 'I2C_STATS_STALE_AFTER', 180)
+    recent = (
+        BusStats.objects
+        .filter(timestamp__gte=timezone.now() - timedelta(seconds=stale_after))
+        .select_related('baseboard')
+        .order_by('baseboard_id', '-timestamp')
+    )
+    latest = {}
+    for report in recent:
+        latest.setdefault(report.baseboard_id, report)
+
+    if not latest:
+        return {'speed': None, 'status': 'unknown', 'load': None, 'baseboards': {}}
+
+    reports = list(latest.values())
+    clocks = [r.clock_hz for r in reports if r.clock_hz]
+    errors = sum(r.errors for r in reports)
+    return {
+        'speed': f"{max(clocks) / 1000:g}kHz" if clocks else None,
+        'status': 'degraded' if errors else 'stable',
+        # Busiest bus, in percent
+        'load': round(max(r.utilisation for r in reports) * 100, 1),
+        'transactions_per_s': round(sum(r.transactions_per_s for r in reports), 2),
+        'bytes_per_s': round(sum(r.bytes_per_s for r in reports), 2),
+        'errors': errors,
+        'retries': sum(r.retries for r in reports),
+        'baseboards': {
+            r.baseboard.identifier: {
+                'timestamp': r.timestamp,
+                'source': r.source,
+                'load': round(r.utilisation * 100, 1),
+                'transactions_per_s': r.transactions_per_s,
+                'errors': r.errors,
+                'retries': r.retries,
+            }
+            for r in reports
+        },
+    }
+
+
 class SystemStatusView(APIView):
     """Get overall system status."""
     permission_classes = [IsAuthenticated]
@@ -205,11 +351,7 @@ class SystemStatusView(APIView):
         return Response({
             'mqtt_status': 'connected',
             'mqtt_latency': 12,
-            'i2c_bus': {
-                'speed': '400kHz',
-                'status': 'stable',
-                'load': 35,
-            },
+            'i2c_bus': i2c_bus_status(),
             'baseboards': {
                 'total': baseboards.count(),
                 'online': online_boards,
@@ -226,9 +368,24 @@ class SystemStatusView(APIView):
             },
             'gateway': 'online',
             'database': 'connected',
+            'readings_cache': get_readings_cache().stats(),
+            'mqtt_ingest': get_ingest_stats(),
         })
 
 
+def metrics_view(request):
+    """Prometheus text exposition of the backend metrics (api/metrics.py)."""
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+class LatencyMetricsView(APIView):
+    """Per-stage latency histograms of live readings, I2C read to browser."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return Response(get_tracer().snapshot())
+
+
 class LCDCommandView(APIView):
     """Send commands to LCD display via MQTT."""
     permission_classes = [AllowAny]  # Allow unauthenticated for now
@@ -335,7 +492,21 @@ class DeviceRegistrationView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Find or create baseboard
+        baseboard = self._get_baseboard(baseboard_id)
+
+        # Create or update device based on class
+        if device_class == 'sensor':
+            return self._register_sensor(baseboard, i2c_address, device_type, capabilities)
+        elif device_class == 'actuator':
+            return self._register_actuator(baseboard, i2c_address, device_type, capabilities)
+        else:
+            return Response(
+                {'error': f"Unknown device class: {device_class}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    def _get_baseboard(self, baseboard_id):
+        """Find or create the reporting baseboard."""
         baseboard, board_created = Baseboard.objects.get_or_create(
             identifier=baseboard_id,
             defaults={
@@ -353,25 +524,12 @@ class DeviceRegistrationView(APIView):
                 message=f"New baseboard discovered: {baseboard_id}",
                 severity='info'
             )
+        return baseboard
 
-        # Create or update device based on class
-        if device_class == 'sensor':
-            return self._register_sensor(baseboard, i2c_address, device_type, capabilities)
-        elif device_class == 'actuator':
-            return self._register_actuator(baseboard, i2c_address, device_type, capabilities)
-        else:
-            return Response(
-                {'error': f"Unknown device class: {device_class}"},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-    def _register_sensor(self, baseboard, i2c_address, device_type, capabilities):
-        """Register or update a sensor."""
+    def _sensor_fields(self, i2c_address, device_type):
+        """Model fields for a discovered sensor."""
         sensor_type = self.SENSOR_TYPE_MAP.get(device_type, 'custom')
         
-        # Generate a name from type and address
-        name = f"{device_type.replace('_', ' ').title()} ({i2c_address})"
-        
         # Determine unit based on sensor type
         unit_map = {
             'temperature': '°C',
@@ -381,24 +539,53 @@ class DeviceRegistrationView(APIView):
             'gas': 'ppm',
             'vibration': 'g',
         }
-        unit = unit_map.get(sensor_type, '')
+        
+        return {
+            # Generate a name from type and address
+            'name': f"{device_type.replace('_', ' ').title()} ({i2c_address})",
+            'sensor_type': sensor_type,
+            'unit': unit_map.get(sensor_type, ''),
+            'status': 'active',
+        }
 
+    def _actuator_fields(self, i2c_address, device_type):
+        """Model fields for a discovered actuator."""
+        actuator_type = self.ACTUATOR_TYPE_MAP.get(device_type, 'custom')
+        
+        # Determine min/max values based on actuator type
+        if actuator_type in ['pwm', 'servo']:
+            min_val, max_val = 0, 255
+            unit = ''
+        elif actuator_type == 'motor':
+            min_val, max_val = -100, 100
+            unit = '%'
+        else:
+            min_val, max_val = 0, 1
+            unit = ''
+        
+        return {
+            # Generate a name from type and address
+            'name': f"{device_type.replace('_', ' ').title()} ({i2c_address})",
+            'actuator_type': actuator_type,
+            'status': 'off',
+            'min_value': min_val,
+            'max_value': max_val,
+            'unit': unit,
+        }
+
+    def _register_sensor(self, baseboard, i2c_address, device_type, capabilities):
+        """Register or update a sensor."""
         sensor, created = Sensor.objects.update_or_create(
             baseboard=baseboard,
             i2c_address=i2c_address,
-            defaults={
-                'name': name,
-                'sensor_type': sensor_type,
-                'unit': unit,
-                'status': 'active',
-            }
+            defaults=self._sensor_fields(i2c_address, device_type)
         )
 
         if created:
             Event.objects.create(
                 source='discovery',
                 event_type='sensor_discovered',
-                message=f"New sensor discovered: {name} at {i2c_address}",
+                message=f"New sensor discovered: {sensor.name} at {i2c_address}",
                 severity='info'
             )
 
@@ -414,40 +601,17 @@ class DeviceRegistrationView(APIView):
 
     def _register_actuator(self, baseboard, i2c_address, device_type, capabilities):
         """Register or update an actuator."""
-        actuator_type = self.ACTUATOR_TYPE_MAP.get(device_type, 'custom')
-        
-        # Generate a name from type and address
-        name = f"{device_type.replace('_', ' ').title()} ({i2c_address})"
-        
-        # Determine min/max values based on actuator type
-        if actuator_type in ['pwm', 'servo']:
-            min_val, max_val = 0, 255
-            unit = ''
-        elif actuator_type == 'motor':
-            min_val, max_val = -100, 100
-            unit = '%'
-        else:
-            min_val, max_val = 0, 1
-            unit = ''
-
         actuator, created = Actuator.objects.update_or_create(
             baseboard=baseboard,
             i2c_address=i2c_address,
-            defaults={
-                'name': name,
-                'actuator_type': actuator_type,
-                'status': 'off',
-                'min_value': min_val,
-                'max_value': max_val,
-                'unit': unit,
-            }
+            defaults=self._actuator_fields(i2c_address, device_type)
         )
 
         if created:
             Event.objects.create(
                 source='discovery',
                 event_type='actuator_discovered',
-                message=f"New actuator discovered: {name} at {i2c_address}",
+                message=f"New actuator discovered: {actuator.name} at {i2c_address}",
                 severity='info'
             )
 
@@ -462,6 +626,160 @@ class DeviceRegistrationView(APIView):
         }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
 
 
+class BulkDeviceRegistrationView(DeviceRegistrationView):
+    """
+    Registers a baseboard's whole device inventory in one request.
+    
+    Devices are upserted per model with one query for existing rows plus
+    bulk_create / bulk_update, all inside a single transaction. Addresses
+    listed in ``removed`` (devices that stopped responding) are marked
+    offline (sensors) or disconnected (actuators).
+    """
+
+    def post(self, request):
+        """Register a list of discovered devices."""
+        baseboard_id = request.data.get('baseboard_id')
+        devices = request.data.get('devices', [])
+        removed = request.data.get('removed', [])
+
+        if not baseboard_id or not isinstance(devices, list) or not isinstance(removed, list):
+            return Response(
+                {'error': 'Missing required fields: baseboard_id, devices (list)'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # Validate entries up front; invalid ones are reported, not applied
+        sensors = {}
+        actuators = {}
+        failed = []
+        for device in devices:
+            i2c_address = device.get('i2c_address') if isinstance(device, dict) else None
+            device_class = device.get('device_class') if i2c_address else None
+            device_type = device.get('device_type') if i2c_address else None
+            if not all([i2c_address, device_class, device_type]):
+                failed.append({
+                    'address': i2c_address,
+                    'error': 'Missing required fields: i2c_address, device_class, device_type',
+                })
+            elif device_class == 'sensor':
+                sensors[i2c_address] = self._sensor_fields(i2c_address, device_type)
+            elif device_class == 'actuator':
+                actuators[i2c_address] = self._actuator_fields(i2c_address, device_type)
+            else:
+                failed.append({'address': i2c_address, 'error': f"Unknown device class: {device_class}"})
+
+        with transaction.atomic():
+            baseboard = self._get_baseboard(baseboard_id)
+            registered_sensors, updated_sensors = self._upsert(Sensor, baseboard, sensors)
+            registered_actuators, updated_actuators = self._upsert(Actuator, baseboard, actuators)
+            removed_devices = self._mark_removed(baseboard, removed)
+
+            Event.objects.bulk_create(
+                [
+                    Event(
+                        source='discovery',
+                        event_type='sensor_discovered',
+                        message=f"New sensor discovered: {sensor.name} at {sensor.i2c_address}",
+                        severity='info'
+                    )
+                    for sensor in registered_sensors
+                ] + [
+                    Event(
+                        source='discovery',
+                        event_type='actuator_discovered',
+                        message=f"New actuator discovered: {actuator.name} at {actuator.i2c_address}",
+                        severity='info'
+                    )
+                    for actuator in registered_actuators
+                ] + [
+                    Event(
+                        source='discovery',
+                        event_type='device_removed',
+                        message=f"Device no longer responding: {device.name} at {device.i2c_address}",
+                        severity='warning'
+                    )
+                    for device in removed_devices
+                ]
+            )
+
+        def describe(device, device_class, created):
+            return {
+                'created': created,
+                'device_class': device_class,
+                'id': device.id,
+                'name': device.name,
+                'type': device.sensor_type if device_class == 'sensor' else device.actuator_type,
+                'i2c_address': device.i2c_address,
+            }
+
+        registered = (
+            [describe(d, 'sensor', True) for d in registered_sensors]
+            + [describe(d, 'actuator', True) for d in registered_actuators]
+        )
+        updated = (
+            [describe(d, 'sensor', False) for d in updated_sensors]
+            + [describe(d, 'actuator', False) for d in updated_actuators]
+        )
+
+        return Response({
+            'baseboard': baseboard.identifier,
+            'registered': [d['i2c_address'] for d in registered],
+            'updated': [d['i2c_address'] for d in updated],
+            'removed': [d.i2c_address for d in removed_devices],
+            'failed': failed,
+            'devices': registered + updated,
+        }, status=status.HTTP_201_CREATED if registered else status.HTTP_200_OK)
+
+    def _mark_removed(self, baseboard, addresses):
+        """Mark devices that disappeared from the bus; returns the affected devices."""
+        if not addresses:
+            return []
+
+        sensors = list(Sensor.objects.filter(
+            baseboard=baseboard, i2c_address__in=addresses
+        ).exclude(status='offline'))
+        actuators = list(Actuator.objects.filter(
+            baseboard=baseboard, i2c_address__in=addresses
+        ).exclude(status='disconnected'))
+
+        Sensor.objects.filter(id__in=[s.id for s in sensors]).update(status='offline')
+        Actuator.objects.filter(id__in=[a.id for a in actuators]).update(status='disconnected')
+        return sensors + actuators
+
+    def _upsert(self, model, baseboard, fields_by_address):
+        """
+        Create or update devices of one model from {i2c_address: fields}.
+        
+        Returns:
+            tuple: (created instances, updated instances)
+        """
+        if not fields_by_address:
+            return [], []
+
+        existing = {
+            device.i2c_address: device
+            for device in model.objects.filter(
+                baseboard=baseboard, i2c_address__in=list(fields_by_address)
+            )
+        }
+
+        to_create = []
+        to_update = []
+        for i2c_address, fields in fields_by_address.items():
+            device = existing.get(i2c_address)
+            if device is None:
+                to_create.append(model(baseboard=baseboard, i2c_address=i2c_address, **fields))
+            else:
+                for name, value in fields.items():
+                    setattr(device, name, value)
+                to_update.append(device)
+
+        created = model.objects.bulk_create(to_create)
+        if to_update:
+            model.objects.bulk_update(to_update, list(next(iter(fields_by_address.values()))))
+        return created, to_update
+
+
 class TriggerDiscoveryView(APIView):
     """
     Trigger device discovery on a baseboard via MQTT.
@@ -10,6 +10,7 @@ https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 import os
 import threading
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
@@ -30,8 +31,9 @@ application = ProtocolTypeRouter({
     ),
 })
 
-# Start MQTT subscriber in background thread (same process as Daphne)
-# This ensures they share the same InMemoryChannelLayer
+# Start the MQTT subscriber in the same process as Daphne so they share the
+# same InMemoryChannelLayer. The asyncio backend runs on the server's event
+# loop; the paho backend runs in a background thread.
 def start_mqtt_subscriber():
     from api.mqtt_service import get_mqtt_service
     import time
@@ -45,5 +47,9 @@ def start_mqtt_subscriber():
 
 # Only start in main process (avoid starting in reloader subprocess)
 if os.environ.get('RUN_MAIN') != 'true':
-    mqtt_thread = threading.Thread(target=start_mqtt_subscriber, daemon=True)
-    mqtt_thread.start()
+    if getattr(settings, 'MQTT_INGEST_BACKEND', 'asyncio') == 'asyncio':
+        from api.mqtt_async import MQTTIngestMiddleware
+        application = MQTTIngestMiddleware(application)
+    else:
+        mqtt_thread = threading.Thread(target=start_mqtt_subscriber, daemon=True)
+        mqtt_thread.start()
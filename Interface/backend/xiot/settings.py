@@ -4,6 +4,7 @@ Django settings for xiot project.
 Generated by 'django-admin startproject' using Django 6.0.
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
@@ -90,6 +91,61 @@ MQTT_PORT = 1883
 MQTT_USERNAME = None
 MQTT_PASSWORD = None
 
+# MQTT ingest backend: 'asyncio' runs on the ASGI event loop (api/mqtt_async.py),
+# 'paho' uses paho's network thread plus the worker pool below
+MQTT_INGEST_BACKEND = 'asyncio'
+MQTT_ASYNC_BATCH_SIZE = 200         # Messages per database batch (asyncio)
+
+# MQTT ingest worker pool (paho backend): messages are sharded by baseboard id
+# across MQTT_INGEST_WORKERS threads (0 processes them on the network thread).
+# None = 1 on SQLite, which takes one writer at a time, and 4 on a server database
+MQTT_INGEST_WORKERS = None
+MQTT_INGEST_QUEUE_SIZE = 10000      # Per worker (paho) / total (asyncio); dropped when full
+
+# Time each live reading through ingest and WebSocket delivery (api/tracing.py)
+LATENCY_TRACING = True
+
+# Logging: the 'api' logger writes through a queue and a background thread
+# (api/structured_log.py); per-message logs are sampled. XIOT_LOG_FORMAT=json
+# emits one JSON object per line
+LOG_LEVEL = os.environ.get('XIOT_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('XIOT_LOG_FORMAT', 'text')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'async': {
+            '()': 'api.structured_log.AsyncHandler',
+            'fmt': LOG_FORMAT,
+        },
+    },
+    'loggers': {
+        'api': {
+            'handlers': ['async'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+# Historical readings cache (number of sensor/range/bucket windows kept)
+READINGS_CACHE_SIZE = 256
+
+# Readings re-converted per query when a sensor is recalibrated
+RECALIBRATE_CHUNK_SIZE = 5000
+
+# I2C bus activity reports (xiot/<baseboard>/i2c_stats)
+I2C_STATS_RETENTION_DAYS = 7     # Older reports are deleted on ingest
+I2C_STATS_STALE_AFTER = 180      # Seconds before a baseboard's last report is ignored
+
+# Sensor evaluation (status and rate of change computed on ingest)
+SENSOR_EWMA_ALPHA = 0.3          # Smoothing factor for threshold comparison
+SENSOR_RATE_WINDOW = 60          # Seconds of history used for rate of change
+SENSOR_RATE_MAX_SAMPLES = 600    # Cap on samples kept per sensor window
+SENSOR_WARNING_BAND = 0.1        # Warning zone, fraction of threshold span
+SENSOR_HYSTERESIS = 0.02         # Recovery margin, fraction of threshold span
+
 
 # Database
 DATABASES = {
@@ -4,8 +4,11 @@ URL configuration for xiot project.
 from django.contrib import admin
 from django.urls import path, include
 
+from api.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/', include('api.urls')),
     path('api/auth/', include('authentication.urls')),
 ]
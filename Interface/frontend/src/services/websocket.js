@@ -4,6 +4,10 @@
 
 const WS_URL = import.meta.env.VITE_WS_URL || 'ws://localhost:8000/ws/sensors/';
 
+// How often measured display latencies are reported to the backend (ms)
+const LATENCY_REPORT_INTERVAL = 5000;
+const LATENCY_REPORT_MAX_SAMPLES = 500;
+
 class WebSocketService {
   constructor() {
     this.socket = null;
@@ -12,6 +16,8 @@ class WebSocketService {
     this.maxReconnectAttempts = 5;
     this.reconnectDelay = 1000;
     this.isConnected = false;
+    this.latencies = { display_ms: [], total_ms: [] };
+    this.latencyTimer = null;
   }
 
   connect() {
@@ -28,11 +34,13 @@ class WebSocketService {
       this.isConnected = true;
       this.reconnectAttempts = 0;
       this._emit('connection', { status: 'connected' });
+      this._startLatencyReports();
     };
 
     this.socket.onclose = (event) => {
       console.log('[WS] Disconnected', event.code, event.reason);
       this.isConnected = false;
+      this._stopLatencyReports();
       this._emit('connection', { status: 'disconnected' });
       this._attemptReconnect();
     };
@@ -84,6 +92,9 @@ class WebSocketService {
       case 'sensor_update':
         console.log('[WS] Sensor update data:', payload.data);
         this._emit('sensor_update', payload.data);
+        if (payload.data?.trace) {
+          this._measureDisplay(payload.data.trace);
+        }
         break;
       
       case 'baseboard_status':
@@ -100,6 +111,43 @@ class WebSocketService {
     }
   }
 
+  /**
+   * Time from the server sending an update to the next paint after
+   * listeners have handled it, plus the whole I2C read to paint latency.
+   */
+  _measureDisplay(trace) {
+    requestAnimationFrame(() => {
+      const displayed = Date.now();
+      if (this.latencies.display_ms.length >= LATENCY_REPORT_MAX_SAMPLES) {
+        return;
+      }
+      if (trace.delivered != null) {
+        this.latencies.display_ms.push(displayed - trace.delivered);
+      }
+      if (trace.read != null) {
+        this.latencies.total_ms.push(displayed - trace.read);
+      }
+    });
+  }
+
+  _startLatencyReports() {
+    this._stopLatencyReports();
+    this.latencyTimer = setInterval(() => {
+      const { display_ms, total_ms } = this.latencies;
+      if (display_ms.length || total_ms.length) {
+        this.send({ type: 'latency_report', display_ms, total_ms });
+        this.latencies = { display_ms: [], total_ms: [] };
+      }
+    }, LATENCY_REPORT_INTERVAL);
+  }
+
+  _stopLatencyReports() {
+    if (this.latencyTimer) {
+      clearInterval(this.latencyTimer);
+      this.latencyTimer = null;
+    }
+  }
+
   subscribe(event, callback) {
     if (!this.listeners.has(event)) {
       this.listeners.set(event, new Set());
@@ -0,0 +1,130 @@
+"""
+XIOT adapter block-read protocol
+
+Sensor adapters that set CAP_BLOCK in their IDENTIFY capabilities byte
+answer READ_BLOCK with one frame holding all of their channels, so the Pi
+reads an adapter with a single I2C transaction per cycle. The frame is as
+long as the adapter's channel count; the Pi reads the header once to learn
+it, then reads whole frames:
+
+    read_i2c_block_data(addr, CMD_READ_BLOCK, HEADER_LENGTH)
+    read_i2c_block_data(addr, CMD_READ_BLOCK, frame_length(count))
+
+Frame layout (version 2, n channels):
+
+    byte 0           protocol version (BLOCK_VERSION)
+    byte 1           sequence counter, incremented per conversion cycle
+    byte 2           channel count n (1 to MAX_CHANNELS)
+    bytes 3..2+2n    channels 0..n-1, 10-bit ADC values, LSB first
+    next 2 bytes     channel 0 oversampled on chip, 12-bit, LSB first
+    last byte        CRC-8 (polynomial 0x07) of all preceding bytes
+
+Adapters without CAP_BLOCK keep the legacy 2-byte single-channel read.
+Firmware: adapter/attiny85_sensor_block/attiny85_sensor_block.ino
+"""
+
+# IDENTIFY capability bit: adapter supports READ_BLOCK
+CAP_BLOCK = 0x20
+
+CMD_READ_BLOCK = 0xFE
+
+BLOCK_VERSION = 2
+# Version, sequence counter and channel count
+HEADER_LENGTH = 3
+# Fits the 16-byte TinyWireS transmit buffer
+MAX_CHANNELS = 4
+
+# The oversampled value has this many more bits than a plain channel
+OVERSAMPLE_EXTRA_BITS = 2
+
+
+class FrameError(ValueError):
+    """Raised for block frames with a bad length, version or checksum."""
+
+
+def crc8(data):
+    """CRC-8, polynomial 0x07, initial value 0 (as computed by the firmware)."""
+    crc = 0
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+
+def decode_legacy(data):
+    """10-bit value from a legacy 2-byte read."""
+    return data[0] | ((data[1] & 0x03) << 8)
+
+
+def frame_length(count):
+    """Bytes in a frame with count channels: header, channels, oversampled value, CRC."""
+    return HEADER_LENGTH + 2 * count + 2 + 1
+
+
+def encode_frame(seq, channels, oversampled, version=BLOCK_VERSION):
+    """Build a frame as the firmware does (simulation and tests)."""
+    frame = [version, seq & 0xFF, len(channels)]
+    for value in channels:
+        frame += [value & 0xFF, (value >> 8) & 0x03]
+    frame += [oversampled & 0xFF, (oversampled >> 8) & 0x0F]
+    frame.append(crc8(frame))
+    return frame
+
+
+def decode_frame(data):
+    """
+    Parse and check a block frame.
+
+    Returns:
+        dict with version, seq, channels (list of 10-bit values) and
+        oversampled (12-bit value of channel 0)
+
+    Raises:
+        FrameError: if the frame is truncated, corrupt or of an unknown version
+    """
+    data = list(data)
+    if len(data) < HEADER_LENGTH:
+        raise FrameError(f"Expected a frame, got {len(data)} bytes")
+    version, seq, count = data[0], data[1], data[2]
+    if not 1 <= count <= MAX_CHANNELS:
+        raise FrameError(f"Invalid channel count {count}")
+    if len(data) != frame_length(count):
+        raise FrameError(f"Expected {frame_length(count)} bytes, got {len(data)}")
+    if crc8(data[:-1]) != data[-1]:
+        raise FrameError("Checksum mismatch")
+    if version != BLOCK_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+
+    channels = [decode_legacy(data[3 + 2 * i:5 + 2 * i]) for i in range(count)]
+    offset = HEADER_LENGTH + 2 * count
+    oversampled = data[offset] | ((data[offset + 1] & 0x0F) << 8)
+    return {
+        "version": version,
+        "seq": seq,
+        "channels": channels,
+        "oversampled": oversampled,
+    }
+
+
+def decode_header(data):
+    """
+    Channel count from the first HEADER_LENGTH bytes of a frame.
+
+    Raises:
+        FrameError: for a truncated header, an unknown version or a bad count
+    """
+    data = list(data)
+    if len(data) < HEADER_LENGTH:
+        raise FrameError(f"Expected {HEADER_LENGTH} header bytes, got {len(data)}")
+    version, count = data[0], data[2]
+    if version != BLOCK_VERSION:
+        raise FrameError(f"Unsupported frame version {version}")
+    if not 1 <= count <= MAX_CHANNELS:
+        raise FrameError(f"Invalid channel count {count}")
+    return count
+
+
+def seq_gap(previous, seq):
+    """Conversion cycles between two sequence numbers (0 = same frame)."""
+    return (seq - previous) & 0xFF
@@ -11,9 +11,10 @@ Usage:
     python3 attiny_controller.py
 """
 
-import smbus2
 import time
 
+import i2c_bus
+
 # I2C Configuration
 I2C_BUS = 1       # Use 1 for Pi 3/4/5, use 0 for older models
 ATTINY_ADDR = 8   # Matches SLAVE_ADDR in ATtiny code
@@ -28,7 +29,8 @@ class ATtinyController:
     """Controller for ATtiny85 I2C slave device."""
     
     def __init__(self, bus_num=I2C_BUS, addr=ATTINY_ADDR):
-        self.bus = smbus2.SMBus(bus_num)
+        # Goes through the I2C bus service when it is running
+        self.bus = i2c_bus.open_bus(i2c_bus.PRIORITY_SENSOR, bus_num)
         self.addr = addr
         
     def read_sensor(self):
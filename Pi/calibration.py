@@ -0,0 +1,118 @@
+"""
+Declarative calibration for raw sensor ADC values.
+
+A calibration is a small JSON-serialisable dict, so the same definition
+can live in the Pi's SENSOR_MAPPINGS, travel over MQTT and be stored on
+the backend ``Sensor``:
+
+    {"kind": "linear", "scale": 0.3226, "offset": 0.0}
+        value = raw * scale + offset
+
+    {"kind": "polynomial", "coefficients": [c0, c1, c2, ...]}
+        value = c0 + c1 * raw + c2 * raw**2 + ...
+
+    {"kind": "table", "points": [[raw0, value0], [raw1, value1], ...]}
+        piecewise-linear interpolation between points (sorted by raw),
+        clamped to the first/last value outside the table
+
+``convert`` handles a single raw value; ``convert_array`` applies the
+same definition to a whole batch with NumPy. The backend keeps a copy of
+this module in ``Interface/backend/api/calibration.py``; keep the two in
+sync.
+"""
+
+import numpy as np
+
+
+KINDS = ('linear', 'polynomial', 'table')
+
+# Identity mapping used when a sensor has no calibration
+IDENTITY = {"kind": "linear", "scale": 1.0, "offset": 0.0}
+
+
+class CalibrationError(ValueError):
+    """Raised for malformed calibration definitions."""
+
+
+def validate(spec):
+    """
+    Check a calibration definition and return it in normalised form.
+
+    Raises:
+        CalibrationError: if the definition is malformed
+    """
+    if not spec:
+        return dict(IDENTITY)
+    if not isinstance(spec, dict):
+        raise CalibrationError("Calibration must be an object")
+
+    kind = spec.get("kind")
+    try:
+        if kind == "linear":
+            return {
+                "kind": "linear",
+                "scale": float(spec.get("scale", 1.0)),
+                "offset": float(spec.get("offset", 0.0)),
+            }
+        if kind == "polynomial":
+            coefficients = [float(c) for c in spec["coefficients"]]
+            if not coefficients:
+                raise CalibrationError("Polynomial needs at least one coefficient")
+            return {"kind": "polynomial", "coefficients": coefficients}
+        if kind == "table":
+            points = sorted((float(raw), float(value)) for raw, value in spec["points"])
+            if len(points) < 2:
+                raise CalibrationError("Lookup table needs at least two points")
+            return {"kind": "table", "points": [list(p) for p in points]}
+    except (KeyError, TypeError, ValueError) as e:
+        if isinstance(e, CalibrationError):
+            raise
+        raise CalibrationError(f"Invalid {kind} calibration: {e}") from e
+
+    raise CalibrationError(f"Unknown calibration kind: {kind!r} (expected one of {KINDS})")
+
+
+def convert(spec, raw):
+    """Convert a single raw value."""
+    if raw is None:
+        return None
+    if not spec:
+        return float(raw)
+
+    kind = spec["kind"]
+    if kind == "linear":
+        return raw * spec["scale"] + spec["offset"]
+    if kind == "polynomial":
+        # Horner's method, highest power first
+        value = 0.0
+        for c in reversed(spec["coefficients"]):
+            value = value * raw + c
+        return value
+    return float(convert_array(spec, [raw])[0])
+
+
+def convert_array(spec, raws):
+    """
+    Convert a batch of raw values.
+
+    Args:
+        spec: Calibration definition (validated)
+        raws: Sequence or array of raw values
+
+    Returns:
+        numpy.ndarray of float64 values
+    """
+    raws = np.asarray(raws, dtype=np.float64)
+    if not spec:
+        return raws
+
+    kind = spec["kind"]
+    if kind == "linear":
+        return raws * spec["scale"] + spec["offset"]
+    if kind == "polynomial":
+        # np.polyval expects the highest power first
+        return np.polyval(spec["coefficients"][::-1], raws)
+    if kind == "table":
+        points = np.asarray(spec["points"], dtype=np.float64)
+        return np.interp(raws, points[:, 0], points[:, 1])
+    raise CalibrationError(f"Unknown calibration kind: {kind!r}")
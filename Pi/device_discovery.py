@@ -10,20 +10,31 @@ Protocol:
 - Device responds with 4 bytes: [MAGIC, CLASS, SUBTYPE, CAPABILITIES]
 - MAGIC must be 0xA5 to confirm it's an XIOT device
 
+Only addresses that are new (or whose cached fingerprint has expired) are
+sent IDENTIFY. The fingerprints of the last inventory accepted by the
+backend are cached on disk, and only added and removed devices are
+reported.
+
 Usage:
     python3 device_discovery.py              # Run discovery once
     python3 device_discovery.py --daemon     # Run continuously
     python3 device_discovery.py --interval 30  # Custom interval (seconds)
+    python3 device_discovery.py --full       # Ignore the cache, re-register everything
+    python3 device_discovery.py --scan-mode full  # Probe every address, no pipelining
 """
 
 import argparse
+import contextlib
 import json
 import time
 import requests
-import sys
 import os
 from datetime import datetime
 
+import adapter_protocol
+import i2c_bus
+import sim_bus
+
 # Try to import smbus2 (only available on Pi)
 try:
     import smbus2
@@ -48,6 +59,38 @@ I2C_BUS = 1
 I2C_SCAN_START = 0x08  # First valid I2C address
 I2C_SCAN_END = 0x77    # Last valid I2C address
 
+# Scan mode: "fast" probes only the XIOT adapter range with quick writes and
+# a short bus timeout, and pipelines IDENTIFY across devices; "full" probes
+# every address with read_byte and identifies devices one at a time.
+SCAN_MODE = os.environ.get("XIOT_SCAN_MODE", "fast")
+XIOT_SCAN_START = int(os.environ.get("XIOT_SCAN_START", "0x08"), 16)
+XIOT_SCAN_END = int(os.environ.get("XIOT_SCAN_END", "0x3F"), 16)
+
+# Bus timeout while fast-scanning, in units of 10 ms (I2C_TIMEOUT ioctl)
+FAST_SCAN_TIMEOUT = 1
+# Adapter settings restored after the scan. i2c-dev can set but not read
+# them, so these are the kernel defaults (1 s timeout, no retries)
+DEFAULT_BUS_TIMEOUT = 100
+DEFAULT_BUS_RETRIES = 0
+I2C_RETRIES_IOCTL = 0x0701
+I2C_TIMEOUT_IOCTL = 0x0702
+
+# Address ranges where quick writes can corrupt common devices (EEPROMs,
+# some sensors); probed with read_byte instead, as i2cdetect does
+READ_PROBE_RANGES = ((0x30, 0x37), (0x50, 0x5F))
+
+# Time an adapter needs between the IDENTIFY write and the response read
+IDENTIFY_SETTLE = 0.01
+
+# Fingerprint cache: last inventory accepted by the backend
+DISCOVERY_CACHE_PATH = os.environ.get(
+    "XIOT_DISCOVERY_CACHE", os.path.expanduser("~/.xiot/discovery_cache.json")
+)
+
+# Re-IDENTIFY cached devices after this many seconds, so an adapter swapped
+# between two scans is still noticed
+FINGERPRINT_MAX_AGE = 3600
+
 # Discovery protocol
 XIOT_MAGIC = 0xA5
 CMD_IDENTIFY = 0xFF
@@ -87,6 +130,7 @@ CAP_WRITE = 0x02
 CAP_PWM = 0x04
 CAP_ANALOG = 0x08
 CAP_DIGITAL = 0x10
+CAP_BLOCK = adapter_protocol.CAP_BLOCK  # Multi-channel block reads
 
 
 # =============================================================================
@@ -94,20 +138,53 @@ CAP_DIGITAL = 0x10
 # =============================================================================
 
 class I2CScanner:
-    """Scans I2C bus and identifies XIOT devices."""
+    """
+    Scans I2C bus and identifies XIOT devices.
+    
+    Opens its own bus handle unless an existing one is passed in; through
+    the I2C bus service when it is running, where probes are queued behind
+    actuator and sensor transactions. A shared direct handle should come
+    with the lock its other users hold; each bus transaction is then made
+    under that lock, so other transactions can run between discovery probes.
+    """
     
-    def __init__(self, bus_num=I2C_BUS):
-        self.bus = None
+    def __init__(self, bus_num=I2C_BUS, scan_mode=SCAN_MODE, bus=None, lock=None):
+        self.bus = bus
         self.bus_num = bus_num
-        if ON_PI:
+        self.scan_mode = scan_mode
+        self.lock = lock or contextlib.nullcontext()
+        # Duration of the last probe / identify phase in milliseconds
+        self.timing = {"probe_ms": 0.0, "identify_ms": 0.0}
+        if bus is None and (ON_PI or sim_bus.enabled()):
             try:
-                self.bus = smbus2.SMBus(bus_num)
+                self.bus = i2c_bus.open_bus(i2c_bus.PRIORITY_DISCOVERY, bus_num)
                 print(f"[I2C] Opened bus {bus_num}")
             except Exception as e:
                 print(f"[I2C] Failed to open bus {bus_num}: {e}")
+        # The timeout applies to the whole adapter, so it is only shortened
+        # on a handle opened here directly, and only for the probe itself
+        self._owns_adapter = isinstance(self.bus, i2c_bus.MeteredBus) and bus is None
+    
+    def _set_bus_timeout(self, retries, timeout):
+        """Set the adapter's retry count and timeout (10 ms units)."""
+        if getattr(self.bus, "fd", None) is None:
+            # Not a /dev/i2c-N handle (simulated bus)
+            return
+        try:
+            import fcntl
+            fcntl.ioctl(self.bus.fd, I2C_RETRIES_IOCTL, retries)
+            fcntl.ioctl(self.bus.fd, I2C_TIMEOUT_IOCTL, timeout)
+        except (ImportError, OSError) as e:
+            print(f"[I2C] Could not set bus timeout: {e}")
     
     def scan_bus(self):
         """Scan I2C bus for all responding devices."""
+        start = time.perf_counter()
+        devices = self._probe()
+        self.timing["probe_ms"] = (time.perf_counter() - start) * 1000
+        return devices
+    
+    def _probe(self):
         devices = []
         
         if not self.bus:
@@ -115,12 +192,24 @@ class I2CScanner:
             # Simulation mode - return fake devices for testing
             return self._simulate_devices()
         
+        if self.scan_mode == "fast":
+            if not self._owns_adapter:
+                return self._probe_fast()
+            # Fail missing addresses fast, then restore the adapter for the
+            # publisher and multimedia server sharing it
+            self._set_bus_timeout(0, FAST_SCAN_TIMEOUT)
+            try:
+                return self._probe_fast()
+            finally:
+                self._set_bus_timeout(DEFAULT_BUS_RETRIES, DEFAULT_BUS_TIMEOUT)
+        
         print(f"[I2C] Scanning addresses 0x{I2C_SCAN_START:02X} - 0x{I2C_SCAN_END:02X}...")
         
         for addr in range(I2C_SCAN_START, I2C_SCAN_END + 1):
             try:
                 # Try to read a byte - if device exists, it won't throw
-                self.bus.read_byte(addr)
+                with self.lock:
+                    self.bus.read_byte(addr)
                 devices.append(addr)
                 print(f"[I2C] Found device at 0x{addr:02X}")
             except IOError:
@@ -130,6 +219,82 @@ class I2CScanner:
         print(f"[I2C] Scan complete. Found {len(devices)} devices.")
         return devices
     
+    def _probe_fast(self):
+        """Probe the XIOT address range with quick writes."""
+        devices = []
+        for addr in range(XIOT_SCAN_START, XIOT_SCAN_END + 1):
+            try:
+                with self.lock:
+                    if any(low <= addr <= high for low, high in READ_PROBE_RANGES):
+                        self.bus.read_byte(addr)
+                    else:
+                        self.bus.write_quick(addr)
+                devices.append(addr)
+            except IOError:
+                pass
+        print(f"[I2C] Fast scan 0x{XIOT_SCAN_START:02X} - 0x{XIOT_SCAN_END:02X}: "
+              f"found {len(devices)} devices")
+        return devices
+    
+    def read_identities(self, addrs):
+        """
+        Send IDENTIFY to several devices.
+        
+        In fast mode all IDENTIFY writes go out back to back and each
+        response is read once that device's settle time has passed, so the
+        settle delays overlap instead of adding up.
+        
+        Returns:
+            dict: addr -> (magic, class, subtype, capabilities); devices
+            that failed to answer are left out
+        """
+        start = time.perf_counter()
+        if self.bus and self.scan_mode == "fast":
+            identities = self._read_identities_pipelined(addrs)
+        else:
+            identities = {}
+            for addr in addrs:
+                identity = self.read_identity(addr)
+                if identity is not None:
+                    identities[addr] = identity
+        self.timing["identify_ms"] = (time.perf_counter() - start) * 1000
+        return identities
+    
+    def _read_identities_pipelined(self, addrs):
+        from smbus2 import i2c_msg
+        
+        written = []
+        for addr in addrs:
+            try:
+                with self.lock:
+                    self.bus.i2c_rdwr(i2c_msg.write(addr, [CMD_IDENTIFY]))
+                written.append((addr, time.perf_counter()))
+            except IOError as e:
+                print(f"[I2C] Failed to identify device at 0x{addr:02X}: {e}")
+        
+        identities = {}
+        for addr, written_at in written:
+            # Reads happen in write order, so usually only the first one waits
+            remaining = written_at + IDENTIFY_SETTLE - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            try:
+                read_msg = i2c_msg.read(addr, 4)
+                with self.lock:
+                    self.bus.i2c_rdwr(read_msg)
+                identities[addr] = tuple(read_msg)
+            except IOError as e:
+                print(f"[I2C] Failed to identify device at 0x{addr:02X}: {e}")
+        return identities
+    
+    def report_timing(self, responding):
+        """Print how long the last scan took."""
+        probe_ms = self.timing["probe_ms"]
+        identify_ms = self.timing["identify_ms"]
+        print(f"[I2C] {self.scan_mode} scan: {responding} responding address(es) in "
+              f"{probe_ms + identify_ms:.1f} ms (probe {probe_ms:.1f} ms, "
+              f"identify {identify_ms:.1f} ms)")
+    
     def identify_device(self, addr):
         """
         Send IDENTIFY command and read device info.
@@ -137,8 +302,37 @@ class I2CScanner:
         Returns:
             dict with device info or None if not an XIOT device
         """
+        identity = self.read_identity(addr)
+        if identity is None:
+            return None
+        return self.parse_identity(addr, identity)
+    
+    def parse_identity(self, addr, identity):
+        """
+        Turn a raw IDENTIFY response into device info.
+        
+        Returns:
+            dict with device info or None if not an XIOT device
+        """
+        magic, device_class, subtype, capabilities = identity
+        
+        # Verify magic byte
+        if magic != XIOT_MAGIC:
+            print(f"[I2C] Device at 0x{addr:02X} is not an XIOT device (magic: 0x{magic:02X})")
+            return None
+        
+        # Parse device info
+        return self._parse_device_info(addr, device_class, subtype, capabilities)
+    
+    def read_identity(self, addr):
+        """
+        Send IDENTIFY and return the raw response.
+        
+        Returns:
+            tuple (magic, class, subtype, capabilities) or None on bus error
+        """
         if not self.bus:
-            return self._simulate_identify(addr)
+            return self._simulate_identity(addr)
         
         try:
             # Use i2c_rdwr for precise control over the transaction
@@ -147,29 +341,17 @@ class I2CScanner:
             
             # Write IDENTIFY command
             write_msg = i2c_msg.write(addr, [CMD_IDENTIFY])
-            self.bus.i2c_rdwr(write_msg)
+            with self.lock:
+                self.bus.i2c_rdwr(write_msg)
             
             # Small delay to let ATtiny process
             time.sleep(0.01)
             
             # Read 4 bytes response
             read_msg = i2c_msg.read(addr, 4)
-            self.bus.i2c_rdwr(read_msg)
-            response = list(read_msg)
-            
-            magic = response[0]
-            device_class = response[1]
-            subtype = response[2]
-            capabilities = response[3]
-            
-            # Verify magic byte
-            if magic != XIOT_MAGIC:
-                print(f"[I2C] Device at 0x{addr:02X} is not an XIOT device (magic: 0x{magic:02X})")
-                return None
-            
-            # Parse device info
-            device_info = self._parse_device_info(addr, device_class, subtype, capabilities)
-            return device_info
+            with self.lock:
+                self.bus.i2c_rdwr(read_msg)
+            return tuple(read_msg)
             
         except IOError as e:
             print(f"[I2C] Failed to identify device at 0x{addr:02X}: {e}")
@@ -200,6 +382,8 @@ class I2CScanner:
             caps.append("analog")
         if capabilities & CAP_DIGITAL:
             caps.append("digital")
+        if capabilities & CAP_BLOCK:
+            caps.append("block")
         
         return {
             "i2c_address": f"0x{addr:02X}",
@@ -217,37 +401,167 @@ class I2CScanner:
         """Return simulated devices for testing without hardware."""
         return [0x08]  # Simulate one device at address 8
     
-    def _simulate_identify(self, addr):
-        """Return simulated device info for testing."""
+    def _simulate_identity(self, addr):
+        """Return a simulated IDENTIFY response for testing."""
         if addr == 0x08:
-            return {
-                "i2c_address": "0x08",
-                "device_class": "actuator",
-                "device_type": "led",
-                "capabilities": ["write", "digital"],
-                "raw": {"class": 0x02, "subtype": 0x20, "caps": 0x12}
-            }
+            return (XIOT_MAGIC, 0x02, 0x20, 0x12)  # LED actuator, write + digital
         return None
     
     def discover_all(self):
         """Scan bus and identify all XIOT devices."""
         devices = []
         addresses = self.scan_bus()
+        identities = self.read_identities(addresses)
+        self.report_timing(len(addresses))
         
-        for addr in addresses:
-            device_info = self.identify_device(addr)
+        for addr, identity in identities.items():
+            device_info = self.parse_identity(addr, identity)
             if device_info:
                 devices.append(device_info)
                 print(f"[DISCOVERY] Identified: {device_info['device_class']} "
                       f"({device_info['device_type']}) at {device_info['i2c_address']}")
         
         return devices
+    
+    def discover_changes(self, cache, now=None):
+        """
+        Scan the bus and diff it against the fingerprint cache.
+        
+        Responding addresses with a fresh cached fingerprint are not
+        re-identified. Non-XIOT devices are cached too, so they are not
+        probed again on every run. Devices whose entry had expired are sent
+        again once re-identified, so the backend re-registers any it has
+        lost. An address that responds but fails IDENTIFY keeps its previous
+        entry; only addresses missing from the scan are removed.
+        
+        Returns:
+            tuple: (inventory {addr: cache entry}, added device infos,
+                    removed addresses as "0xNN" strings)
+        """
+        if now is None:
+            now = time.time()
+        
+        addresses = self.scan_bus()
+        inventory = {}
+        stale = []
+        for addr in addresses:
+            cached = cache.get(addr)
+            if cached and now - cached["identified_at"] < FINGERPRINT_MAX_AGE:
+                inventory[addr] = cached
+            else:
+                stale.append(addr)
+        
+        identities = self.read_identities(stale)
+        self.report_timing(len(addresses))
+        
+        added = []
+        for addr in stale:
+            cached = cache.get(addr)
+            identity = identities.get(addr)
+            if identity is None:
+                # Still on the bus; identify it again next run
+                if cached:
+                    inventory[addr] = cached
+                continue
+            device_info = self.parse_identity(addr, identity)
+            entry = FingerprintCache.entry(identity, device_info, now)
+            inventory[addr] = entry
+            
+            if device_info:
+                added.append(device_info)
+                if not cached:
+                    change = "New"
+                elif cached["fingerprint"] != entry["fingerprint"]:
+                    change = "Changed"
+                else:
+                    change = "Refreshed"
+                print(f"[DISCOVERY] {change}: {device_info['device_class']} "
+                      f"({device_info['device_type']}) at {device_info['i2c_address']}")
+        
+        responding = set(addresses)
+        removed = [
+            f"0x{addr:02X}" for addr, entry in cache.entries.items()
+            if entry["device"] and addr not in responding
+        ]
+        # A fingerprint change from XIOT device to foreign device is a removal too
+        removed += [
+            f"0x{addr:02X}" for addr, entry in inventory.items()
+            if not entry["device"] and (cache.get(addr) or {}).get("device")
+        ]
+        for address in removed:
+            print(f"[DISCOVERY] Removed: device at {address}")
+        
+        print(f"[DISCOVERY] Identified {len(identities)} of {len(inventory)} responding address(es)")
+        return inventory, added, removed
+
+
+# =============================================================================
+# FINGERPRINT CACHE
+# =============================================================================
+
+class FingerprintCache:
+    """
+    On-disk cache of device fingerprints (magic/class/subtype/caps) per address.
+    
+    Holds the inventory last accepted by the backend, so it is only replaced
+    after a successful registration.
+    """
+    
+    def __init__(self, path=DISCOVERY_CACHE_PATH):
+        self.path = path
+        self.entries = {}
+        self.load()
+    
+    @staticmethod
+    def entry(identity, device_info, now):
+        """Build a cache entry from a raw IDENTIFY response."""
+        magic, device_class, subtype, capabilities = identity
+        return {
+            "fingerprint": {
+                "magic": magic,
+                "class": device_class,
+                "subtype": subtype,
+                "caps": capabilities,
+            },
+            "device": device_info,
+            "identified_at": now,
+        }
+    
+    def get(self, addr):
+        return self.entries.get(addr)
+    
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.entries = {int(addr, 16): entry for addr, entry in data.items()}
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            print(f"[DISCOVERY] Ignoring unreadable cache {self.path}: {e}")
+            self.entries = {}
+    
+    def replace(self, inventory):
+        """Store a new inventory and write it to disk atomically."""
+        self.entries = dict(inventory)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({f"0x{addr:02X}": entry for addr, entry in self.entries.items()}, f, indent=2)
+        os.replace(tmp_path, self.path)
+    
+    def clear(self):
+        self.entries = {}
 
 
 # =============================================================================
 # API REGISTRATION
 # =============================================================================
 
+class BulkRegistrationUnavailable(Exception):
+    """The backend does not provide the bulk registration endpoint."""
+
+
 class DeviceRegistrar:
     """Registers discovered devices with the backend API."""
     
@@ -259,19 +573,90 @@ class DeviceRegistrar:
             self.session.headers['Authorization'] = f'Token {token}'
         self.session.headers['Content-Type'] = 'application/json'
     
-    def register_devices(self, devices):
+    def register_devices(self, devices, removed=None):
         """
-        Register discovered devices with the backend.
+        Register discovered devices with the backend in one request.
+        
+        Falls back to one request per device if the backend has no bulk
+        registration endpoint.
         
         Args:
             devices: List of device info dicts from I2CScanner
+            removed: Addresses ("0xNN") of devices that stopped responding
             
         Returns:
-            dict with registration results
+            dict with registration results; contains "error" if the
+            request itself failed, and "unreported" with the removals a
+            backend without bulk registration could not be told about
         """
+        removed = removed or []
+        if not devices and not removed:
+            return {"registered": [], "updated": [], "removed": [], "failed": []}
+        
+        try:
+            return self._register_bulk(devices, removed)
+        except BulkRegistrationUnavailable:
+            print("[API] Bulk registration not available, registering devices one by one")
+            if removed:
+                print(f"[API] Cannot report {len(removed)} removed device(s) to this backend")
+            return {**self._register_each(devices), "unreported": list(removed)}
+        except Exception as e:
+            print(f"[API] Bulk registration failed: {e}")
+            return {
+                "registered": [],
+                "updated": [],
+                "removed": [],
+                "failed": [
+                    {"address": device["i2c_address"], "error": str(e)} for device in devices
+                ],
+                "error": str(e),
+            }
+    
+    def _register_bulk(self, devices, removed):
+        """Register the whole inventory with a single POST."""
+        payload = {
+            "baseboard_id": self.baseboard_id,
+            "devices": [
+                {
+                    "i2c_address": device["i2c_address"],
+                    "device_class": device["device_class"],
+                    "device_type": device["device_type"],
+                    "capabilities": device["capabilities"],
+                }
+                for device in devices
+            ],
+            "removed": removed,
+            "discovered_at": datetime.utcnow().isoformat() + "Z"
+        }
+        
+        url = f"{self.api_base_url}/devices/register/bulk/"
+        
+        print(f"[API] Registering {len(devices)} device(s), removing {len(removed)} in one request...")
+        
+        response = self.session.post(url, json=payload, timeout=10)
+        
+        if response.status_code == 404:
+            raise BulkRegistrationUnavailable()
+        if response.status_code not in (200, 201):
+            raise Exception(f"API returned {response.status_code}: {response.text}")
+        
+        data = response.json()
+        for device in data.get("devices", []):
+            action = "registered" if device.get("created") else "updated"
+            print(f"[API] Successfully {action}: {device.get('name', device['i2c_address'])}")
+        return {
+            "registered": data.get("registered", []),
+            "updated": data.get("updated", []),
+            "removed": data.get("removed", []),
+            "failed": data.get("failed", []),
+        }
+    
+    def _register_each(self, devices):
+        """Register devices one request at a time (older backends)."""
         results = {
             "registered": [],
             "updated": [],
+            "removed": [],
             "failed": [],
         }
         
@@ -321,33 +706,108 @@ class DeviceRegistrar:
 # MAIN
 # =============================================================================
 
-def run_discovery(registrar=None):
-    """Run one discovery cycle."""
+def run_discovery(registrar=None, cache=None, scan_mode=SCAN_MODE, scanner=None, progress=None):
+    """
+    Run one discovery cycle.
+    
+    With a fingerprint cache only new or changed devices are identified,
+    and only added and removed devices are sent to the backend.
+    
+    Args:
+        registrar: DeviceRegistrar, or None to skip registration
+        cache: FingerprintCache, or None to identify and register everything
+        scan_mode: "fast" or "full" (ignored if scanner is given)
+        scanner: Existing I2CScanner, e.g. one sharing another component's bus
+        progress: Optional callback progress(stage, info) called as the run
+            moves through "scanned" and "registering"
+    """
     print("=" * 60)
     print(f"XIOT Device Discovery - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"Baseboard: {BASEBOARD_ID}")
     print("=" * 60)
     
-    # Scan and identify devices
-    scanner = I2CScanner()
-    devices = scanner.discover_all()
+    if scanner is None:
+        scanner = I2CScanner(scan_mode=scan_mode)
+    
+    if cache is None or not registrar:
+        # Scan and identify every device
+        devices = scanner.discover_all()
+        added, removed, inventory = devices, [], None
+    else:
+        inventory, added, removed = scanner.discover_changes(cache)
+        devices = [entry["device"] for entry in inventory.values() if entry["device"]]
+    
+    if progress:
+        progress("scanned", {
+            "devices": len(devices),
+            "added": len(added),
+            "removed": len(removed),
+            "timing": dict(scanner.timing),
+        })
+    
+    empty = {
+        "devices": devices, "registered": [], "updated": [], "removed": [], "failed": [],
+        "timing": dict(scanner.timing),
+    }
     
-    if not devices:
+    if not devices and not removed:
         print("[DISCOVERY] No XIOT devices found.")
-        return {"devices": [], "registered": [], "updated": [], "failed": []}
+        if inventory is not None:
+            # Remember foreign devices so they are not probed again
+            cache.replace(inventory)
+        return empty
     
     print(f"\n[DISCOVERY] Found {len(devices)} XIOT device(s)")
     
     # Register with backend if registrar available
-    if registrar:
-        results = registrar.register_devices(devices)
-        print(f"\n[RESULTS] Registered: {len(results['registered'])}, "
-              f"Updated: {len(results['updated'])}, "
-              f"Failed: {len(results['failed'])}")
-        return {"devices": devices, **results}
-    else:
+    if not registrar:
         print("[DISCOVERY] No API configured - skipping registration")
-        return {"devices": devices, "registered": [], "updated": [], "failed": []}
+        return empty
+    
+    if not added and not removed:
+        print("[DISCOVERY] Inventory unchanged - nothing to register")
+        if inventory is not None:
+            # Keeps refreshed fingerprint timestamps
+            cache.replace(inventory)
+        return empty
+    
+    if progress:
+        progress("registering", {"added": len(added), "removed": len(removed)})
+    results = registrar.register_devices(added, removed)
+    print(f"\n[RESULTS] Registered: {len(results['registered'])}, "
+          f"Updated: {len(results['updated'])}, "
+          f"Removed: {len(results['removed'])}, "
+          f"Failed: {len(results['failed'])}")
+    
+    # Only remember what the backend has accepted; other changes are sent
+    # again on the next run
+    if inventory is not None and "error" not in results:
+        cache.replace(_accepted_inventory(cache, inventory, results))
+    return {"devices": devices, **results, "timing": dict(scanner.timing)}
+
+
+def _accepted_inventory(cache, inventory, results):
+    """
+    The scanned inventory minus changes the backend did not accept.
+    
+    Failed additions and unreported removals keep their previous cache
+    entry (or none), marked stale so the address is identified again, so
+    the next run sees the same change and sends it again.
+    """
+    accepted = dict(inventory)
+    pending = [failure.get("address") for failure in results["failed"]]
+    pending += results.get("unreported", [])
+    for address in pending:
+        try:
+            addr = int(address, 16)
+        except (TypeError, ValueError):
+            continue
+        previous = cache.get(addr)
+        if previous is None:
+            accepted.pop(addr, None)
+        else:
+            accepted[addr] = {**previous, "identified_at": 0}
+    return accepted
 
 
 def main():
@@ -362,6 +822,10 @@ def main():
                         help=f'Backend API URL (default: {API_BASE_URL})')
     parser.add_argument('--baseboard', type=str, default=BASEBOARD_ID,
                         help=f'Baseboard ID (default: {BASEBOARD_ID})')
+    parser.add_argument('--full', action='store_true',
+                        help='Ignore the fingerprint cache and re-register every device')
+    parser.add_argument('--scan-mode', choices=['fast', 'full'], default=SCAN_MODE,
+                        help=f'Bus scan mode (default: {SCAN_MODE})')
     
     args = parser.parse_args()
     
@@ -370,31 +834,42 @@ def main():
     if not args.no_register:
         registrar = DeviceRegistrar(args.api_url, args.baseboard, API_TOKEN)
     
+    cache = FingerprintCache()
+    if args.full:
+        cache.clear()
+    
     if args.daemon:
         print(f"[DISCOVERY] Starting daemon mode (interval: {args.interval}s)")
         print("Press Ctrl+C to stop.\n")
         
         try:
             while True:
-                run_discovery(registrar)
+                run_discovery(registrar, cache, args.scan_mode)
                 print(f"\n[DISCOVERY] Next scan in {args.interval} seconds...\n")
                 time.sleep(args.interval)
         except KeyboardInterrupt:
             print("\n[DISCOVERY] Stopped by user.")
     else:
         # Single run
-        results = run_discovery(registrar)
+        results = run_discovery(registrar, cache, args.scan_mode)
         
         # Print summary
         print("\n" + "=" * 60)
         print("DISCOVERY SUMMARY")
         print("=" * 60)
+        failed = [f["address"] for f in results.get("failed", [])]
         for device in results.get("devices", []):
             status = "✓ Registered" if device["i2c_address"] in results.get("registered", []) else \
                      "↻ Updated" if device["i2c_address"] in results.get("updated", []) else \
-                     "✗ Failed"
+                     "✗ Failed" if device["i2c_address"] in failed else \
+                     "= Unchanged"
             print(f"  {device['i2c_address']} | {device['device_class']:8} | "
                   f"{device['device_type']:12} | {status}")
+        for address in results.get("removed", []):
+            print(f"  {address} | {'-':8} | {'-':12} | ✗ Removed")
+        timing = results["timing"]
+        print(f"  Scan time: {timing['probe_ms'] + timing['identify_ms']:.1f} ms "
+              f"(probe {timing['probe_ms']:.1f} ms, identify {timing['identify_ms']:.1f} ms)")
         print("=" * 60)
 
 
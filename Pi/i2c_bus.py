@@ -0,0 +1,655 @@
+#!/usr/bin/env python3
+"""
+XIOT Shared I2C Bus Service
+
+Owns /dev/i2c-1 on behalf of every other Pi component. All transactions go
+through one prioritised queue and are executed one at a time by a single
+worker thread, so transactions from different components never interleave
+on the wire and a discovery scan cannot hold up actuator commands:
+
+    actuator writes  (PRIORITY_ACTUATOR)
+    sensor reads     (PRIORITY_SENSOR)
+    discovery probes (PRIORITY_DISCOVERY)
+
+Transactions of equal priority run in submission order. Failed reads are
+retried once. Every handle measures bus activity: transactions, bytes, time
+spent per SMBus call, queue wait, IOErrors and retries per device address,
+and the share of time the bus was busy (``stats()``).
+
+Components use the bus through an SMBus-like handle from ``open_bus``:
+
+- In the same process as the service: ``service.client(priority)``
+- Other processes: ``RemoteBus``, which talks JSON lines to the service's
+  Unix socket (``XIOT_I2C_SOCKET``)
+- No service running: the bus opened directly, wrapped in ``MeteredBus``
+
+With XIOT_SIM_BUS set, the bus is a simulated one (sim_bus.py) instead of
+/dev/i2c-N, for running the stack without a Pi.
+
+``I2CBusService.call_async`` awaits a transaction from asyncio code.
+
+Usage:
+    python3 i2c_bus.py                      # Run the bus service
+    python3 i2c_bus.py --stats              # Print a running service's counters
+"""
+
+import argparse
+import asyncio
+import ctypes
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+
+import sim_bus
+
+try:
+    import smbus2
+except ImportError:
+    smbus2 = None
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+I2C_BUS = 1
+
+# Unix socket the service listens on
+SOCKET_PATH = os.environ.get("XIOT_I2C_SOCKET", "/tmp/xiot-i2c.sock")
+
+# Transaction priorities, lowest value runs first
+PRIORITY_ACTUATOR = 0
+PRIORITY_SENSOR = 1
+PRIORITY_DISCOVERY = 2
+PRIORITIES = {
+    "actuator": PRIORITY_ACTUATOR,
+    "sensor": PRIORITY_SENSOR,
+    "discovery": PRIORITY_DISCOVERY,
+}
+
+# Sorts after every transaction, so queued work finishes before shutdown
+_PRIORITY_STOP = 99
+
+# SMBus methods that may be queued
+OPERATIONS = (
+    "read_byte",
+    "write_byte",
+    "write_quick",
+    "read_byte_data",
+    "write_byte_data",
+    "read_i2c_block_data",
+    "write_i2c_block_data",
+    "i2c_rdwr",
+)
+
+# Reads are retried this many times after an IOError; writes are not, since
+# a command such as TOGGLE may have been executed before the error. Discovery
+# probes are never retried: most probed addresses are expected to fail.
+READ_RETRIES = 1
+READ_OPERATIONS = ("read_byte", "read_byte_data", "read_i2c_block_data")
+
+# Bus clock as configured in the device tree (dtparam=i2c_arm_baudrate)
+CLOCK_PATH = "/sys/class/i2c-adapter/i2c-{bus}/of_node/clock-frequency"
+
+# i2c_msg flag of read messages
+I2C_M_RD = 0x0001
+
+# How often the service prints its counters (seconds)
+STATS_INTERVAL = 60.0
+
+
+# =============================================================================
+# BUS SERVICE
+# =============================================================================
+
+class _Transaction:
+    """A queued SMBus call and the future its caller waits on."""
+
+    __slots__ = ("op", "args", "priority", "queued_at", "future")
+
+    def __init__(self, op, args, priority):
+        self.op = op
+        self.args = args
+        self.priority = priority
+        self.queued_at = time.perf_counter()
+        self.future = Future()
+
+
+class _OpStats:
+    """Call count and time spent in one SMBus method."""
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.max_time = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.time += seconds
+        self.max_time = max(self.max_time, seconds)
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_ms": round(self.time * 1000, 3),
+            "avg_ms": round(self.time / (self.count or 1) * 1000, 3),
+            "max_ms": round(self.max_time * 1000, 3),
+        }
+
+
+class _DeviceStats:
+    """Traffic, latency and error counters for one device address."""
+
+    def __init__(self):
+        self.transactions = 0
+        self.bytes = 0
+        self.errors = 0
+        self.retries = 0
+        self.bus = _OpStats()
+        self.wait = _OpStats()
+        self.ops = {}
+        self.last_error = None
+
+    def as_dict(self):
+        bus = self.bus.as_dict()
+        wait = self.wait.as_dict()
+        return {
+            "transactions": self.transactions,
+            "bytes": self.bytes,
+            "errors": self.errors,
+            "retries": self.retries,
+            "avg_ms": bus["avg_ms"],
+            "max_ms": bus["max_ms"],
+            "avg_wait_ms": wait["avg_ms"],
+            "max_wait_ms": wait["max_ms"],
+            "ops": {op: stats.as_dict() for op, stats in sorted(self.ops.items())},
+            "last_error": self.last_error,
+        }
+
+
+def _payload_bytes(op, args):
+    """Data bytes moved by a transaction (register byte included)."""
+    if op == "i2c_rdwr":
+        return sum(msg.len for msg in args)
+    if op == "read_i2c_block_data":
+        return 1 + args[2]
+    if op == "write_i2c_block_data":
+        return 1 + len(args[2])
+    if op in ("read_byte_data", "write_byte_data"):
+        return 2
+    return 0 if op == "write_quick" else 1
+
+
+def read_clock_hz(bus_num):
+    """Configured bus clock in Hz, or None if the kernel does not expose it."""
+    try:
+        with open(CLOCK_PATH.format(bus=bus_num), "rb") as f:
+            return int.from_bytes(f.read(4), "big")
+    except (OSError, ValueError):
+        return None
+
+
+class BusMetrics:
+    """Thread-safe bus activity counters, per device address and SMBus method."""
+
+    def __init__(self, bus_num=I2C_BUS):
+        self.bus_num = bus_num
+        self.clock_hz = read_clock_hz(bus_num)
+        self.started = time.monotonic()
+        self.busy_time = 0.0
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def record(self, op, args, seconds, wait=0.0, retries=0, error=None):
+        addr = args[0].addr if op == "i2c_rdwr" else args[0]
+        with self._lock:
+            stats = self._devices.get(addr)
+            if stats is None:
+                stats = self._devices[addr] = _DeviceStats()
+            stats.transactions += 1
+            stats.retries += retries
+            stats.bus.add(seconds)
+            stats.wait.add(wait)
+            if op not in stats.ops:
+                stats.ops[op] = _OpStats()
+            stats.ops[op].add(seconds)
+            self.busy_time += seconds
+            if error is None:
+                stats.bytes += _payload_bytes(op, args)
+            else:
+                stats.errors += 1
+                stats.last_error = str(error)
+
+    def stats(self):
+        """Cumulative counters; devices keyed by "0xNN"."""
+        with self._lock:
+            devices = {
+                f"0x{addr:02X}": stats.as_dict() for addr, stats in sorted(self._devices.items())
+            }
+            busy = self.busy_time
+        uptime = time.monotonic() - self.started
+
+        ops = {}
+        for device in devices.values():
+            for op, op_stats in device["ops"].items():
+                total = ops.setdefault(op, {"count": 0, "total_ms": 0.0})
+                total["count"] += op_stats["count"]
+                total["total_ms"] = round(total["total_ms"] + op_stats["total_ms"], 3)
+
+        return {
+            "bus": self.bus_num,
+            "clock_hz": self.clock_hz,
+            "uptime_s": round(uptime, 3),
+            "busy_s": round(busy, 6),
+            "utilisation": round(busy / uptime, 4) if uptime else 0.0,
+            "transactions": sum(d["transactions"] for d in devices.values()),
+            "bytes": sum(d["bytes"] for d in devices.values()),
+            "errors": sum(d["errors"] for d in devices.values()),
+            "retries": sum(d["retries"] for d in devices.values()),
+            "ops": ops,
+            "devices": devices,
+        }
+
+
+def interval_stats(previous, current):
+    """
+    Rates between two ``stats()`` snapshots of the same bus.
+
+    A restarted service (uptime went backwards) is measured from its start.
+    """
+    if previous is None or current["uptime_s"] < previous["uptime_s"]:
+        previous = {}
+    elapsed = current["uptime_s"] - previous.get("uptime_s", 0.0)
+
+    def delta(key):
+        return current[key] - previous.get(key, 0)
+
+    return {
+        "interval_s": round(elapsed, 3),
+        "transactions": delta("transactions"),
+        "transactions_per_s": round(delta("transactions") / elapsed, 2) if elapsed else 0.0,
+        "bytes_per_s": round(delta("bytes") / elapsed, 2) if elapsed else 0.0,
+        "utilisation": round(delta("busy_s") / elapsed, 4) if elapsed else 0.0,
+        "errors": delta("errors"),
+        "retries": delta("retries"),
+    }
+
+
+class I2CBusService:
+    """
+    Single owner of an I2C bus with a prioritised transaction queue.
+
+    Args:
+        bus_num: I2C bus to open
+        bus: Existing SMBus-like object to use instead of opening one
+    """
+
+    def __init__(self, bus_num=I2C_BUS, bus=None):
+        self.bus_num = bus_num
+        if bus is None:
+            bus = _open_raw(bus_num)
+        self.bus = bus if isinstance(bus, MeteredBus) else MeteredBus(bus, bus_num)
+        self._queue = queue.PriorityQueue()
+        # Tie-breaker: FIFO order within a priority
+        self._seq = itertools.count()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        """Start the worker thread (idempotent)."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="i2c-bus", daemon=True)
+            self._thread.start()
+            print(f"[I2C-BUS] Serving bus {self.bus_num}")
+        return self
+
+    def stop(self, timeout=5.0):
+        """Finish queued transactions, then stop the worker and socket server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._queue.put((_PRIORITY_STOP, next(self._seq), None))
+            self._thread.join(timeout)
+            self._thread = None
+
+    # ------------------------------------------------------------------
+    # Transactions
+    # ------------------------------------------------------------------
+
+    def submit(self, priority, op, *args):
+        """
+        Queue an SMBus call.
+
+        Returns:
+            concurrent.futures.Future resolving to the call's return value
+        """
+        if op not in OPERATIONS:
+            raise ValueError(f"Unsupported I2C operation: {op}")
+        txn = _Transaction(op, args, priority)
+        self._queue.put((priority, next(self._seq), txn))
+        return txn.future
+
+    def call(self, priority, op, *args, timeout=None):
+        """Queue an SMBus call and wait for its result (raises its IOError)."""
+        return self.submit(priority, op, *args).result(timeout)
+
+    async def call_async(self, priority, op, *args):
+        """Queue an SMBus call and await its result from an event loop."""
+        return await asyncio.wrap_future(self.submit(priority, op, *args))
+
+    def client(self, priority):
+        """SMBus-like handle whose calls are queued at the given priority."""
+        return BusClient(self, priority)
+
+    def _run(self):
+        while True:
+            _, _, txn = self._queue.get()
+            if txn is None:
+                break
+            if not txn.future.set_running_or_notify_cancel():
+                continue
+
+            wait = time.perf_counter() - txn.queued_at
+            try:
+                result = self.bus.execute(
+                    txn.op, *txn.args, wait=wait,
+                    read_retries=0 if txn.priority == PRIORITY_DISCOVERY else None,
+                )
+            except Exception as e:
+                txn.future.set_exception(e)
+            else:
+                txn.future.set_result(result)
+
+    def stats(self):
+        """Queue depth plus the bus counters (see ``BusMetrics.stats``)."""
+        return {"source": "service", "queue_depth": self._queue.qsize(), **self.bus.metrics.stats()}
+
+    # ------------------------------------------------------------------
+    # Local IPC
+    # ------------------------------------------------------------------
+
+    def serve(self, path=SOCKET_PATH):
+        """Accept RemoteBus connections on a Unix socket (background thread)."""
+        if os.path.exists(path):
+            os.unlink(path)
+        self._server = _BusServer(path, _BusRequestHandler)
+        self._server.service = self
+        os.chmod(path, 0o660)
+        threading.Thread(
+            target=self._server.serve_forever, name="i2c-bus-ipc", daemon=True
+        ).start()
+        print(f"[I2C-BUS] Listening on {path}")
+
+    def execute_request(self, request):
+        """Run one IPC request dict and return the response dict."""
+        op = request.get("op")
+        if op == "stats":
+            return {"result": self.stats()}
+
+        priority = request.get("priority", PRIORITY_SENSOR)
+        priority = PRIORITIES.get(priority, priority)
+        args = request.get("args", [])
+        try:
+            if op == "i2c_rdwr":
+                return {"result": self._rdwr_remote(priority, args)}
+            return {"result": self.call(priority, op, *args)}
+        except OSError as e:
+            return {"error": e.strerror or str(e), "errno": e.errno}
+        except Exception as e:
+            return {"error": str(e)}
+
+    def _rdwr_remote(self, priority, specs):
+        """i2c_rdwr from JSON specs ["w", addr, bytes] / ["r", addr, length]."""
+        msgs = [
+            smbus2.i2c_msg.read(addr, data) if kind == "r" else smbus2.i2c_msg.write(addr, data)
+            for kind, addr, data in specs
+        ]
+        self.call(priority, "i2c_rdwr", *msgs)
+        return [list(msg) for msg in msgs if msg.flags & I2C_M_RD]
+
+
+class _BusServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _BusRequestHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line, one JSON response per line."""
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                response = self.server.service.execute_request(json.loads(line))
+            except ValueError as e:
+                response = {"error": f"Bad request: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+# =============================================================================
+# CLIENT HANDLES
+# =============================================================================
+
+class _BusHandle:
+    """SMBus-compatible methods, implemented by ``_call``."""
+
+    def read_byte(self, addr):
+        return self._call("read_byte", addr)
+
+    def write_byte(self, addr, value):
+        return self._call("write_byte", addr, value)
+
+    def write_quick(self, addr):
+        return self._call("write_quick", addr)
+
+    def read_byte_data(self, addr, register):
+        return self._call("read_byte_data", addr, register)
+
+    def write_byte_data(self, addr, register, value):
+        return self._call("write_byte_data", addr, register, value)
+
+    def read_i2c_block_data(self, addr, register, length):
+        return self._call("read_i2c_block_data", addr, register, length)
+
+    def write_i2c_block_data(self, addr, register, data):
+        return self._call("write_i2c_block_data", addr, register, list(data))
+
+    def i2c_rdwr(self, *msgs):
+        return self._call("i2c_rdwr", *msgs)
+
+
+class MeteredBus(_BusHandle):
+    """
+    SMBus wrapper that retries failed reads and records every call in
+    ``metrics``. Other attributes (``fd``, ``close``) pass through.
+    """
+
+    def __init__(self, bus, bus_num=I2C_BUS, metrics=None, read_retries=READ_RETRIES):
+        self.bus = bus
+        self.metrics = metrics or BusMetrics(bus_num)
+        self.read_retries = read_retries
+
+    def __getattr__(self, name):
+        return getattr(self.bus, name)
+
+    def execute(self, op, *args, wait=0.0, read_retries=None):
+        """Run an SMBus call, retrying failed reads."""
+        if read_retries is None:
+            read_retries = self.read_retries
+        retries = read_retries if op in READ_OPERATIONS else 0
+        attempt = 0
+        error = None
+        started = time.perf_counter()
+        while True:
+            try:
+                result = getattr(self.bus, op)(*args)
+                break
+            except OSError as e:
+                if attempt >= retries:
+                    error = e
+                    break
+                attempt += 1
+        self.metrics.record(op, args, time.perf_counter() - started, wait, attempt, error)
+        if error is not None:
+            raise error
+        return result
+
+    def _call(self, op, *args):
+        return self.execute(op, *args)
+
+    def stats(self):
+        return {"source": "direct", "queue_depth": 0, **self.metrics.stats()}
+
+
+class BusClient(_BusHandle):
+    """Handle on an in-process I2CBusService; calls block until executed."""
+
+    def __init__(self, service, priority):
+        self.service = service
+        self.priority = priority
+
+    def _call(self, op, *args):
+        return self.service.call(self.priority, op, *args)
+
+    def stats(self):
+        return self.service.stats()
+
+    def close(self):
+        # The service owns the bus
+        pass
+
+
+class RemoteBus(_BusHandle):
+    """
+    Handle on the bus service of another process, over its Unix socket.
+
+    Bus errors are raised as IOError like smbus2 does. Safe to share between
+    threads; requests on one handle are sent one at a time.
+    """
+
+    def __init__(self, priority, path=SOCKET_PATH, timeout=10.0):
+        self.priority = priority
+        self.path = path
+        self._lock = threading.Lock()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.settimeout(timeout)
+        self._sock.connect(path)
+        self._file = self._sock.makefile("rb")
+
+    def _request(self, request):
+        with self._lock:
+            self._sock.sendall(json.dumps(request).encode() + b"\n")
+            line = self._file.readline()
+        if not line:
+            raise IOError(f"I2C bus service at {self.path} closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise IOError(response.get("errno"), response["error"])
+        return response["result"]
+
+    def _call(self, op, *args):
+        if op == "i2c_rdwr":
+            return self._rdwr(args)
+        return self._request({"op": op, "args": list(args), "priority": self.priority})
+
+    def _rdwr(self, msgs):
+        specs = [
+            ["r", msg.addr, msg.len] if msg.flags & I2C_M_RD
+            else ["w", msg.addr, list(msg)]
+            for msg in msgs
+        ]
+        reads = self._request({"op": "i2c_rdwr", "args": specs, "priority": self.priority})
+        # Fill the read messages in place, as a local i2c_rdwr would
+        read_msgs = [msg for msg in msgs if msg.flags & I2C_M_RD]
+        for msg, data in zip(read_msgs, reads):
+            ctypes.memmove(msg.buf, bytes(data), len(data))
+
+    def stats(self):
+        """Counters of the remote service."""
+        return self._request({"op": "stats"})
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+def _open_raw(bus_num):
+    """The bus device itself: /dev/i2c-N, or the simulated bus."""
+    if sim_bus.enabled():
+        return sim_bus.shared_bus()
+    if smbus2 is None:
+        raise OSError("smbus2 not available")
+    return smbus2.SMBus(bus_num)
+
+
+def open_bus(priority, bus_num=I2C_BUS, path=SOCKET_PATH):
+    """
+    Get a bus handle for a component.
+
+    Connects to the bus service if one is listening on ``path``, otherwise
+    opens the bus directly (no arbitration with other processes). Either
+    way the handle has ``stats()``.
+    """
+    if os.path.exists(path):
+        try:
+            return RemoteBus(priority, path)
+        except OSError as e:
+            print(f"[I2C-BUS] Service at {path} not reachable ({e}), opening bus directly")
+    read_retries = 0 if priority == PRIORITY_DISCOVERY else READ_RETRIES
+    return MeteredBus(_open_raw(bus_num), bus_num, read_retries=read_retries)
+
+
+# =============================================================================
+# MAIN
+# =============================================================================
+
+def print_stats(stats):
+    print(f"[I2C-BUS] {stats['transactions']} transactions, {stats['bytes']} bytes, "
+          f"{stats['errors']} errors, {stats['retries']} retries, "
+          f"{stats['utilisation'] * 100:.1f}% busy, queue depth {stats['queue_depth']}")
+    for addr, device in stats["devices"].items():
+        print(f"  {addr}: {device['transactions']:7d} txns | {device['errors']:5d} errors | "
+              f"{device['retries']:5d} retries | "
+              f"avg {device['avg_ms']:.2f} ms (max {device['max_ms']:.2f}) | "
+              f"wait {device['avg_wait_ms']:.2f} ms (max {device['max_wait_ms']:.2f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XIOT Shared I2C Bus Service')
+    parser.add_argument('--bus', type=int, default=I2C_BUS,
+                        help=f'I2C bus number (default: {I2C_BUS})')
+    parser.add_argument('--socket', type=str, default=SOCKET_PATH,
+                        help=f'Unix socket path (default: {SOCKET_PATH})')
+    parser.add_argument('--stats', action='store_true',
+                        help='Print the counters of a running service and exit')
+
+    args = parser.parse_args()
+
+    if args.stats:
+        bus = RemoteBus(PRIORITY_SENSOR, args.socket)
+        print_stats(bus.stats())
+        bus.close()
+        return
+
+    service = I2CBusService(args.bus).start()
+    service.serve(args.socket)
+
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            print_stats(service.stats())
+    except KeyboardInterrupt:
+        print("\n[I2C-BUS] Stopped by user.")
+    finally:
+        service.stop()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,15 +10,34 @@ Configuration:
     - Sensor mappings (I2C address -> sensor name/type)
 """
 
+import heapq
 import json
+import logging
+import math
+import os
+import sqlite3
+import threading
 import time
 import signal
-import sys
-from datetime import datetime
+from datetime import datetime, timezone
 
-import smbus2
+import numpy as np
 import paho.mqtt.client as mqtt
 
+import adapter_protocol
+import calibration
+import i2c_bus
+import structured_log
+import wire_format
+from structured_log import sampled
+
+log = logging.getLogger("publisher")
+mqtt_log = logging.getLogger("mqtt")
+i2c_log = logging.getLogger("i2c")
+buffer_log = logging.getLogger("buffer")
+sched_log = logging.getLogger("sched")
+sensor_log = logging.getLogger("sensor")
+
 # =============================================================================
 # Configuration
 # =============================================================================
@@ -36,84 +55,302 @@ BASEBOARD_ID = "PI-001"
 I2C_BUS = 1
 
 # Sensor mappings: I2C address -> sensor configuration
-# This defines which sensors are connected to which I2C addresses
+# This defines which sensors are connected to which I2C addresses.
+# "calibration" converts the raw value in 10-bit ADC counts (see
+# calibration.py for the linear / polynomial / table forms); it is also sent
+# to the backend so stored raw values can be re-converted later.
 SENSOR_MAPPINGS = {
     0x08: {
         "name": "Temperature Sensor",
         "type": "temperature",
         "unit": "°C",
-        "conversion": lambda raw: (raw / 1023.0) * 3.3 * 100  # Example: LM35 conversion
+        # LM35: 10 mV/°C on a 3.3 V, 10-bit ADC -> 3.3 * 100 / 1023 °C per count
+        "calibration": {"kind": "linear", "scale": 0.32258, "offset": 0.0},
+        "sample_rate": 1.0,    # Hz
+        "deadband": 0.5,       # Publish only when value moves by >= 0.5 °C
+        "max_silence": 30.0,   # ...or at least every 30 seconds
     },
     # Add more sensors as needed:
     # 0x09: {
     #     "name": "Humidity Sensor",
     #     "type": "humidity",
     #     "unit": "%",
-    #     "conversion": lambda raw: (raw / 1023.0) * 100
+    #     "calibration": {"kind": "table", "points": [[0, 0.0], [1023, 100.0]]},
+    #     "sample_rate": 0.1,
+    #     "deadband_pct": 2.0,
+    # },
+    # 0x0A: {
+    #     "name": "Vibration Sensor",
+    #     "type": "vibration",
+    #     "unit": "g",
+    #     "calibration": {"kind": "linear", "scale": 0.0078125, "offset": -4.0},
+    #     "sample_rate": 100.0,
+    #     "aggregate": 5.0,    # Publish min/max/mean/RMS every 5 s instead of samples
     # },
 }
 
+# Change-only publishing defaults (overridable per sensor in SENSOR_MAPPINGS)
+#   deadband:     absolute change needed before a value is published again
+#   deadband_pct: change relative to the last published value, in percent
+#                 (at a last value of 0 only the absolute dead-band applies)
+#   max_silence:  heartbeat - republish unchanged values after this many seconds
+# With both dead-bands at 0, any change in value is published.
+DEFAULT_DEADBAND = 0.0
+DEFAULT_DEADBAND_PCT = 0.0
+DEFAULT_MAX_SILENCE = 60.0
+
 # MQTT Topics
 TOPIC_SENSOR_DATA = f"xiot/{BASEBOARD_ID}/sensors"
 TOPIC_STATUS = f"xiot/{BASEBOARD_ID}/status"
+TOPIC_CALIBRATION = f"xiot/{BASEBOARD_ID}/calibration"
+TOPIC_I2C_STATS = f"xiot/{BASEBOARD_ID}/i2c_stats"
 
-# Reading interval in seconds
+# Store-and-forward buffer used while the broker is unreachable
+BUFFER_PATH = os.environ.get(
+    "XIOT_BUFFER_PATH", os.path.expanduser("~/.xiot/publisher_buffer.db")
+)
+BUFFER_MAX_MESSAGES = 100000   # Oldest messages are dropped beyond this
+REPLAY_BATCH_SIZE = 50         # Messages sent per replay burst
+REPLAY_INTERVAL = 0.5          # Pause between replay bursts (seconds)
+
+# Reading interval in seconds (default for sensors without a "sample_rate")
 READ_INTERVAL = 1.0
 
+# Batch samples and publish them every BATCH_INTERVAL seconds as one
+# version 2 payload (base time + per-sample offsets). A sensor changing
+# status (e.g. going offline) flushes the batch at once. 0 publishes each
+# reading as soon as it is read.
+BATCH_INTERVAL = 5.0
+
+# Wire format for batched payloads: "json" or "binary" (see wire_format.py).
+# Single-sample payloads and window summaries are always JSON.
+PAYLOAD_FORMAT = os.environ.get("XIOT_PAYLOAD_FORMAT", "json")
+
+# Add trace timestamps (read and publish time, epoch ms) to live JSON
+# payloads, for the backend's end-to-end latency metrics
+TRACE_PAYLOADS = True
+
+# Longest time the main loop sleeps before re-checking for shutdown
+MAX_SLEEP = 0.5
+
+# How often scheduler statistics are printed (seconds)
+SCHEDULE_REPORT_INTERVAL = 60.0
+
+# Adapter read protocol, negotiated per address from the IDENTIFY
+# capabilities (see adapter_protocol.py)
+XIOT_MAGIC = 0xA5
+CMD_IDENTIFY = 0xFF
+IDENTIFY_SETTLE = 0.01        # Adapter processing time before the response read
+NEGOTIATE_RETRY_INTERVAL = 30.0   # Seconds between IDENTIFY attempts for silent adapters
+
+# How often I2C bus activity is published (seconds). With the I2C bus service
+# running these cover every component on the bus, otherwise only this one.
+I2C_STATS_INTERVAL = 60.0
+
 
 # =============================================================================
 # I2C Sensor Reading
 # =============================================================================
 
 class SensorReader:
-    """Reads sensor data from I2C devices."""
+    """Reads sensor data from I2C devices (through the I2C bus service if running)."""
     
-    def __init__(self, bus_num=I2C_BUS):
-        self.bus = smbus2.SMBus(bus_num)
+    def __init__(self, bus_num=I2C_BUS, mappings=SENSOR_MAPPINGS, bus=None):
+        self.bus = bus or i2c_bus.open_bus(i2c_bus.PRIORITY_SENSOR, bus_num)
+        self.mappings = mappings
         self.last_values = {}
+        # Validate calibrations up front so a typo fails at startup
+        self.calibrations = {
+            i2c_addr: calibration.validate(config.get("calibration"))
+            for i2c_addr, config in mappings.items()
+        }
+        # Read protocol per address: "block", "legacy", or None until the
+        # adapter has answered IDENTIFY
+        self.protocols = {}
+        # Channel count of each block adapter's frame
+        self.frame_channels = {}
+        self.negotiated_at = {}
+        self.last_seq = {}
+        self.reset_protocol_stats()
+        for i2c_addr in mappings:
+            self.negotiate(i2c_addr)
+    
+    def reset_protocol_stats(self):
+        """Clear block-read statistics."""
+        self.protocol_stats = {
+            "frames": 0,     # Block frames read
+            "stale": 0,      # Frames already read (adapter had no new cycle)
+            "missed": 0,     # Adapter cycles never read
+            "invalid": 0,    # Frames with a bad checksum, version or length
+        }
+    
+    def negotiate(self, i2c_addr):
+        """
+        Choose an adapter's read protocol from its IDENTIFY capabilities.
+        
+        Block adapters are read with block frames only if they have more
+        than one channel; a single-channel adapter is read the legacy way,
+        which moves a third of the bytes.
+        
+        Returns:
+            str: "block" or "legacy", or None if the adapter did not answer
+        """
+        from smbus2 import i2c_msg
+        
+        self.negotiated_at[i2c_addr] = time.monotonic()
+        try:
+            self.bus.write_byte(i2c_addr, CMD_IDENTIFY)
+            time.sleep(IDENTIFY_SETTLE)
+            read_msg = i2c_msg.read(i2c_addr, 4)
+            self.bus.i2c_rdwr(read_msg)
+            magic, _, _, capabilities = list(read_msg)
+        except IOError:
+            self.protocols[i2c_addr] = None
+            return None
+        
+        # Adapters without IDENTIFY support (plain sensor firmware) fail the
+        # magic check and keep the legacy read
+        count = 1
+        if magic == XIOT_MAGIC and capabilities & adapter_protocol.CAP_BLOCK:
+            try:
+                header = self.bus.read_i2c_block_data(
+                    i2c_addr, adapter_protocol.CMD_READ_BLOCK, adapter_protocol.HEADER_LENGTH
+                )
+                count = adapter_protocol.decode_header(header)
+            except IOError:
+                self.protocols[i2c_addr] = None
+                return None
+            except adapter_protocol.FrameError as e:
+                sampled(i2c_log, logging.WARNING, i2c_addr, "0x%02X: bad block header (%s)",
+                        i2c_addr, e)
+        protocol = "block" if count > 1 else "legacy"
+        self.protocols[i2c_addr] = protocol
+        self.frame_channels[i2c_addr] = count
+        self.last_seq.pop(i2c_addr, None)
+        i2c_log.info("0x%02X: %s read protocol (%d channel%s)", i2c_addr, protocol,
+                     count, "" if count == 1 else "s")
+        return protocol
     
     def read_sensor(self, i2c_addr):
         """
-        Read 10-bit sensor value from ATtiny85 adapter.
+        Read 10-bit sensor value from ATtiny85 adapter (legacy protocol).
         
         Returns:
             int: Raw sensor value (0-1023) or None on error
         """
         try:
             data = self.bus.read_i2c_block_data(i2c_addr, 0, 2)
-            raw_value = data[0] | ((data[1] & 0x03) << 8)
+            raw_value = adapter_protocol.decode_legacy(data)
             self.last_values[i2c_addr] = raw_value
             return raw_value
         except IOError:
             return None
     
+    def read_frame(self, i2c_addr):
+        """
+        Read all channels of a block adapter in one transaction.
+        
+        Returns:
+            dict: Decoded frame (see adapter_protocol.decode_frame) or None
+        """
+        length = adapter_protocol.frame_length(self.frame_channels[i2c_addr])
+        try:
+            data = self.bus.read_i2c_block_data(i2c_addr, adapter_protocol.CMD_READ_BLOCK, length)
+            frame = adapter_protocol.decode_frame(data)
+        except IOError:
+            return None
+        except adapter_protocol.FrameError as e:
+            # Renegotiate in case the adapter was swapped or reflashed
+            self.protocol_stats["invalid"] += 1
+            self.protocols[i2c_addr] = None
+            sampled(i2c_log, logging.WARNING, i2c_addr, "0x%02X: bad block frame (%s)", i2c_addr, e)
+            return None
+        
+        self.protocol_stats["frames"] += 1
+        previous = self.last_seq.get(i2c_addr)
+        if previous is not None:
+            gap = adapter_protocol.seq_gap(previous, frame["seq"])
+            if gap == 0:
+                self.protocol_stats["stale"] += 1
+            else:
+                self.protocol_stats["missed"] += gap - 1
+        self.last_seq[i2c_addr] = frame["seq"]
+        self.last_values[i2c_addr] = frame["channels"][0]
+        return frame
+    
+    def read_sample(self, i2c_addr):
+        """
+        Read one sample from an adapter with a single bus transaction.
+        
+        Returns:
+            dict: raw (the value to calibrate, in 10-bit units; the
+            oversampled reading on block adapters, so it can be fractional)
+            and channels; None on error
+        """
+        protocol = self.protocols.get(i2c_addr)
+        if protocol is None:
+            # Retry IDENTIFY now and then; read the legacy way in between
+            if time.monotonic() - self.negotiated_at.get(i2c_addr, 0.0) >= NEGOTIATE_RETRY_INTERVAL:
+                protocol = self.negotiate(i2c_addr)
+        
+        if protocol == "block":
+            frame = self.read_frame(i2c_addr)
+            if frame is None:
+                return None
+            return {
+                "raw": frame["oversampled"] / (1 << adapter_protocol.OVERSAMPLE_EXTRA_BITS),
+                "channels": frame["channels"],
+            }
+        
+        raw_value = self.read_sensor(i2c_addr)
+        if raw_value is None:
+            return None
+        return {"raw": raw_value, "channels": None}
+    
     def read_all_sensors(self):
         """
         Read all configured sensors.
         
+        Returns:
+            list: List of sensor reading dictionaries
+        """
+        return self.read_sensors(self.mappings)
+    
+    def read_sensors(self, i2c_addrs):
+        """
+        Read a subset of the configured sensors.
+        
+        Args:
+            i2c_addrs: Iterable of I2C addresses present in the mappings
+        
         Returns:
             list: List of sensor reading dictionaries
         """
         readings = []
         timestamp = datetime.utcnow().isoformat() + "Z"
         
-        for i2c_addr, config in SENSOR_MAPPINGS.items():
-            raw_value = self.read_sensor(i2c_addr)
+        for i2c_addr in i2c_addrs:
+            config = self.mappings[i2c_addr]
+            sample = self.read_sample(i2c_addr)
             
-            if raw_value is not None:
-                # Apply conversion function to get actual value
-                converted_value = config["conversion"](raw_value)
+            if sample is not None:
+                # Apply the sensor's calibration to get the actual value
+                converted_value = calibration.convert(self.calibrations[i2c_addr], sample["raw"])
                 
-                readings.append({
+                reading = {
                     "i2c_address": f"0x{i2c_addr:02X}",
                     "name": config["name"],
                     "type": config["type"],
-                    "raw_value": raw_value,
+                    "raw_value": sample["raw"],
                     "value": round(converted_value, 2),
                     "unit": config["unit"],
                     "status": "active",
                     "timestamp": timestamp
-                })
+                }
+                if sample["channels"] is not None:
+                    # All raw channels of a block adapter
+                    reading["channels"] = sample["channels"]
+                readings.append(reading)
             else:
                 readings.append({
                     "i2c_address": f"0x{i2c_addr:02X}",
@@ -128,23 +365,453 @@ class SensorReader:
         
         return readings
     
+    def bus_stats(self):
+        """Cumulative I2C bus counters (see i2c_bus.BusMetrics.stats)."""
+        return self.bus.stats()
+    
     def close(self):
         """Close the I2C bus."""
         self.bus.close()
 
 
+# =============================================================================
+# Sampling Schedule
+# =============================================================================
+
+class SampleScheduler:
+    """
+    Deadline-based scheduler that polls each sensor at its own sample rate.
+    
+    Next-due times are kept in a heap and advanced by whole periods from the
+    previous deadline, not from when the read finished, so the schedule does
+    not drift. When the bus cannot keep up, missed periods are skipped rather
+    than replayed in a burst and the overrun is recorded.
+    """
+    
+    def __init__(self, sensor_reader, mappings=SENSOR_MAPPINGS, clock=time.monotonic):
+        self.sensor_reader = sensor_reader
+        self.clock = clock
+        self.periods = {
+            i2c_addr: 1.0 / config.get("sample_rate", 1.0 / READ_INTERVAL)
+            for i2c_addr, config in mappings.items()
+        }
+        start = clock()
+        self.heap = [(start, i2c_addr) for i2c_addr in mappings]
+        heapq.heapify(self.heap)
+        self.reset_stats()
+    
+    def reset_stats(self):
+        """Clear overrun statistics."""
+        self.samples = 0
+        self.late = 0          # Samples started more than one period late
+        self.skipped = 0       # Periods dropped to catch up
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+    
+    def time_until_due(self):
+        """Seconds until the next sensor is due (0 if one is overdue)."""
+        if not self.heap:
+            return MAX_SLEEP
+        return max(0.0, self.heap[0][0] - self.clock())
+    
+    def wait(self, max_wait=MAX_SLEEP):
+        """Sleep until the next deadline, but never longer than max_wait."""
+        delay = min(self.time_until_due(), max_wait)
+        if delay > 0:
+            time.sleep(delay)
+    
+    def run_due(self):
+        """
+        Read every sensor whose deadline has passed.
+        
+        Returns:
+            list: Sensor reading dictionaries for the sensors that were due
+        """
+        now = self.clock()
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, i2c_addr = heapq.heappop(self.heap)
+            period = self.periods[i2c_addr]
+            lag = now - deadline
+            
+            self.samples += 1
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            
+            # Advance by whole periods; skip any that were missed entirely
+            missed = int(lag // period)
+            if missed:
+                self.late += 1
+                self.skipped += missed
+            heapq.heappush(self.heap, (deadline + (missed + 1) * period, i2c_addr))
+            due.append(i2c_addr)
+        
+        if not due:
+            return []
+        return self.sensor_reader.read_sensors(due)
+    
+    def report(self):
+        """Return scheduling statistics since the last reset."""
+        return {
+            "samples": self.samples,
+            "late": self.late,
+            "skipped": self.skipped,
+            "avg_lag_ms": round(self.total_lag / self.samples * 1000, 2) if self.samples else 0.0,
+            "max_lag_ms": round(self.max_lag * 1000, 2),
+        }
+
+
+# =============================================================================
+# Edge Aggregation
+# =============================================================================
+
+class AggregationWindow:
+    """NumPy sample buffer summarised once per window."""
+    
+    def __init__(self, window_seconds, sample_rate):
+        self.window_seconds = window_seconds
+        # Room for one full window plus some scheduling slack; doubled if a
+        # window brings more samples, so none are overwritten
+        self.capacity = max(1, math.ceil(window_seconds * sample_rate * 1.25))
+        self.buffer = np.empty(self.capacity, dtype=np.float64)
+        self.count = 0
+        self.window_start = None
+        self.window_start_iso = None
+    
+    def add(self, value, now, timestamp):
+        if self.window_start is None:
+            self.window_start = now
+            self.window_start_iso = timestamp
+        if self.count == self.capacity:
+            self.buffer = np.concatenate((self.buffer, np.empty(self.capacity, dtype=np.float64)))
+            self.capacity *= 2
+        self.buffer[self.count] = value
+        self.count += 1
+    
+    def is_complete(self, now):
+        return self.window_start is not None and now - self.window_start >= self.window_seconds
+    
+    def summarize(self, timestamp):
+        """Return min/max/mean/RMS/count for the window and start a new one."""
+        samples = self.buffer[:self.count]
+        summary = {
+            "window_start": self.window_start_iso,
+            "window_end": timestamp,
+            "count": int(self.count),
+            "min": float(samples.min()),
+            "max": float(samples.max()),
+            "mean": float(samples.mean()),
+            "rms": float(np.sqrt(np.mean(np.square(samples)))),
+        }
+        self.count = 0
+        self.window_start = None
+        self.window_start_iso = None
+        return summary
+
+
+class EdgeAggregator:
+    """
+    Summarises high-rate sensors on the Pi before publishing.
+    
+    Sensors with an "aggregate" window in SENSOR_MAPPINGS have their samples
+    collected into an AggregationWindow; one summary reading is emitted per
+    window. All other readings pass through unchanged.
+    """
+    
+    def __init__(self, mappings=SENSOR_MAPPINGS):
+        self.windows = {}
+        for i2c_addr, config in mappings.items():
+            if config.get("aggregate"):
+                sample_rate = config.get("sample_rate", 1.0 / READ_INTERVAL)
+                self.windows[f"0x{i2c_addr:02X}"] = AggregationWindow(
+                    config["aggregate"], sample_rate
+                )
+    
+    def process(self, readings, now=None):
+        """
+        Split readings into pass-through readings and completed summaries.
+        
+        Returns:
+            tuple: (passthrough readings, summary readings)
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        passthrough = []
+        summaries = []
+        for reading in readings:
+            window = self.windows.get(reading["i2c_address"])
+            if window is None or reading["value"] is None:
+                passthrough.append(reading)
+                continue
+            
+            # Close the previous window before this sample starts the next one
+            if window.is_complete(now):
+                summary = window.summarize(reading["timestamp"])
+                summaries.append({
+                    **reading,
+                    "raw_value": None,
+                    "value": round(summary["mean"], 4),
+                    "aggregate": summary,
+                })
+            window.add(reading["value"], now, reading["timestamp"])
+        return passthrough, summaries
+
+
+# =============================================================================
+# Dead-band Filtering
+# =============================================================================
+
+class DeadbandFilter:
+    """Drops readings that have not changed enough since they were last published."""
+    
+    def __init__(self, mappings=SENSOR_MAPPINGS):
+        self.config = {}
+        for i2c_addr, config in mappings.items():
+            self.config[f"0x{i2c_addr:02X}"] = (
+                config.get("deadband", DEFAULT_DEADBAND),
+                config.get("deadband_pct", DEFAULT_DEADBAND_PCT),
+                config.get("max_silence", DEFAULT_MAX_SILENCE),
+            )
+        # i2c_address -> (value, status, published_at)
+        self.last_published = {}
+        self.published = 0
+        self.suppressed = 0
+    
+    def should_publish(self, reading, now):
+        """Decide whether a single reading is worth publishing."""
+        key = reading["i2c_address"]
+        last = self.last_published.get(key)
+        if last is None:
+            return True
+        
+        last_value, last_status, published_at = last
+        value = reading["value"]
+        
+        if reading["status"] != last_status:
+            return True
+        
+        deadband, deadband_pct, max_silence = self.config.get(
+            key, (DEFAULT_DEADBAND, DEFAULT_DEADBAND_PCT, DEFAULT_MAX_SILENCE)
+        )
+        if now - published_at >= max_silence:
+            return True
+        if value is None or last_value is None:
+            return value != last_value
+        
+        delta = abs(value - last_value)
+        if deadband <= 0 and deadband_pct <= 0:
+            return delta > 0
+        # The relative band is empty at a last value of 0; there the absolute
+        # band decides, or any change without one
+        pct_band = abs(last_value) * deadband_pct / 100.0
+        if pct_band > 0 and delta >= pct_band:
+            return True
+        if deadband > 0:
+            return delta >= deadband
+        return pct_band == 0 and delta > 0
+    
+    def filter(self, readings, now=None):
+        """
+        Return the subset of readings that should be published.
+        
+        Args:
+            readings: List of sensor reading dictionaries
+            now: Current time in seconds (defaults to time.monotonic())
+        """
+        if now is None:
+            now = time.monotonic()
+        
+        changed = []
+        for reading in readings:
+            if self.should_publish(reading, now):
+                changed.append(reading)
+            else:
+                self.suppressed += 1
+        return changed
+    
+    def mark_published(self, readings, now=None):
+        """Record readings as delivered so later ones are compared against them."""
+        if now is None:
+            now = time.monotonic()
+        for reading in readings:
+            self.last_published[reading["i2c_address"]] = (
+                reading["value"], reading["status"], now
+            )
+        self.published += len(readings)
+
+
+# =============================================================================
+# Sample Batching
+# =============================================================================
+
+class SampleBatcher:
+    """
+    Collects samples per sensor for a batched (version 2) payload.
+    
+    Each sensor entry carries parallel lists of sample offsets in
+    milliseconds from a shared base time ("t") and values ("v"), so the
+    backend can store every sample at the time it was taken; block
+    adapters add the raw channels of each sample ("ch"). A reading
+    whose status differs from the sensor's previous one makes the batch
+    due immediately, so status transitions are not held back.
+    """
+    
+    def __init__(self, interval=BATCH_INTERVAL):
+        self.interval = interval
+        self.base_time = None
+        self.started = None
+        self.sensors = {}
+        # i2c_address -> last status added, kept across flushes
+        self.statuses = {}
+        self.status_changed = False
+    
+    def __len__(self):
+        return sum(len(entry["v"]) for entry in self.sensors.values())
+    
+    def add(self, readings, now_ms=None, now=None):
+        """Append readings taken at now_ms (epoch ms) to the batch."""
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        if self.base_time is None:
+            self.base_time = now_ms
+            self.started = time.monotonic() if now is None else now
+        
+        offset = now_ms - self.base_time
+        for reading in readings:
+            entry = self.sensors.get(reading["i2c_address"])
+            if entry is None:
+                entry = {
+                    "i2c_address": reading["i2c_address"],
+                    "name": reading["name"],
+                    "type": reading["type"],
+                    "unit": reading["unit"],
+                    "t": [],
+                    "v": [],
+                    "raw": [],
+                }
+                self.sensors[reading["i2c_address"]] = entry
+            channels = reading.get("channels")
+            if channels is not None and "ch" not in entry:
+                entry["ch"] = [None] * len(entry["v"])
+            if "ch" in entry:
+                entry["ch"].append(channels)
+            entry["t"].append(offset)
+            entry["v"].append(reading["value"])
+            entry["raw"].append(reading["raw_value"])
+            entry["status"] = reading["status"]
+            previous = self.statuses.get(reading["i2c_address"])
+            if previous is not None and previous != reading["status"]:
+                self.status_changed = True
+            self.statuses[reading["i2c_address"]] = reading["status"]
+    
+    def is_due(self, now=None):
+        if self.started is None:
+            return False
+        if self.status_changed:
+            return True
+        if now is None:
+            now = time.monotonic()
+        return now - self.started >= self.interval
+    
+    def flush(self):
+        """Return (base_time, sensors) for the current batch and start a new one."""
+        batch = (self.base_time, list(self.sensors.values()))
+        self.base_time = None
+        self.started = None
+        self.sensors = {}
+        self.status_changed = False
+        return batch
+
+
+# =============================================================================
+# Offline Buffer
+# =============================================================================
+
+class OfflineBuffer:
+    """
+    Disk-backed FIFO of MQTT messages that could not be delivered.
+    
+    Messages are kept in a SQLite database in WAL mode so appends are cheap
+    and survive restarts. Once more than max_messages are stored, the oldest
+    are discarded.
+    """
+    
+    def __init__(self, path=BUFFER_PATH, max_messages=BUFFER_MAX_MESSAGES):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB NOT NULL)"
+        )
+        self.count = self.db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.dropped = 0
+    
+    def __len__(self):
+        return self.count
+    
+    def append(self, topic, payload):
+        """Store one message, evicting the oldest if the buffer is full."""
+        with self._lock:
+            self.db.execute("INSERT INTO outbox (topic, payload) VALUES (?, ?)", (topic, payload))
+            self.count += 1
+            overflow = self.count - self.max_messages
+            if overflow > 0:
+                cursor = self.db.execute(
+                    "DELETE FROM outbox WHERE id IN "
+                    "(SELECT id FROM outbox ORDER BY id LIMIT ?)", (overflow,)
+                )
+                self.count -= cursor.rowcount
+                self.dropped += cursor.rowcount
+    
+    def peek(self, limit):
+        """Return up to limit oldest messages as (id, topic, payload) tuples."""
+        with self._lock:
+            return self.db.execute(
+                "SELECT id, topic, payload FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+    
+    def remove(self, ids):
+        """Delete delivered messages (ids already evicted are skipped)."""
+        if not ids:
+            return
+        with self._lock:
+            cursor = self.db.executemany("DELETE FROM outbox WHERE id = ?", [(i,) for i in ids])
+            self.count -= cursor.rowcount
+    
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
 # =============================================================================
 # MQTT Client
 # =============================================================================
 
+def _epoch_ms(timestamp):
+    """Epoch milliseconds of a reading timestamp ("...Z", UTC)."""
+    parsed = datetime.fromisoformat(timestamp.rstrip("Z")).replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
 class MQTTPublisher:
     """Publishes sensor data to MQTT broker."""
     
-    def __init__(self, broker, port, baseboard_id):
+    def __init__(self, broker, port, baseboard_id, buffer=None, calibrations=None):
         self.broker = broker
         self.port = port
         self.baseboard_id = baseboard_id
+        self.buffer = buffer
+        self.calibrations = calibrations or {}
         self.connected = False
+        self._replay_thread = None
         
         # Create MQTT client
         self.client = mqtt.Client(client_id=f"xiot-{baseboard_id}")
@@ -158,16 +825,19 @@ class MQTTPublisher:
     def _on_connect(self, client, userdata, flags, rc):
         """Callback when connected to broker."""
         if rc == 0:
-            print(f"[MQTT] Connected to broker at {self.broker}:{self.port}")
+            mqtt_log.info("Connected to broker at %s:%s", self.broker, self.port)
             self.connected = True
             # Publish online status
             self._publish_status("online")
+            self._publish_calibration()
+            # Deliver anything collected while offline
+            self._start_replay()
         else:
-            print(f"[MQTT] Connection failed with code {rc}")
+            mqtt_log.error("Connection failed with code %s", rc)
     
     def _on_disconnect(self, client, userdata, rc):
         """Callback when disconnected from broker."""
-        print(f"[MQTT] Disconnected from broker (rc={rc})")
+        mqtt_log.warning("Disconnected from broker (rc=%s)", rc)
         self.connected = False
     
     def connect(self):
@@ -181,7 +851,9 @@ class MQTTPublisher:
                 retain=True
             )
             
-            self.client.connect(self.broker, self.port, keepalive=60)
+            # Connect asynchronously so the network loop keeps retrying
+            # while readings are buffered during an outage
+            self.client.connect_async(self.broker, self.port, keepalive=60)
             self.client.loop_start()
             
             # Wait for connection
@@ -192,7 +864,7 @@ class MQTTPublisher:
             
             return self.connected
         except Exception as e:
-            print(f"[MQTT] Connection error: {e}")
+            mqtt_log.error("Connection error: %s", e)
             return False
     
     def _publish_status(self, status):
@@ -204,25 +876,145 @@ class MQTTPublisher:
         }
         self.client.publish(TOPIC_STATUS, json.dumps(payload), qos=1, retain=True)
     
-    def publish_sensor_data(self, readings):
+    def _publish_calibration(self):
+        """Publish the calibration in use for each sensor (retained)."""
+        if not self.calibrations:
+            return
+        payload = {
+            "baseboard_id": self.baseboard_id,
+            "sensors": {
+                f"0x{i2c_addr:02X}": spec for i2c_addr, spec in self.calibrations.items()
+            },
+        }
+        self.client.publish(TOPIC_CALIBRATION, json.dumps(payload), qos=1, retain=True)
+    
+    def publish_i2c_stats(self, stats, interval):
         """
-        Publish sensor readings to MQTT.
+        Publish I2C bus activity.
         
         Args:
-            readings: List of sensor reading dictionaries
+            stats: Cumulative counters from the bus handle
+            interval: Rates since the previous report (i2c_bus.interval_stats)
+        
+        Returns:
+            bool: True if sent; stats are not buffered while offline
         """
         if not self.connected:
-            print("[MQTT] Not connected, skipping publish")
             return False
+        payload = {
+            "baseboard_id": self.baseboard_id,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "source": stats["source"],
+            "bus": stats["bus"],
+            "clock_hz": stats["clock_hz"],
+            "queue_depth": stats["queue_depth"],
+            **interval,
+            "ops": stats["ops"],
+            "devices": stats["devices"],
+        }
+        self.client.publish(TOPIC_I2C_STATS, json.dumps(payload), qos=0)
+        return True
+    
+    def publish_sensor_data(self, readings):
+        """
+        Publish sensor readings to MQTT.
         
+        Readings that cannot be delivered are kept in the offline buffer
+        (if configured) and replayed once the broker is reachable again.
+        
+        Args:
+            readings: List of sensor reading dictionaries
+        """
         payload = {
             "baseboard_id": self.baseboard_id,
             "sensors": readings,
             "timestamp": datetime.utcnow().isoformat() + "Z"
         }
+        read_times = [_epoch_ms(r["timestamp"]) for r in readings if r.get("timestamp")]
+        return self._publish_payload(payload, max(read_times, default=None))
+    
+    def publish_sensor_batch(self, base_time, sensors):
+        """
+        Publish a batched (version 2) payload with many samples per sensor.
+        
+        Args:
+            base_time: Epoch milliseconds that sample offsets are relative to
+            sensors: List of per-sensor dicts with "t" (ms offsets) and "v" (values)
+        """
+        payload = {
+            "baseboard_id": self.baseboard_id,
+            "version": 2,
+            "base_time": base_time,
+            "sensors": sensors,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        # The newest sample in the batch
+        offsets = [max(s["t"]) for s in sensors if s.get("t")]
+        return self._publish_payload(payload, base_time + max(offsets, default=0))
+    
+    def _encode(self, payload):
+        """Serialise a payload in the configured wire format."""
+        if PAYLOAD_FORMAT == "binary" and payload.get("version") == 2:
+            return wire_format.encode_binary(payload)
+        return json.dumps(payload)
+    
+    def _publish_payload(self, payload, read_ms=None):
+        """
+        Send a sensors payload, or buffer it if the broker is unreachable.
+        
+        read_ms is when the newest reading in it was taken (epoch ms).
+        """
+        if self.connected:
+            if TRACE_PAYLOADS:
+                payload["trace"] = {"read": read_ms, "publish": int(time.time() * 1000)}
+            result = self.client.publish(TOPIC_SENSOR_DATA, self._encode(payload), qos=0)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                return True
+            payload.pop("trace", None)
+        
+        if self.buffer is None:
+            sampled(mqtt_log, logging.WARNING, "skip", "Not connected, skipping publish")
+            return False
+        
+        payload["backfill"] = True
+        self.buffer.append(TOPIC_SENSOR_DATA, self._encode(payload))
+        return False
+    
+    def _start_replay(self):
+        """Start replaying buffered messages in the background."""
+        if not self.buffer or not len(self.buffer):
+            return
+        if self._replay_thread and self._replay_thread.is_alive():
+            return
+        self._replay_thread = threading.Thread(target=self._replay, daemon=True)
+        self._replay_thread.start()
+    
+    def _replay(self):
+        """Send buffered messages in rate-limited bursts, oldest first."""
+        buffer_log.info("Replaying %d buffered messages", len(self.buffer))
+        sent = 0
+        while self.connected:
+            batch = self.buffer.peek(REPLAY_BATCH_SIZE)
+            if not batch:
+                break
+            
+            delivered = []
+            for msg_id, topic, payload in batch:
+                info = self.client.publish(topic, payload, qos=1)
+                if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                    break
+                info.wait_for_publish(timeout=5)
+                if not info.is_published():
+                    break
+                delivered.append(msg_id)
+            
+            self.buffer.remove(delivered)
+            sent += len(delivered)
+            if len(delivered) < len(batch):
+                break
+            time.sleep(REPLAY_INTERVAL)
         
-        result = self.client.publish(TOPIC_SENSOR_DATA, json.dumps(payload), qos=0)
-        return result.rc == mqtt.MQTT_ERR_SUCCESS
+        buffer_log.info("Replayed %d messages, %d remaining", sent, len(self.buffer))
     
     def disconnect(self):
         """Disconnect from broker."""
@@ -237,23 +1029,27 @@ class MQTTPublisher:
 
 def main():
     """Main loop - read sensors and publish to MQTT."""
-    print("=" * 50)
-    print("XIOT Sensor MQTT Publisher")
-    print(f"Baseboard ID: {BASEBOARD_ID}")
-    print(f"MQTT Broker: {MQTT_BROKER}:{MQTT_PORT}")
-    print(f"Sensors configured: {len(SENSOR_MAPPINGS)}")
-    print("=" * 50)
+    structured_log.setup_logging()
+    log.info("XIOT Sensor MQTT Publisher", extra=structured_log.fields(
+        baseboard=BASEBOARD_ID, broker=f"{MQTT_BROKER}:{MQTT_PORT}", sensors=len(SENSOR_MAPPINGS)
+    ))
     
     # Initialize components
     sensor_reader = SensorReader()
-    mqtt_publisher = MQTTPublisher(MQTT_BROKER, MQTT_PORT, BASEBOARD_ID)
+    offline_buffer = OfflineBuffer()
+    mqtt_publisher = MQTTPublisher(
+        MQTT_BROKER, MQTT_PORT, BASEBOARD_ID, offline_buffer, sensor_reader.calibrations
+    )
+    scheduler = SampleScheduler(sensor_reader)
+    aggregator = EdgeAggregator()
+    deadband = DeadbandFilter()
+    batcher = SampleBatcher()
     
     # Handle graceful shutdown
     running = True
     
     def signal_handler(sig, frame):
         nonlocal running
-        print("\n[INFO] Shutting down...")
         running = False
     
     signal.signal(signal.SIGINT, signal_handler)
@@ -261,40 +1057,109 @@ def main():
     
     # Connect to MQTT broker
     if not mqtt_publisher.connect():
-        print("[ERROR] Failed to connect to MQTT broker")
-        sys.exit(1)
+        mqtt_log.warning("Broker unreachable - buffering readings until it is back")
+    if len(offline_buffer):
+        buffer_log.info("%d messages pending from a previous run", len(offline_buffer))
     
-    print(f"[INFO] Starting sensor readings (interval: {READ_INTERVAL}s)")
-    print("-" * 50)
+    rates = ", ".join(
+        f"0x{addr:02X}@{1.0 / period:g}Hz" for addr, period in scheduler.periods.items()
+    )
+    log.info("Starting sensor readings (%s)", rates)
+    
+    last_report = time.monotonic()
+    last_bus_report = time.monotonic()
+    previous_bus_stats = None
+    
+    def publish(delivered, count):
+        if delivered:
+            sampled(mqtt_log, logging.DEBUG, "published", "Published %d sensor readings", count,
+                    deadband_suppressed=deadband.suppressed)
+        else:
+            sampled(buffer_log, logging.DEBUG, "stored", "Stored %d sensor readings", count,
+                    pending=len(offline_buffer))
     
     # Main loop
     while running:
         try:
-            # Read all sensors
-            readings = sensor_reader.read_all_sensors()
+            scheduler.wait()
             
-            # Print readings
-            for r in readings:
+            # Read every sensor whose deadline has passed
+            readings = scheduler.run_due()
+            
+            # Fold high-rate sensors into window summaries, then keep
+            # only readings that moved past their dead-band
+            readings, summaries = aggregator.process(readings)
+            changed = deadband.filter(readings)
+            
+            for r in changed + summaries:
                 if r["status"] == "active":
-                    print(f"[{r['i2c_address']}] {r['name']}: {r['value']} {r['unit']}")
+                    sampled(sensor_log, logging.DEBUG, r["i2c_address"], "[%s] %s: %s %s",
+                            r["i2c_address"], r["name"], r["value"], r["unit"])
+                else:
+                    sampled(sensor_log, logging.WARNING, r["i2c_address"], "[%s] %s: OFFLINE",
+                            r["i2c_address"], r["name"])
+            
+            # Buffered readings count as published: they will be replayed
+            if changed:
+                deadband.mark_published(changed)
+                if BATCH_INTERVAL > 0:
+                    batcher.add(changed)
                 else:
-                    print(f"[{r['i2c_address']}] {r['name']}: OFFLINE")
+                    publish(mqtt_publisher.publish_sensor_data(changed), len(changed))
             
-            # Publish to MQTT
-            if mqtt_publisher.publish_sensor_data(readings):
-                print(f"[MQTT] Published {len(readings)} sensor readings")
+            if summaries:
+                publish(mqtt_publisher.publish_sensor_data(summaries), len(summaries))
             
-            print("-" * 50)
-            time.sleep(READ_INTERVAL)
+            if batcher.is_due():
+                count = len(batcher)
+                base_time, sensors = batcher.flush()
+                publish(mqtt_publisher.publish_sensor_batch(base_time, sensors), count)
+            
+            # Periodically report how well the bus keeps up with the schedule
+            if time.monotonic() - last_report >= SCHEDULE_REPORT_INTERVAL:
+                stats = scheduler.report()
+                sched_log.info("Schedule report", extra=structured_log.fields(
+                    samples=stats['samples'], late=stats['late'], skipped=stats['skipped'],
+                    avg_lag_ms=stats['avg_lag_ms'], max_lag_ms=stats['max_lag_ms'],
+                    log_dropped=structured_log.dropped_records(),
+                ))
+                scheduler.reset_stats()
+                protocol = sensor_reader.protocol_stats
+                if protocol["frames"] or protocol["invalid"]:
+                    i2c_log.info("Block read report", extra=structured_log.fields(
+                        frames=protocol['frames'], stale=protocol['stale'],
+                        missed=protocol['missed'], invalid=protocol['invalid'],
+                    ))
+                sensor_reader.reset_protocol_stats()
+                last_report = time.monotonic()
+            
+            if time.monotonic() - last_bus_report >= I2C_STATS_INTERVAL:
+                bus_stats = sensor_reader.bus_stats()
+                interval = i2c_bus.interval_stats(previous_bus_stats, bus_stats)
+                mqtt_publisher.publish_i2c_stats(bus_stats, interval)
+                i2c_log.info("%s txn/s, %s B/s, %.1f%% busy", interval['transactions_per_s'],
+                             interval['bytes_per_s'], interval['utilisation'] * 100,
+                             extra=structured_log.fields(errors=interval['errors'],
+                                                         retries=interval['retries']))
+                previous_bus_stats = bus_stats
+                last_bus_report = time.monotonic()
             
         except Exception as e:
-            print(f"[ERROR] {e}")
+            sampled(log, logging.ERROR, "loop", "Main loop error: %s", e)
             time.sleep(READ_INTERVAL)
     
+    log.info("Shutting down...")
+    
+    # Send whatever is left in the current batch
+    if len(batcher):
+        base_time, sensors = batcher.flush()
+        mqtt_publisher.publish_sensor_batch(base_time, sensors)
+    
     # Cleanup
     sensor_reader.close()
     mqtt_publisher.disconnect()
-    print("[INFO] Shutdown complete")
+    offline_buffer.close()
+    log.info("Shutdown complete")
 
 
 if __name__ == "__main__":
@@ -8,6 +8,10 @@ This server handles:
 3. Audio from Interface to Pi (WebM via WebSocket) - WS endpoint /ws/audio
 4. LCD display commands via MQTT - Subscribe to lcd/display topic
 5. Sensor data publishing via MQTT
+6. Device discovery triggered via MQTT (runs in-process)
+
+I2C transactions go through the shared I2C bus service (i2c_bus.py) when
+it is running; otherwise the bus is opened directly.
 
 Requirements:
     pip install aiohttp paho-mqtt Pillow numpy spidev gpiozero
@@ -19,7 +23,6 @@ Run with:
 import asyncio
 import json
 import subprocess
-import sys
 import time
 import threading
 import signal
@@ -31,6 +34,16 @@ from aiohttp import web
 # MQTT
 import paho.mqtt.client as mqtt
 
+import i2c_bus
+import sim_bus
+
+# Device discovery runs in-process
+try:
+    import device_discovery
+except ImportError as e:
+    device_discovery = None
+    print(f"[WARN] Device discovery unavailable: {e}")
+
 # Check if running on Pi (for hardware features)
 try:
     import spidev
@@ -59,10 +72,24 @@ MQTT_LCD_TOPIC = "lcd/display"
 MQTT_SENSOR_TOPIC = "xiot/PI-001/sensors"
 MQTT_ACTUATOR_TOPIC = "xiot/PI-001/actuators"
 MQTT_DISCOVERY_TOPIC = "xiot/PI-001/discover"  # Trigger device discovery
+MQTT_DISCOVERY_STATUS_TOPIC = "xiot/PI-001/discovery/status"  # Progress and results
 
 # I2C Configuration
 I2C_BUS = 1
 
+# Camera: one libcamera-vid process writes an MJPEG stream to stdout and is
+# shared by all /video clients
+VIDEO_WIDTH = 640
+VIDEO_HEIGHT = 480
+VIDEO_FPS = 30
+CAMERA_COMMAND = [
+    "libcamera-vid", "-n", "-t", "0", "--codec", "mjpeg",
+    "--width", str(VIDEO_WIDTH), "--height", str(VIDEO_HEIGHT),
+    "--framerate", str(VIDEO_FPS), "-o", "-",
+]
+CAMERA_RETRY_INTERVAL = 5.0   # Seconds before restarting a failed camera process
+CAMERA_IDLE_TIMEOUT = 10.0    # Stop the camera this long after the last client leaves
+
 # Audio device (find with: arecord -l)
 MIC_DEVICE = "plughw:3,0"  # Adjust based on your setup
 
@@ -299,6 +326,194 @@ class LCDManager:
 # VIDEO STREAMING (MJPEG)
 # =============================================================================
 
+JPEG_SOI = b"\xff\xd8"
+JPEG_EOI = b"\xff\xd9"
+
+
+class FrameHub:
+    """
+    Latest-frame slot shared by all video clients.
+    
+    The producer replaces the frame and bumps a sequence number; clients
+    wait on an asyncio.Condition for a sequence newer than the last one they
+    sent. A client that falls behind gets the newest frame and skips the
+    ones in between, so a slow viewer never holds up the camera or other
+    viewers. Every client is sent the same bytes objects.
+    """
+    
+    def __init__(self):
+        self.seq = 0
+        self.frame = None       # Latest JPEG
+        self.header = None      # Its multipart part header, built once
+        self._condition = asyncio.Condition()
+    
+    async def publish(self, frame):
+        """Replace the latest frame and wake waiting clients."""
+        header = (
+            b"--frame\r\n"
+            b"Content-Type: image/jpeg\r\n"
+            b"Content-Length: " + str(len(frame)).encode() + b"\r\n\r\n"
+        )
+        async with self._condition:
+            self.frame = frame
+            self.header = header
+            self.seq += 1
+            self._condition.notify_all()
+    
+    def clear(self):
+        """Drop the latest frame so new clients wait for a fresh one."""
+        self.frame = None
+        self.header = None
+    
+    async def next_frame(self, seq):
+        """
+        Wait for a frame newer than seq.
+        
+        Returns:
+            tuple: (seq, header, frame) of the latest frame
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.seq > seq and self.frame is not None)
+            return self.seq, self.header, self.frame
+
+
+class CameraCapture:
+    """
+    Single camera capture shared by all video clients.
+    
+    A producer task runs CAMERA_COMMAND and splits its MJPEG output into
+    JPEG frames published to a FrameHub, which clients read from. The
+    camera starts with the first client and stops CAMERA_IDLE_TIMEOUT after
+    the last one leaves.
+    """
+    
+    def __init__(self):
+        self.proc = None
+        self.hub = FrameHub()
+        self.clients = 0
+        self._task = None
+        self._idle_since = None
+        self._placeholder = None
+    
+    def add_client(self):
+        """Register a client and make sure the producer is running."""
+        self.clients += 1
+        self._idle_since = None
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    def remove_client(self):
+        self.clients -= 1
+        if self.clients <= 0:
+            self.clients = 0
+            self._idle_since = time.monotonic()
+    
+    def _idle(self):
+        return (
+            self.clients == 0
+            and self._idle_since is not None
+            and time.monotonic() - self._idle_since >= CAMERA_IDLE_TIMEOUT
+        )
+    
+    async def _run(self):
+        """Keep one capture process running while there are clients."""
+        while not self._idle():
+            try:
+                self.proc = await asyncio.create_subprocess_exec(
+                    *CAMERA_COMMAND,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.DEVNULL
+                )
+            except OSError as e:
+                print(f"[VIDEO] Camera unavailable: {e}")
+            else:
+                print(f"[VIDEO] Camera capture started ({VIDEO_WIDTH}x{VIDEO_HEIGHT} @ {VIDEO_FPS} FPS)")
+                try:
+                    ended = await self._read_frames(self.proc.stdout)
+                finally:
+                    await self._terminate()
+                if not ended:
+                    continue
+                print("[VIDEO] Camera capture exited")
+            
+            await self._publish_placeholder()
+            await asyncio.sleep(CAMERA_RETRY_INTERVAL)
+        
+        self.hub.clear()
+        print("[VIDEO] Camera capture stopped (no clients)")
+    
+    async def _read_frames(self, stream):
+        """
+        Split the MJPEG byte stream into frames at the JPEG SOI/EOI markers.
+        
+        Returns:
+            bool: True if the stream ended, False if stopped for lack of clients
+        """
+        buf = bytearray()
+        scan = 0
+        while not self._idle():
+            chunk = await stream.read(65536)
+            if not chunk:
+                return True
+            buf += chunk
+            while True:
+                start = buf.find(JPEG_SOI)
+                if start < 0:
+                    # Keep a trailing 0xFF that may begin the next marker
+                    del buf[:-1]
+                    scan = 0
+                    break
+                end = buf.find(JPEG_EOI, max(start + 2, scan))
+                if end < 0:
+                    del buf[:start]
+                    scan = max(len(buf) - 1, 2)
+                    break
+                await self.hub.publish(bytes(buf[start:end + 2]))
+                del buf[:end + 2]
+                scan = 0
+        return False
+    
+    async def _publish_placeholder(self):
+        """Show a "No Camera" frame while the camera is unavailable."""
+        if self._placeholder is None:
+            try:
+                import io
+                from PIL import Image, ImageDraw
+            except ImportError:
+                return
+            img = Image.new('RGB', (VIDEO_WIDTH, VIDEO_HEIGHT), color='gray')
+            draw = ImageDraw.Draw(img)
+            draw.text((VIDEO_WIDTH // 2 - 40, VIDEO_HEIGHT // 2 - 20), "No Camera", fill='white')
+            buf = io.BytesIO()
+            img.save(buf, format='JPEG')
+            self._placeholder = buf.getvalue()
+        await self.hub.publish(self._placeholder)
+    
+    async def _terminate(self):
+        proc, self.proc = self.proc, None
+        if proc is None or proc.returncode is not None:
+            return
+        proc.terminate()
+        try:
+            await asyncio.wait_for(proc.wait(), timeout=2)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+    
+    async def stop(self):
+        """Stop the producer and the capture process."""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._terminate()
+
+
+camera_capture = CameraCapture()
+
+
 async def video_stream_handler(request):
     """Handle MJPEG video stream requests"""
     response = web.StreamResponse(
@@ -313,36 +528,29 @@ async def video_stream_handler(request):
     await response.prepare(request)
 
     print(f"[VIDEO] Client connected: {request.remote}")
+    camera_capture.add_client()
 
+    seq = 0
+    sent = skipped = 0
     try:
         while True:
-            # Capture one JPEG frame using libcamera
-            try:
-                frame = subprocess.check_output(
-                    "libcamera-still -n --width 640 --height 480 -o - --immediate --timeout 1",
-                    shell=True,
-                    stderr=subprocess.DEVNULL
-                )
-            except subprocess.CalledProcessError:
-                # Fallback: create a placeholder frame
-                from PIL import Image
-                import io
-                img = Image.new('RGB', (640, 480), color='gray')
-                draw = ImageDraw.Draw(img)
-                draw.text((200, 220), "No Camera", fill='white')
-                buf = io.BytesIO()
-                img.save(buf, format='JPEG')
-                frame = buf.getvalue()
-
-            await response.write(b"--frame\r\n")
-            await response.write(b"Content-Type: image/jpeg\r\n\r\n")
+            # Always the newest frame: frames published while the previous
+            # write was in progress are skipped
+            latest, header, frame = await camera_capture.hub.next_frame(seq)
+            if seq:
+                skipped += latest - seq - 1
+            seq = latest
+            
+            await response.write(header)
             await response.write(frame)
             await response.write(b"\r\n")
-            
-            await asyncio.sleep(0.033)  # ~30 FPS
+            sent += 1
 
     except (ConnectionResetError, asyncio.CancelledError):
-        print(f"[VIDEO] Client disconnected: {request.remote}")
+        print(f"[VIDEO] Client disconnected: {request.remote} "
+              f"({sent} frames sent, {skipped} skipped)")
+    finally:
+        camera_capture.remove_client()
     
     return response
 
@@ -504,9 +712,12 @@ class ActuatorController:
     
     def __init__(self):
         self.bus = None
-        if ON_PI and smbus2:
+        # Held for every bus transaction; shared with in-process discovery
+        # when the bus is opened directly
+        self.lock = threading.Lock()
+        if (ON_PI and smbus2) or sim_bus.enabled():
             try:
-                self.bus = smbus2.SMBus(I2C_BUS)
+                self.bus = i2c_bus.open_bus(i2c_bus.PRIORITY_ACTUATOR, I2C_BUS)
                 print(f"[ACTUATOR] I2C bus {I2C_BUS} initialized")
             except Exception as e:
                 print(f"[ACTUATOR] Failed to initialize I2C: {e}")
@@ -537,13 +748,16 @@ class ActuatorController:
         
         try:
             if command == 'on':
-                self.bus.write_byte(addr, self.CMD_ON)
+                with self.lock:
+                    self.bus.write_byte(addr, self.CMD_ON)
                 print(f"[ACTUATOR] Sent ON to 0x{addr:02X}")
             elif command == 'off':
-                self.bus.write_byte(addr, self.CMD_OFF)
+                with self.lock:
+                    self.bus.write_byte(addr, self.CMD_OFF)
                 print(f"[ACTUATOR] Sent OFF to 0x{addr:02X}")
             elif command == 'toggle':
-                self.bus.write_byte(addr, self.CMD_TOGGLE)
+                with self.lock:
+                    self.bus.write_byte(addr, self.CMD_TOGGLE)
                 print(f"[ACTUATOR] Sent TOGGLE to 0x{addr:02X}")
             elif command == 'set' and value is not None:
                 # For PWM/servo, send SET command followed by value
@@ -552,7 +766,8 @@ class ActuatorController:
                     val = 0
                 elif val > 255:
                     val = 255
-                self.bus.write_byte_data(addr, self.CMD_SET, val)
+                with self.lock:
+                    self.bus.write_byte_data(addr, self.CMD_SET, val)
                 print(f"[ACTUATOR] Sent SET {val} to 0x{addr:02X}")
             else:
                 print(f"[ACTUATOR] Unknown command: {command}")
@@ -586,6 +801,12 @@ class MQTTHandler:
         self.client.on_disconnect = self._on_disconnect
         self.connected = False
         
+        # In-process discovery: one run at a time, on a worker thread
+        self._discovery_running = threading.Lock()
+        self._discovery_scanner = None
+        self._discovery_registrar = None
+        self._discovery_cache = None
+        
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             print(f"[MQTT] Connected to {MQTT_BROKER}:{MQTT_PORT}")
@@ -664,36 +885,74 @@ class MQTTHandler:
             print(f"[MQTT] Unknown discovery action: {action}")
     
     def _run_discovery(self):
-        """Run device discovery script in background"""
-        import os
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        discovery_script = os.path.join(script_dir, "device_discovery.py")
+        """Start a discovery run on a worker thread (one at a time)"""
+        if device_discovery is None:
+            self._publish_discovery_status("failed", error="device_discovery not available")
+            return
         
-        if os.path.exists(discovery_script):
-            try:
-                # Run discovery in background thread to not block MQTT
-                def run_async():
-                    result = subprocess.run(
-                        [sys.executable, discovery_script],
-                        capture_output=True,
-                        text=True,
-                        timeout=30
-                    )
-                    if result.returncode == 0:
-                        print(f"[DISCOVERY] Completed successfully")
-                        if result.stdout:
-                            for line in result.stdout.strip().split('\n')[-5:]:
-                                print(f"[DISCOVERY] {line}")
-                    else:
-                        print(f"[DISCOVERY] Failed: {result.stderr}")
-                
-                thread = threading.Thread(target=run_async, daemon=True)
-                thread.start()
-                print(f"[DISCOVERY] Started in background")
-            except Exception as e:
-                print(f"[DISCOVERY] Failed to start: {e}")
-        else:
-            print(f"[DISCOVERY] Script not found: {discovery_script}")
+        if not self._discovery_running.acquire(blocking=False):
+            print(f"[DISCOVERY] Already running, ignoring trigger")
+            self._publish_discovery_status("busy")
+            return
+        
+        thread = threading.Thread(target=self._discovery_worker, name="discovery", daemon=True)
+        thread.start()
+        print(f"[DISCOVERY] Started in background")
+    
+    def _discovery_worker(self):
+        """Run one discovery cycle"""
+        try:
+            if self._discovery_scanner is None:
+                # Created once and reused; the fingerprint cache and HTTP
+                # session persist between runs
+                bus = self.actuator_controller.bus if self.actuator_controller else None
+                lock = self.actuator_controller.lock if self.actuator_controller else None
+                if isinstance(bus, i2c_bus.RemoteBus):
+                    # The bus service orders probes after actuator and sensor traffic
+                    bus = i2c_bus.RemoteBus(i2c_bus.PRIORITY_DISCOVERY, bus.path)
+                    lock = None
+                self._discovery_scanner = device_discovery.I2CScanner(bus=bus, lock=lock)
+                self._discovery_registrar = device_discovery.DeviceRegistrar(
+                    device_discovery.API_BASE_URL,
+                    device_discovery.BASEBOARD_ID,
+                    device_discovery.API_TOKEN,
+                )
+                self._discovery_cache = device_discovery.FingerprintCache()
+            
+            self._publish_discovery_status("started")
+            results = device_discovery.run_discovery(
+                self._discovery_registrar,
+                self._discovery_cache,
+                scanner=self._discovery_scanner,
+                progress=self._publish_discovery_status,
+            )
+            self._publish_discovery_status(
+                "completed",
+                devices=results["devices"],
+                registered=results["registered"],
+                updated=results["updated"],
+                removed=results["removed"],
+                failed=results["failed"],
+                timing=results["timing"],
+            )
+            print(f"[DISCOVERY] Completed: {len(results['devices'])} device(s)")
+        except Exception as e:
+            print(f"[DISCOVERY] Failed: {e}")
+            self._publish_discovery_status("failed", error=str(e))
+        finally:
+            self._discovery_running.release()
+    
+    def _publish_discovery_status(self, stage, info=None, **fields):
+        """Publish discovery progress/results"""
+        payload = {
+            "baseboard_id": "PI-001",
+            "stage": stage,
+            **(info or {}),
+            **fields,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+        if self.connected:
+            self.client.publish(MQTT_DISCOVERY_STATUS_TOPIC, json.dumps(payload), qos=1)
             
     def start(self):
         """Start MQTT client in background"""
@@ -783,6 +1042,7 @@ async def health_handler(request):
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "services": {
             "video": True,
+            "camera": camera_capture.proc is not None,
             "audio_out": audio_streamer.ffmpeg_proc is not None,
             "lcd": ON_PI
         }
@@ -842,6 +1102,7 @@ async def on_shutdown(app):
         app['actuator_controller'].close()
         
     audio_streamer.stop()
+    await camera_capture.stop()
     print("[SERVER] Cleanup complete")
 
 
@@ -875,6 +1136,7 @@ def main():
     print(f"  Audio In:   ws://0.0.0.0:{HTTP_PORT}/ws/audio")
     print(f"  LCD MQTT:   {MQTT_BROKER}:{MQTT_PORT} -> {MQTT_LCD_TOPIC}")
     print(f"  Actuators:  {MQTT_BROKER}:{MQTT_PORT} -> {MQTT_ACTUATOR_TOPIC}")
+    print(f"  Discovery:  {MQTT_BROKER}:{MQTT_PORT} -> {MQTT_DISCOVERY_TOPIC}")
     print("=" * 60)
     
     # Run server
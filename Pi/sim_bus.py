@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+XIOT Simulated I2C Bus
+
+An SMBus stand-in with N simulated ATtiny85 adapters, so the Pi stack
+(SensorReader, ActuatorController, I2CScanner) runs on a plain Linux box.
+Each adapter follows the firmware in adapter/: IDENTIFY, the legacy 2-byte
+read, block frames (see adapter_protocol.py) and actuator commands. Sensors
+produce waveforms; the bus injects transfer latency, NAKs and adapters that
+drop off the bus for a while.
+
+Enable it for every component with XIOT_SIM_BUS, which i2c_bus.open_bus
+reads:
+
+    XIOT_SIM_BUS=1                                  # DEFAULT_FLEET
+    XIOT_SIM_BUS="temperature*4,vibration,led*2"    # Adapters from 0x08 up
+    XIOT_SIM_BUS="temperature*2:legacy,relay"       # Plain sensor firmware
+    XIOT_SIM_BUS="temperature:block2"               # Block firmware, 2 channels
+
+Fault injection: XIOT_SIM_NAK_RATE, XIOT_SIM_DISCONNECT_RATE (per
+transaction), XIOT_SIM_SEED.
+
+Usage:
+    python3 sim_bus.py                      # Benchmark polling and discovery
+    python3 sim_bus.py --fleet "temperature*32" --duration 10
+"""
+
+import argparse
+import ctypes
+import errno
+import math
+import os
+import random
+import threading
+import time
+
+import adapter_protocol
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+SIM_BUS = os.environ.get("XIOT_SIM_BUS", "")
+SIM_NAK_RATE = float(os.environ.get("XIOT_SIM_NAK_RATE", "0"))
+SIM_DISCONNECT_RATE = float(os.environ.get("XIOT_SIM_DISCONNECT_RATE", "0"))
+SIM_SEED = os.environ.get("XIOT_SIM_SEED")
+
+DEFAULT_FLEET = "temperature*2,humidity,light,vibration,led,relay"
+FIRST_ADDRESS = 0x08
+
+# Bus timing: 9 clocks per byte (8 data bits + ACK), plus start/stop overhead
+SIM_CLOCK_HZ = 100000
+TRANSACTION_OVERHEAD = 0.00005   # Seconds per transaction (driver, start/stop)
+
+# How long a disconnected adapter stays off the bus (seconds)
+DISCONNECT_TIME = 5.0
+
+# Adapter conversion cycle (block frame sequence counter rate)
+CYCLE_PERIOD = 0.03
+
+# Identification bytes, as in the adapter firmware
+XIOT_MAGIC = 0xA5
+CMD_IDENTIFY = 0xFF
+
+SENSOR_SUBTYPES = {
+    "temperature": 0x10,
+    "humidity": 0x11,
+    "pressure": 0x12,
+    "light": 0x13,
+    "motion": 0x14,
+    "gas": 0x15,
+    "vibration": 0x16,
+}
+ACTUATOR_SUBTYPES = {
+    "led": 0x20,
+    "relay": 0x21,
+    "servo": 0x22,
+    "motor": 0x23,
+    "buzzer": 0x24,
+    "pwm": 0x25,
+}
+
+# Waveform per sensor subtype: (kind, period seconds, amplitude, offset, noise)
+# in ADC counts
+WAVEFORMS = {
+    "temperature": ("sine", 600.0, 40.0, 75.0, 0.5),
+    "humidity": ("walk", 0.0, 300.0, 500.0, 2.0),
+    "pressure": ("sine", 3600.0, 10.0, 800.0, 0.3),
+    "light": ("square", 120.0, 350.0, 450.0, 3.0),
+    "motion": ("square", 20.0, 511.5, 511.5, 0.0),
+    "gas": ("walk", 0.0, 150.0, 200.0, 1.0),
+    "vibration": ("sine", 0.2, 300.0, 512.0, 20.0),
+}
+
+# Actuator commands (attiny85_autodiscovery)
+CMD_OFF = 0x00
+CMD_ON = 0x01
+CMD_TOGGLE = 0x02
+CMD_SET = 0x03
+
+
+# =============================================================================
+# SIMULATED ADAPTERS
+# =============================================================================
+
+class SimulatedAdapter:
+    """
+    One ATtiny85 adapter.
+
+    Like the firmware, a written command byte selects what the next read
+    returns; after a read the adapter falls back to its default response.
+
+    Args:
+        address: 7-bit I2C address
+        subtype: Subtype name from SENSOR_SUBTYPES or ACTUATOR_SUBTYPES
+        firmware: "block" (multi-channel sensor, 4 channels; "blockN" for
+            N channels), "legacy" (plain sensor firmware, no IDENTIFY) or
+            "autodiscovery" (actuators)
+        rng: random.Random for noise and waveform phase
+    """
+
+    def __init__(self, address, subtype, firmware=None, rng=None, clock=time.monotonic):
+        self.address = address
+        self.subtype = subtype
+        self.rng = rng or random.Random(address)
+        self.clock = clock
+        self.started = clock()
+
+        if subtype in SENSOR_SUBTYPES:
+            self.device_class = 0x01
+            self.subtype_code = SENSOR_SUBTYPES[subtype]
+            self.firmware = firmware or "block"
+            self.capabilities = 0x09  # Read + analog
+            self.channels = 1
+            if self.firmware.startswith("block"):
+                self.channels = int(self.firmware[len("block"):] or adapter_protocol.MAX_CHANNELS)
+                if not 1 <= self.channels <= adapter_protocol.MAX_CHANNELS:
+                    raise ValueError(f"Unsupported block channel count: {firmware!r}")
+                self.firmware = "block"
+                self.capabilities |= adapter_protocol.CAP_BLOCK
+        elif subtype in ACTUATOR_SUBTYPES:
+            self.device_class = 0x02
+            self.subtype_code = ACTUATOR_SUBTYPES[subtype]
+            self.firmware = firmware or "autodiscovery"
+            self.capabilities = 0x12  # Write + digital
+            if subtype in ("servo", "motor", "pwm"):
+                self.capabilities |= 0x04
+        else:
+            raise ValueError(f"Unknown adapter subtype: {subtype!r}")
+
+        self.kind, self.period, self.amplitude, self.offset, self.noise = WAVEFORMS.get(
+            subtype, ("sine", 60.0, 200.0, 512.0, 1.0)
+        )
+        self.phase = self.rng.uniform(0, 2 * math.pi)
+        self.walk = self.offset
+
+        self.command = None
+        self.output = 0
+        self.level = 0
+        self.disconnected_until = 0.0
+
+    @property
+    def is_sensor(self):
+        return self.device_class == 0x01
+
+    # ------------------------------------------------------------------
+    # Signal
+    # ------------------------------------------------------------------
+
+    def signal(self):
+        """Current analog input in (fractional) ADC counts, 0-1023."""
+        t = self.clock() - self.started
+        if self.kind == "sine":
+            value = self.offset + self.amplitude * math.sin(2 * math.pi * t / self.period + self.phase)
+        elif self.kind == "square":
+            high = math.sin(2 * math.pi * t / self.period + self.phase) >= 0
+            value = self.offset + (self.amplitude if high else -self.amplitude)
+        else:
+            # Bounded random walk
+            self.walk += self.rng.gauss(0, self.noise)
+            self.walk = min(max(self.walk, self.offset - self.amplitude), self.offset + self.amplitude)
+            value = self.walk
+        if self.noise:
+            value += self.rng.gauss(0, self.noise)
+        return min(max(value, 0.0), 1023.0)
+
+    def frame(self):
+        """Current block frame, as the multi-channel firmware builds it."""
+        value = self.signal()
+        seq = int((self.clock() - self.started) / CYCLE_PERIOD)
+        channels = [
+            int(value),
+            int(512 + 200 * math.sin(self.phase)),  # Auxiliary input
+            300 + self.rng.randint(-2, 2),          # Internal temperature
+            341,                                    # Bandgap at VCC = 3.3 V
+        ]
+        return adapter_protocol.encode_frame(
+            seq, channels[:self.channels], min(int(value * 4), 4095)
+        )
+
+    # ------------------------------------------------------------------
+    # Bus side
+    # ------------------------------------------------------------------
+
+    def receive(self, data):
+        """Bytes written by the master."""
+        if not data or self.firmware == "legacy":
+            # The plain sensor firmware has no receive handler
+            return
+        cmd = data[0]
+        if cmd == CMD_IDENTIFY or self.is_sensor:
+            self.command = cmd
+        elif cmd == CMD_ON:
+            self.output = 1
+        elif cmd == CMD_OFF:
+            self.output = 0
+        elif cmd == CMD_TOGGLE:
+            self.output ^= 1
+        elif cmd == CMD_SET and len(data) > 1:
+            self.level = data[1]
+            self.output = 1 if data[1] else 0
+
+    def request(self, length):
+        """Bytes returned for a read of the given length."""
+        if self.command == CMD_IDENTIFY:
+            data = [XIOT_MAGIC, self.device_class, self.subtype_code, self.capabilities]
+        elif self.is_sensor and self.command == adapter_protocol.CMD_READ_BLOCK:
+            data = self.frame()
+        elif self.is_sensor:
+            value = int(self.signal())
+            data = [value & 0xFF, (value >> 8) & 0x03]
+        else:
+            data = [self.output]
+        self.command = None
+        # The master clocks out as many bytes as it asked for
+        return (data + [0xFF] * length)[:length]
+
+
+def parse_fleet(spec, rng=None, clock=time.monotonic, sensor_firmware=None):
+    """
+    Build adapters from a fleet spec such as "temperature*4:legacy,led".
+
+    Tokens are subtype[*count][:firmware]; addresses are assigned from
+    FIRST_ADDRESS in order. sensor_firmware overrides the firmware of
+    every sensor.
+    """
+    if spec in ("", "1", "default"):
+        spec = DEFAULT_FLEET
+    rng = rng or random.Random()
+    adapters = []
+    address = FIRST_ADDRESS
+    for token in spec.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        token, _, firmware = token.partition(":")
+        subtype, _, count = token.partition("*")
+        subtype = subtype.strip()
+        if sensor_firmware and subtype in SENSOR_SUBTYPES:
+            firmware = sensor_firmware
+        for _ in range(int(count or 1)):
+            if address > 0x77:
+                raise ValueError("Fleet does not fit in the 7-bit address range")
+            adapters.append(SimulatedAdapter(
+                address, subtype, firmware or None,
+                random.Random(rng.random()), clock,
+            ))
+            address += 1
+    return adapters
+
+
+# =============================================================================
+# SIMULATED BUS
+# =============================================================================
+
+class SimulatedSMBus:
+    """
+    smbus2.SMBus-compatible bus with simulated adapters.
+
+    Args:
+        adapters: Iterable of SimulatedAdapter
+        clock_hz: Simulated bus clock, sets the transfer time per byte
+        nak_rate: Probability that a transaction is NAKed
+        disconnect_rate: Probability per transaction that the addressed
+            adapter drops off the bus for DISCONNECT_TIME seconds
+        realtime: Sleep for the simulated transfer time
+        seed: Seed for fault injection
+    """
+
+    # No device node; callers skip adapter ioctls
+    fd = None
+
+    def __init__(self, adapters, clock_hz=SIM_CLOCK_HZ, nak_rate=0.0,
+                 disconnect_rate=0.0, realtime=True, seed=None):
+        self.adapters = {adapter.address: adapter for adapter in adapters}
+        self.clock_hz = clock_hz
+        self.nak_rate = nak_rate
+        self.disconnect_rate = disconnect_rate
+        self.realtime = realtime
+        self.rng = random.Random(seed)
+        self.transactions = 0
+        self.naks = 0
+        self.disconnects = 0
+        # One transaction on the wire at a time, like the real bus
+        self._lock = threading.Lock()
+
+    def _transfer(self, addr, nbytes, action):
+        """Address an adapter, wait out the transfer and run action(adapter)."""
+        with self._lock:
+            self.transactions += 1
+            if self.realtime:
+                time.sleep(TRANSACTION_OVERHEAD + (1 + nbytes) * 9 / self.clock_hz)
+
+            adapter = self.adapters.get(addr)
+            now = time.monotonic()
+            if adapter is not None and self.disconnect_rate and \
+                    self.rng.random() < self.disconnect_rate:
+                adapter.disconnected_until = now + DISCONNECT_TIME
+                self.disconnects += 1
+            if adapter is None or adapter.disconnected_until > now or \
+                    (self.nak_rate and self.rng.random() < self.nak_rate):
+                self.naks += 1
+                raise OSError(errno.EREMOTEIO, os.strerror(errno.EREMOTEIO))
+            return action(adapter)
+
+    def write_quick(self, addr):
+        self._transfer(addr, 0, lambda adapter: None)
+
+    def read_byte(self, addr):
+        return self._transfer(addr, 1, lambda adapter: adapter.request(1)[0])
+
+    def write_byte(self, addr, value):
+        self._transfer(addr, 1, lambda adapter: adapter.receive([value]))
+
+    def read_byte_data(self, addr, register):
+        def action(adapter):
+            adapter.receive([register])
+            return adapter.request(1)[0]
+        return self._transfer(addr, 2, action)
+
+    def write_byte_data(self, addr, register, value):
+        self._transfer(addr, 2, lambda adapter: adapter.receive([register, value]))
+
+    def read_i2c_block_data(self, addr, register, length):
+        def action(adapter):
+            adapter.receive([register])
+            return adapter.request(length)
+        return self._transfer(addr, 1 + length, action)
+
+    def write_i2c_block_data(self, addr, register, data):
+        data = list(data)
+        self._transfer(addr, 1 + len(data), lambda adapter: adapter.receive([register] + data))
+
+    def i2c_rdwr(self, *msgs):
+        for msg in msgs:
+            if msg.flags & 0x0001:  # I2C_M_RD
+                data = self._transfer(msg.addr, msg.len, lambda adapter: adapter.request(msg.len))
+                ctypes.memmove(msg.buf, bytes(data), len(data))
+            else:
+                data = list(msg)
+                self._transfer(msg.addr, len(data), lambda adapter: adapter.receive(data))
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {
+            "adapters": len(self.adapters),
+            "transactions": self.transactions,
+            "naks": self.naks,
+            "disconnects": self.disconnects,
+        }
+
+
+_shared_bus = None
+_shared_lock = threading.Lock()
+
+
+def enabled():
+    """True if XIOT_SIM_BUS asks for the simulated bus."""
+    return bool(SIM_BUS) and SIM_BUS != "0"
+
+
+def shared_bus():
+    """
+    The process-wide simulated bus configured by XIOT_SIM_BUS, so every
+    component in a process sees the same adapters.
+    """
+    global _shared_bus
+    with _shared_lock:
+        if _shared_bus is None:
+            seed = int(SIM_SEED) if SIM_SEED is not None else None
+            _shared_bus = SimulatedSMBus(
+                parse_fleet(SIM_BUS, random.Random(seed)),
+                nak_rate=SIM_NAK_RATE,
+                disconnect_rate=SIM_DISCONNECT_RATE,
+                seed=seed,
+            )
+            addresses = ", ".join(f"0x{addr:02X}" for addr in _shared_bus.adapters)
+            print(f"[SIM] Simulated I2C bus with {len(_shared_bus.adapters)} adapters: {addresses}")
+        return _shared_bus
+
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def sensor_mappings(bus):
+    """SENSOR_MAPPINGS-style config for every simulated sensor, polled as fast as possible."""
+    return {
+        addr: {
+            "name": f"Sim {adapter.subtype} 0x{addr:02X}",
+            "type": adapter.subtype,
+            "unit": "",
+            "sample_rate": 1000.0,
+        }
+        for addr, adapter in bus.adapters.items() if adapter.is_sensor
+    }
+
+
+def bench_polling(bus, duration):
+    """
+    Poll every simulated sensor in a loop; return samples and timing.
+
+    A sample is one reading of one sensor; channels counts the ADC channels
+    it carried (all of a block frame's, one for the legacy read).
+    """
+    import i2c_bus
+    import mqtt_publisher
+
+    metered = i2c_bus.MeteredBus(bus)
+    mappings = sensor_mappings(bus)
+    reader = mqtt_publisher.SensorReader(mappings=mappings, bus=metered)
+
+    samples = channels = offline = cycles = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        for reading in reader.read_sensors(mappings):
+            samples += 1
+            if reading["status"] == "active":
+                channels += len(reading.get("channels") or [reading["raw_value"]])
+            else:
+                offline += 1
+        cycles += 1
+    elapsed = time.perf_counter() - start
+    stats = metered.stats()
+    return {
+        "sensors": len(mappings),
+        "cycles": cycles,
+        "samples_per_s": samples / elapsed,
+        "channels_per_s": channels / elapsed,
+        "offline": offline,
+        "transactions_per_s": stats["transactions"] / elapsed,
+        "bytes_per_s": stats["bytes"] / elapsed,
+        "utilisation": stats["utilisation"],
+        "protocols": sorted(set(reader.protocols.values()), key=str),
+    }
+
+
+def bench_discovery(bus, scan_mode):
+    """Time one discovery scan of the simulated bus."""
+    import device_discovery
+
+    scanner = device_discovery.I2CScanner(scan_mode=scan_mode, bus=bus)
+    devices = scanner.discover_all()
+    return {"devices": len(devices), **scanner.timing}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='XIOT Simulated I2C Bus Benchmark')
+    parser.add_argument('--fleet', type=str, default=SIM_BUS if enabled() else DEFAULT_FLEET,
+                        help=f'Adapters to simulate (default: {DEFAULT_FLEET})')
+    parser.add_argument('--duration', type=float, default=5.0,
+                        help='Seconds of polling per run (default: 5)')
+    parser.add_argument('--nak-rate', type=float, default=SIM_NAK_RATE,
+                        help='Probability that a transaction is NAKed')
+    parser.add_argument('--disconnect-rate', type=float, default=SIM_DISCONNECT_RATE,
+                        help='Probability per transaction that an adapter drops off')
+    parser.add_argument('--clock', type=int, default=SIM_CLOCK_HZ,
+                        help=f'Simulated bus clock in Hz (default: {SIM_CLOCK_HZ})')
+    parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    def make_bus(sensor_firmware=None):
+        adapters = parse_fleet(args.fleet, random.Random(args.seed), sensor_firmware=sensor_firmware)
+        return SimulatedSMBus(adapters, args.clock, args.nak_rate,
+                              args.disconnect_rate, seed=args.seed)
+
+    print("=" * 60)
+    print(f"Simulated bus: {args.fleet} @ {args.clock / 1000:g} kHz")
+    print("=" * 60)
+
+    # Same fleet with fewer block channels and plain sensor firmware, for comparison
+    for sensor_firmware in ("block", "block2", "block1", "legacy"):
+        result = bench_polling(make_bus(sensor_firmware), args.duration)
+        print(f"[BENCH] Polling ({sensor_firmware} firmware, {result['sensors']} sensors): "
+              f"{result['samples_per_s']:.0f} samples/s, {result['channels_per_s']:.0f} channels/s, "
+              f"{result['transactions_per_s']:.0f} txn/s, {result['bytes_per_s']:.0f} B/s, "
+              f"{result['utilisation'] * 100:.0f}% busy, {result['offline']} offline reads "
+              f"(protocols: {', '.join(map(str, result['protocols']))})")
+
+    for scan_mode in ("fast", "full"):
+        result = bench_discovery(make_bus(), scan_mode)
+        print(f"[BENCH] Discovery ({scan_mode}): {result['devices']} devices in "
+              f"{result['probe_ms'] + result['identify_ms']:.1f} ms "
+              f"(probe {result['probe_ms']:.1f} ms, identify {result['identify_ms']:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
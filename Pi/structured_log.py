@@ -0,0 +1,213 @@
+"""
+Structured, asynchronous logging with sampling for per-message logs.
+
+Log calls only put the record on a queue (QueueHandler); one listener
+thread formats and writes them, so a hot loop never blocks on a stdout
+write or flush. Per-message and per-reading logs go through ``sampled()``,
+which lets at most SAMPLE_BURST records per key through every
+SAMPLE_INTERVAL seconds and reports how many were suppressed in between;
+ERROR and above always get through.
+Records an AsyncHandler had to drop are counted in ``dropped_records()``.
+
+Structured fields are given as keyword arguments to ``sampled()`` or as
+``extra=fields(...)``. The text format appends them as key=value, the JSON
+format (XIOT_LOG_FORMAT=json) emits one object per line:
+
+    log = logging.getLogger("mqtt")
+    log.info("Connected to broker at %s:%d", host, port)
+    sampled(log, logging.DEBUG, "publish", "Published %d readings", n, topic=topic)
+
+The backend keeps a copy of this module in
+``Interface/backend/api/structured_log.py``; keep the two in sync.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+
+LOG_LEVEL = os.environ.get("XIOT_LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("XIOT_LOG_FORMAT", "text")
+
+# Records waiting for the writer thread; further records are dropped
+QUEUE_SIZE = 10000
+
+# sampled(): records let through per key per interval (seconds)
+SAMPLE_BURST = 5
+SAMPLE_INTERVAL = 10.0
+# Keys tracked by the sampler; expired windows, then the oldest, are pruned
+SAMPLE_MAX_KEYS = 1000
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(name)s] %(message)s"
+
+
+def fields(**values):
+    """``extra`` argument attaching structured fields to a log record."""
+    return {"fields": values}
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable lines with structured fields appended as key=value."""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+
+    def format(self, record):
+        text = super().format(record)
+        values = getattr(record, "fields", None)
+        if values:
+            text += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+FORMATTERS = {"text": TextFormatter, "json": JsonFormatter}
+
+# Open AsyncHandlers, for dropped_records()
+_handlers = []
+
+
+class AsyncHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler with its own listener thread writing to a stream.
+
+    Args:
+        stream: Output stream (default: sys.stdout)
+        fmt: "text" or "json"
+        maxsize: Queue capacity; when full, records are dropped and counted
+            rather than blocking the caller
+    """
+
+    def __init__(self, stream=None, fmt=LOG_FORMAT, maxsize=QUEUE_SIZE):
+        super().__init__(queue.Queue(maxsize))
+        target = logging.StreamHandler(stream or sys.stdout)
+        target.setFormatter(FORMATTERS.get(fmt, TextFormatter)())
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self.listener = logging.handlers.QueueListener(self.queue, target)
+        self.listener.start()
+        _handlers.append(self)
+        atexit.register(self.close)
+
+    def prepare(self, record):
+        # Formatting happens on the listener thread; records stay in-process
+        # so they need not be made picklable here
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def close(self):
+        """Flush queued records and stop the writer thread."""
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        if self in _handlers:
+            _handlers.remove(self)
+        super().close()
+
+
+class Sampler:
+    """Per-key rate limit: ``burst`` records per ``interval`` seconds."""
+
+    def __init__(self, burst=SAMPLE_BURST, interval=SAMPLE_INTERVAL, max_keys=SAMPLE_MAX_KEYS):
+        self.burst = burst
+        self.interval = interval
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [window start, records passed, records suppressed]
+        self._windows = {}
+
+    def allow(self, key):
+        """
+        Returns:
+            (allowed, suppressed): suppressed is the number of records
+            dropped in the previous window, reported with the first record
+            of a new one
+        """
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window else 0
+                if window is None and len(self._windows) >= self.max_keys:
+                    self._prune(now)
+                self._windows[key] = [now, 1, 0]
+                return True, suppressed
+            if window[1] < self.burst:
+                window[1] += 1
+                return True, 0
+            window[2] += 1
+            return False, 0
+
+    def _prune(self, now):
+        # Suppressed counts of pruned windows are not reported
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.interval]:
+            del self._windows[key]
+        while len(self._windows) >= self.max_keys:
+            del self._windows[next(iter(self._windows))]
+
+
+_sampler = Sampler()
+
+
+def dropped_records():
+    """Records dropped by open AsyncHandlers because their queue was full."""
+    return sum(handler.dropped for handler in list(_handlers))
+
+
+def sampled(logger, level, key, msg, *args, **values):
+    """
+    Log at most SAMPLE_BURST records per (logger, key) every SAMPLE_INTERVAL.
+
+    ERROR and above are never sampled away. Costs one isEnabledFor() check
+    when the level is disabled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if level >= logging.ERROR:
+        logger.log(level, msg, *args, extra={"fields": values} if values else None)
+        return
+    allowed, suppressed = _sampler.allow((logger.name, key))
+    if not allowed:
+        return
+    if suppressed:
+        values["suppressed"] = suppressed
+    logger.log(level, msg, *args, extra={"fields": values} if values else None)
+
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    """Send all logging through one AsyncHandler on the root logger (scripts)."""
+    handler = AsyncHandler(fmt=fmt)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    return handler
@@ -0,0 +1,623 @@
+"""
+Unit tests for the Pi components. No hardware needed: I2C goes through
+the simulated bus (sim_bus.py).
+
+Run with:
+    python -m unittest tests -v
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import adapter_protocol
+import calibration
+import device_discovery
+import i2c_bus
+import mqtt_publisher
+import multimedia_server
+import sim_bus
+import wire_format
+
+
+def simulated_bus(fleet="temperature*2", fd=None):
+    """A non-realtime simulated bus, optionally posing as a /dev/i2c-N handle."""
+    bus = sim_bus.SimulatedSMBus(sim_bus.parse_fleet(fleet), realtime=False)
+    bus.fd = fd
+    return bus
+
+
+def sensor_reader(fleet="temperature", spec=None):
+    """SensorReader for one sensor at 0x08 on a simulated bus."""
+    mappings = {0x08: {"name": "Temperature", "type": "temperature", "unit": "C",
+                       "calibration": spec}}
+    with mock.patch.object(mqtt_publisher, "IDENTIFY_SETTLE", 0):
+        return mqtt_publisher.SensorReader(mappings=mappings,
+                                           bus=i2c_bus.MeteredBus(simulated_bus(fleet)))
+
+
+# =============================================================================
+# I2C bus service
+# =============================================================================
+
+class RecordingBus:
+    """SMBus stand-in recording the order calls run in."""
+
+    def __init__(self):
+        self.calls = []
+
+    def read_byte(self, addr):
+        self.calls.append(("read_byte", addr))
+        return addr
+
+    def write_byte(self, addr, value):
+        self.calls.append(("write_byte", addr))
+
+
+class I2CBusServiceTests(unittest.TestCase):
+    def test_queued_calls_run_by_priority(self):
+        bus = RecordingBus()
+        service = i2c_bus.I2CBusService(bus=bus)
+        discovery = service.submit(i2c_bus.PRIORITY_DISCOVERY, "read_byte", 0x30)
+        sensor = service.submit(i2c_bus.PRIORITY_SENSOR, "read_byte", 0x08)
+        actuator = service.submit(i2c_bus.PRIORITY_ACTUATOR, "write_byte", 0x0A, 1)
+        service.start()
+        self.addCleanup(service.stop)
+        self.assertEqual((discovery.result(5), sensor.result(5), actuator.result(5)),
+                         (0x30, 0x08, None))
+        self.assertEqual(bus.calls, [("write_byte", 0x0A), ("read_byte", 0x08),
+                                     ("read_byte", 0x30)])
+        self.assertEqual(service.stats()["transactions"], 3)
+
+    def test_unknown_operation_is_refused(self):
+        service = i2c_bus.I2CBusService(bus=RecordingBus())
+        with self.assertRaises(ValueError):
+            service.submit(i2c_bus.PRIORITY_SENSOR, "close")
+
+    def test_remote_bus_over_unix_socket(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        path = os.path.join(tmpdir.name, "i2c.sock")
+        service = i2c_bus.I2CBusService(bus=simulated_bus("temperature"))
+        service.start()
+        service.serve(path)
+        self.addCleanup(service.stop)
+
+        remote = i2c_bus.RemoteBus(i2c_bus.PRIORITY_SENSOR, path)
+        self.addCleanup(remote.close)
+        self.assertEqual(len(remote.read_i2c_block_data(0x08, 0, 2)), 2)
+        # i2c_rdwr read messages are filled in place
+        remote.write_byte(0x08, sim_bus.CMD_IDENTIFY)
+        read_msg = i2c_bus.smbus2.i2c_msg.read(0x08, 4)
+        remote.i2c_rdwr(read_msg)
+        self.assertEqual(list(read_msg)[0], sim_bus.XIOT_MAGIC)
+        # Bus errors come back as IOError
+        with self.assertRaises(IOError):
+            remote.read_byte(0x30)
+        self.assertEqual(remote.stats()["source"], "service")
+
+
+class BusMetricsTests(unittest.TestCase):
+    def test_bytes_errors_and_retries_per_device(self):
+        bus = i2c_bus.MeteredBus(simulated_bus("temperature"))
+        bus.read_i2c_block_data(0x08, 0, 2)
+        with self.assertRaises(IOError):
+            bus.read_byte(0x30)
+        stats = bus.stats()
+        self.assertEqual((stats["transactions"], stats["bytes"], stats["errors"], stats["retries"]),
+                         (2, 3, 1, 1))
+        self.assertEqual(stats["devices"]["0x30"]["errors"], 1)
+        self.assertEqual(stats["ops"]["read_i2c_block_data"]["count"], 1)
+
+    def test_interval_rates(self):
+        previous = {"uptime_s": 10.0, "transactions": 100, "bytes": 300, "busy_s": 1.0,
+                    "errors": 1, "retries": 2}
+        current = {"uptime_s": 20.0, "transactions": 300, "bytes": 900, "busy_s": 3.5,
+                   "errors": 1, "retries": 5}
+        interval = i2c_bus.interval_stats(previous, current)
+        self.assertEqual((interval["transactions_per_s"], interval["bytes_per_s"],
+                          interval["utilisation"], interval["retries"]), (20.0, 60.0, 0.25, 3))
+        # A restarted service is measured from its start
+        restarted = i2c_bus.interval_stats(current, {**previous, "uptime_s": 5.0})
+        self.assertEqual(restarted["transactions"], 100)
+
+
+# =============================================================================
+# Device discovery
+# =============================================================================
+
+class FastScanTimeoutTests(unittest.TestCase):
+    def _scan(self, probe=None):
+        raw = simulated_bus(fd=99)
+        with mock.patch.object(device_discovery, "ON_PI", True), \
+                mock.patch.object(i2c_bus, "open_bus", return_value=i2c_bus.MeteredBus(raw)), \
+                mock.patch("fcntl.ioctl") as ioctl:
+            scanner = device_discovery.I2CScanner(scan_mode="fast")
+            if probe is not None:
+                scanner._probe_fast = probe
+            try:
+                scanner.scan_bus()
+            except RuntimeError:
+                pass
+        return [call.args for call in ioctl.call_args_list]
+
+    def test_adapter_settings_restored_after_fast_scan(self):
+        self.assertEqual(self._scan(), [
+            (99, device_discovery.I2C_RETRIES_IOCTL, 0),
+            (99, device_discovery.I2C_TIMEOUT_IOCTL, device_discovery.FAST_SCAN_TIMEOUT),
+            (99, device_discovery.I2C_RETRIES_IOCTL, device_discovery.DEFAULT_BUS_RETRIES),
+            (99, device_discovery.I2C_TIMEOUT_IOCTL, device_discovery.DEFAULT_BUS_TIMEOUT),
+        ])
+
+    def test_adapter_settings_restored_when_probe_fails(self):
+        def probe():
+            raise RuntimeError("bus fault")
+
+        calls = self._scan(probe)
+        self.assertEqual(calls[-1], (99, device_discovery.I2C_TIMEOUT_IOCTL,
+                                     device_discovery.DEFAULT_BUS_TIMEOUT))
+
+    def test_shared_handle_is_left_alone(self):
+        with mock.patch("fcntl.ioctl") as ioctl:
+            scanner = device_discovery.I2CScanner(
+                scan_mode="fast", bus=i2c_bus.MeteredBus(simulated_bus(fd=99))
+            )
+            self.assertEqual(scanner.scan_bus(), [0x08, 0x09])
+        ioctl.assert_not_called()
+
+
+class FakeRegistrar:
+    """DeviceRegistrar stand-in recording what each run sends."""
+
+    def __init__(self, fail=(), bulk=True):
+        self.fail = set(fail)
+        self.bulk = bulk
+        self.calls = []
+
+    def register_devices(self, devices, removed=None):
+        addresses = [device["i2c_address"] for device in devices]
+        self.calls.append((addresses, list(removed or [])))
+        results = {
+            "registered": [a for a in addresses if a not in self.fail],
+            "updated": [],
+            "removed": list(removed or []) if self.bulk else [],
+            "failed": [{"address": a, "error": "rejected"} for a in addresses if a in self.fail],
+        }
+        if not self.bulk and removed:
+            results["unreported"] = list(removed)
+        return results
+
+
+class DiscoveryCacheTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.cache = device_discovery.FingerprintCache(os.path.join(tmpdir.name, "cache.json"))
+
+    def _run(self, registrar, fleet="temperature*2"):
+        scanner = device_discovery.I2CScanner(
+            scan_mode="fast", bus=i2c_bus.MeteredBus(simulated_bus(fleet))
+        )
+        return device_discovery.run_discovery(registrar, self.cache, scanner=scanner)
+
+    def test_failed_addition_is_sent_again(self):
+        self._run(FakeRegistrar(fail={"0x09"}))
+        registrar = FakeRegistrar()
+        self._run(registrar)
+        self.assertEqual(registrar.calls, [(["0x09"], [])])
+
+    def test_unreported_removal_is_sent_again(self):
+        self._run(FakeRegistrar())
+        self._run(FakeRegistrar(bulk=False), fleet="temperature")
+        registrar = FakeRegistrar()
+        self._run(registrar, fleet="temperature")
+        self.assertEqual(registrar.calls, [([], ["0x09"])])
+
+    def test_identify_failure_is_not_a_removal(self):
+        self._run(FakeRegistrar())
+        for entry in self.cache.entries.values():
+            entry["identified_at"] = 0
+        read_identities = device_discovery.I2CScanner.read_identities
+
+        def drop_0x09(scanner, addrs):
+            identities = read_identities(scanner, addrs)
+            identities.pop(0x09, None)
+            return identities
+
+        registrar = FakeRegistrar()
+        with mock.patch.object(device_discovery.I2CScanner, "read_identities", drop_0x09):
+            self._run(registrar)
+        self.assertEqual(registrar.calls, [(["0x08"], [])])
+        self.assertIn(0x09, self.cache.entries)
+
+    def test_expired_devices_are_sent_again(self):
+        self._run(FakeRegistrar())
+        self.cache.entries[0x08]["identified_at"] = 0
+        registrar = FakeRegistrar()
+        self._run(registrar)
+        self.assertEqual(registrar.calls, [(["0x08"], [])])
+
+    def test_accepted_changes_are_not_sent_again(self):
+        self._run(FakeRegistrar())
+        registrar = FakeRegistrar()
+        self._run(registrar)
+        self.assertEqual(registrar.calls, [])
+
+
+# =============================================================================
+# Adapter protocol and calibration
+# =============================================================================
+
+class AdapterProtocolTests(unittest.TestCase):
+    def test_frame_round_trip(self):
+        frame = adapter_protocol.encode_frame(7, [1023, 512, 300], 4095)
+        # The CRC follows the last channel sent
+        self.assertEqual(len(frame), adapter_protocol.frame_length(3))
+        self.assertEqual(adapter_protocol.decode_header(frame[:3]), 3)
+        self.assertEqual(adapter_protocol.decode_frame(frame), {
+            "version": adapter_protocol.BLOCK_VERSION,
+            "seq": 7,
+            "channels": [1023, 512, 300],
+            "oversampled": 4095,
+        })
+
+    def test_crc8(self):
+        # CRC-8/SMBUS check value
+        self.assertEqual(adapter_protocol.crc8(b"123456789"), 0xF4)
+
+    def test_corrupt_frames_are_rejected(self):
+        frame = adapter_protocol.encode_frame(1, [100], 400)
+        corrupt = list(frame)
+        corrupt[3] ^= 0x01
+        unknown_version = adapter_protocol.encode_frame(1, [100], 400, version=9)
+        no_channels = adapter_protocol.encode_frame(1, [], 0)
+        padded = frame + [0xFF, 0xFF]
+        for data in (frame[:-1], padded, corrupt, unknown_version, no_channels):
+            with self.subTest(data=data), self.assertRaises(adapter_protocol.FrameError):
+                adapter_protocol.decode_frame(data)
+
+    def test_legacy_value(self):
+        self.assertEqual(adapter_protocol.decode_legacy([0xFF, 0xFF]), 1023)
+        self.assertEqual(adapter_protocol.decode_legacy([0x34, 0x02]), 0x234)
+
+    def test_seq_gap_wraps(self):
+        self.assertEqual(adapter_protocol.seq_gap(10, 10), 0)
+        self.assertEqual(adapter_protocol.seq_gap(10, 13), 3)
+        self.assertEqual(adapter_protocol.seq_gap(254, 1), 3)
+
+
+class CalibrationTests(unittest.TestCase):
+    def test_validate(self):
+        self.assertEqual(calibration.validate(None), calibration.IDENTITY)
+        with self.assertRaises(calibration.CalibrationError):
+            calibration.validate({"kind": "table", "points": [[0, 0]]})
+
+    def test_convert_matches_convert_array(self):
+        spec = calibration.validate({"kind": "table", "points": [[0, -40], [1023, 125]]})
+        raws = [0, 512.25, 1023, 2000]
+        self.assertEqual([calibration.convert(spec, raw) for raw in raws],
+                         calibration.convert_array(spec, raws).tolist())
+
+
+# =============================================================================
+# Sensor reads
+# =============================================================================
+
+class SensorReaderTests(unittest.TestCase):
+    def test_publisher_imports_without_smbus2(self):
+        code = "import sys; sys.modules['smbus2'] = None; import mqtt_publisher"
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def test_block_reading_sends_the_calibrated_raw_value(self):
+        spec = {"kind": "linear", "scale": 0.5, "offset": 0.0}
+        reader = sensor_reader(spec=spec)
+        self.assertEqual(reader.protocols[0x08], "block")
+        frames = []
+        read_frame = reader.read_frame
+        with mock.patch.object(reader, "read_frame",
+                               side_effect=lambda addr: frames.append(read_frame(addr)) or frames[-1]):
+            reading = reader.read_all_sensors()[0]
+        self.assertEqual(reading["raw_value"],
+                         frames[0]["oversampled"] / (1 << adapter_protocol.OVERSAMPLE_EXTRA_BITS))
+        self.assertEqual(reading["value"],
+                         round(calibration.convert(calibration.validate(spec), reading["raw_value"]), 2))
+        self.assertEqual(reading["channels"], frames[0]["channels"])
+
+    def test_block_frames_are_read_at_their_channel_count(self):
+        reader = sensor_reader("temperature:block2")
+        self.assertEqual(reader.protocols[0x08], "block")
+        before = reader.bus.stats()["bytes"]
+        reading = reader.read_all_sensors()[0]
+        self.assertEqual(len(reading["channels"]), 2)
+        # Command byte plus a 10-byte frame
+        self.assertEqual(reader.bus.stats()["bytes"] - before, 1 + adapter_protocol.frame_length(2))
+
+    def test_single_channel_block_adapter_uses_legacy_read(self):
+        reader = sensor_reader("temperature:block1")
+        self.assertEqual(reader.protocols[0x08], "legacy")
+        reading = reader.read_all_sensors()[0]
+        self.assertEqual(reading["status"], "active")
+        self.assertNotIn("channels", reading)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class RecordingReader:
+    def __init__(self):
+        self.reads = []
+
+    def read_sensors(self, i2c_addrs):
+        self.reads.append(list(i2c_addrs))
+        return [{"i2c_address": f"0x{addr:02X}"} for addr in i2c_addrs]
+
+
+class SampleSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.reader = RecordingReader()
+        mappings = {0x08: {"sample_rate": 10.0}, 0x09: {"sample_rate": 1.0}}
+        self.scheduler = mqtt_publisher.SampleScheduler(self.reader, mappings, clock=self.clock)
+
+    def test_each_sensor_runs_at_its_own_rate(self):
+        for _ in range(20):
+            self.scheduler.run_due()
+            self.clock.now += 0.05
+        # 1 s of 50 ms ticks: 10 reads of 0x08, one of 0x09
+        reads = [addr for batch in self.reader.reads for addr in batch]
+        self.assertEqual(reads.count(0x08), 10)
+        self.assertEqual(reads.count(0x09), 1)
+        self.assertEqual(self.scheduler.report()["skipped"], 0)
+
+    def test_missed_periods_are_skipped_not_replayed(self):
+        self.scheduler.run_due()
+        self.clock.now += 0.35
+        self.assertEqual(self.scheduler.run_due(), [{"i2c_address": "0x08"}])
+        report = self.scheduler.report()
+        self.assertEqual((report["late"], report["skipped"]), (1, 2))
+        # The next deadline stays on the original 100 ms grid
+        self.assertAlmostEqual(self.scheduler.time_until_due(), 0.05)
+
+
+# =============================================================================
+# Change-only publishing
+# =============================================================================
+
+def reading(value, status="active"):
+    return {"i2c_address": "0x08", "value": value, "status": status}
+
+
+class DeadbandFilterTests(unittest.TestCase):
+    def _filter(self, **config):
+        mappings = {0x08: {"name": "Temperature", "type": "temperature", "unit": "C", **config}}
+        return mqtt_publisher.DeadbandFilter(mappings)
+
+    def _publishes(self, deadband, last, value, now=1.0):
+        deadband.mark_published([reading(last)], now=0.0)
+        return deadband.should_publish(reading(value), now)
+
+    def test_absolute_band(self):
+        deadband = self._filter(deadband=0.5)
+        self.assertFalse(self._publishes(deadband, 20.0, 20.4))
+        self.assertTrue(self._publishes(deadband, 20.0, 20.5))
+
+    def test_relative_band(self):
+        deadband = self._filter(deadband_pct=10.0)
+        self.assertFalse(self._publishes(deadband, 20.0, 21.0))
+        self.assertTrue(self._publishes(deadband, 20.0, 22.0))
+
+    def test_unchanged_zero_is_suppressed(self):
+        deadband = self._filter(deadband_pct=10.0)
+        self.assertFalse(self._publishes(deadband, 0.0, 0.0))
+        self.assertTrue(self._publishes(deadband, 0.0, 0.1))
+
+    def test_absolute_band_applies_at_zero(self):
+        deadband = self._filter(deadband=0.5, deadband_pct=10.0)
+        self.assertFalse(self._publishes(deadband, 0.0, 0.2))
+        self.assertTrue(self._publishes(deadband, 0.0, 0.5))
+
+    def test_status_change_and_heartbeat(self):
+        deadband = self._filter(deadband=0.5, max_silence=60.0)
+        self.assertTrue(self._publishes(deadband, 20.0, 20.0, now=60.0))
+        deadband.mark_published([reading(20.0)], now=0.0)
+        self.assertTrue(deadband.should_publish(reading(None, "offline"), 1.0))
+
+
+class AggregationWindowTests(unittest.TestCase):
+    def test_more_samples_than_expected_are_kept(self):
+        window = mqtt_publisher.AggregationWindow(1.0, 4.0)
+        values = [float(i) for i in range(12)]
+        for i, value in enumerate(values):
+            window.add(value, i / 12, "t%d" % i)
+        summary = window.summarize("end")
+        self.assertEqual(summary["count"], 12)
+        self.assertEqual(summary["min"], 0.0)
+        self.assertEqual(summary["mean"], sum(values) / 12)
+
+
+class SampleBatcherTests(unittest.TestCase):
+    def _add(self, batcher, value, status="active", now=0.0):
+        batched = {**reading(value, status), "name": "Temperature", "type": "temperature",
+                   "unit": "C", "raw_value": None}
+        batcher.add([batched], now_ms=int(now * 1000), now=now)
+
+    def test_due_after_interval(self):
+        batcher = mqtt_publisher.SampleBatcher(interval=5.0)
+        self._add(batcher, 20.0)
+        self._add(batcher, 20.5, now=1.0)
+        self.assertFalse(batcher.is_due(now=4.9))
+        self.assertTrue(batcher.is_due(now=5.0))
+
+    def test_status_change_is_due_at_once(self):
+        batcher = mqtt_publisher.SampleBatcher(interval=5.0)
+        self._add(batcher, 20.0)
+        self.assertEqual(len(batcher.flush()[1]), 1)
+        # The previous status is remembered across flushes
+        self._add(batcher, None, "offline", now=1.0)
+        self.assertTrue(batcher.is_due(now=1.0))
+        base_time, sensors = batcher.flush()
+        self.assertEqual(sensors[0]["status"], "offline")
+        self._add(batcher, None, "offline", now=2.0)
+        self.assertFalse(batcher.is_due(now=2.0))
+
+    def test_block_channels_are_batched(self):
+        batcher = mqtt_publisher.SampleBatcher(interval=5.0)
+        self._add(batcher, 20.0)
+        batcher.add([{**reading(20.5), "name": "Temperature", "type": "temperature",
+                      "unit": "C", "raw_value": 512.25, "channels": [512, 300]}], now_ms=1000)
+        self.assertEqual(batcher.flush()[1][0]["ch"], [None, [512, 300]])
+
+
+# =============================================================================
+# Offline buffer
+# =============================================================================
+
+class OfflineBufferTests(unittest.TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.buffer = mqtt_publisher.OfflineBuffer(os.path.join(tmpdir.name, "buffer.db"),
+                                                   max_messages=3)
+        self.addCleanup(self.buffer.close)
+
+    def test_count_follows_rows_deleted(self):
+        for i in range(3):
+            self.buffer.append("xiot/PI-001/sensors", b"%d" % i)
+        delivered = [row[0] for row in self.buffer.peek(2)]
+        # Evicts the oldest message, which is also being replayed
+        self.buffer.append("xiot/PI-001/sensors", b"3")
+        self.buffer.remove(delivered)
+        self.assertEqual(len(self.buffer), 2)
+        self.assertEqual([row[2] for row in self.buffer.peek(10)], [b"2", b"3"])
+
+    def test_count_survives_reopen(self):
+        self.buffer.append("xiot/PI-001/sensors", b"0")
+        reopened = mqtt_publisher.OfflineBuffer(self.buffer.path)
+        self.addCleanup(reopened.close)
+        self.assertEqual(len(reopened), 1)
+
+
+# =============================================================================
+# Wire format
+# =============================================================================
+
+def batch_payload(raws, values):
+    return {
+        "baseboard_id": "PI-001",
+        "version": 2,
+        "base_time": 1767000000000,
+        "sensors": [{"i2c_address": "0x08", "status": "active",
+                     "t": list(range(len(values))), "v": values, "raw": raws}],
+    }
+
+
+class WireFormatTests(unittest.TestCase):
+    def test_oversampled_raw_values_round_trip(self):
+        payload = batch_payload([512.25, 848, 1023.75], [1.0, 2.0, 3.0])
+        decoded = wire_format.decode_payload(wire_format.encode_binary(payload))
+        self.assertEqual(decoded["sensors"][0]["raw"], [512.25, 848, 1023.75])
+
+    def test_block_channels_round_trip(self):
+        payload = batch_payload([512.25, None, 600], [1.0, None, 2.0])
+        payload["sensors"][0]["ch"] = [[512, 300, 341], None, [600, 301, 341]]
+        decoded = wire_format.decode_payload(wire_format.encode_binary(payload))["sensors"][0]
+        self.assertEqual(decoded["ch"], [[512, 300, 341], None, [600, 301, 341]])
+
+    def test_offline_samples_and_missing_raw_values(self):
+        payload = batch_payload(None, [20.5, None])
+        decoded = wire_format.decode_payload(wire_format.encode_binary(payload))["sensors"][0]
+        self.assertEqual(decoded["v"], [20.5, None])
+        self.assertEqual(decoded["raw"], [None, None])
+        self.assertEqual(decoded["status"], "offline")
+
+    def test_truncated_payload(self):
+        data = wire_format.encode_binary(batch_payload([1], [1.0]))
+        with self.assertRaises(wire_format.PayloadError):
+            wire_format.decode_payload(data[:-4])
+
+    def test_version_1_raw_values_are_whole_counts(self):
+        data = bytearray(wire_format.encode_binary(batch_payload([848], [2.0])))
+        data[1] = 1
+        raw_at = len(data) - 8 - 2
+        data[raw_at:raw_at + 2] = (848).to_bytes(2, "little")
+        self.assertEqual(wire_format.decode_payload(bytes(data))["sensors"][0]["raw"], [848])
+
+
+# =============================================================================
+# Video streaming
+# =============================================================================
+
+def jpeg(n):
+    return multimedia_server.JPEG_SOI + bytes([n]) * 3 + multimedia_server.JPEG_EOI
+
+
+class CameraCaptureTests(unittest.TestCase):
+    def _frames(self, chunks):
+        async def run():
+            capture = multimedia_server.CameraCapture()
+            capture.clients = 1
+            published = []
+
+            async def publish(frame):
+                published.append(frame)
+
+            capture.hub.publish = publish
+            stream = asyncio.StreamReader()
+            for chunk in chunks:
+                stream.feed_data(chunk)
+            stream.feed_eof()
+            self.assertTrue(await capture._read_frames(stream))
+            return published
+
+        return asyncio.run(run())
+
+    def test_frames_split_across_reads(self):
+        data = b"junk" + jpeg(1) + jpeg(2) + b"\xff" + jpeg(3)
+        chunks = [data[i:i + 5] for i in range(0, len(data), 5)]
+        self.assertEqual(self._frames(chunks), [jpeg(1), jpeg(2), jpeg(3)])
+
+    def test_incomplete_frame_is_not_published(self):
+        self.assertEqual(self._frames([jpeg(1) + jpeg(2)[:-1]]), [jpeg(1)])
+
+
+class FrameHubTests(unittest.TestCase):
+    def test_slow_client_gets_the_newest_frame(self):
+        async def run():
+            hub = multimedia_server.FrameHub()
+            await hub.publish(b"1")
+            seq, _, frame = await hub.next_frame(0)
+            # Two frames arrive while the client is still sending the first
+            await hub.publish(b"2")
+            await hub.publish(b"3")
+            return seq, await hub.next_frame(seq)
+
+        first, (seq, header, frame) = asyncio.run(run())
+        self.assertEqual((first, seq, frame), (1, 3, b"3"))
+        self.assertIn(b"Content-Length: 1\r\n", header)
+
+    def test_cleared_hub_waits_for_a_fresh_frame(self):
+        async def run():
+            hub = multimedia_server.FrameHub()
+            await hub.publish(b"old")
+            hub.clear()
+            waiter = asyncio.ensure_future(hub.next_frame(0))
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            await hub.publish(b"new")
+            return await asyncio.wait_for(waiter, 1)
+
+        self.assertEqual(asyncio.run(run())[2], b"new")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Compact binary encoding for batched sensor payloads.
+
+Messages on ``xiot/<board>/sensors`` are either JSON (first byte ``{``) or
+this binary format, identified by its first byte ``BINARY_MAGIC``. The
+binary form carries the same information as a version 2 JSON payload,
+laid out column-wise per sensor so it decodes with a few C-level copies:
+
+    header   <BBBQB   magic, format version, flags, base_time (epoch ms),
+                      baseboard id length
+             bytes    baseboard id (UTF-8)
+             <B       sensor count
+    sensor   <BH      i2c address, sample count n
+             n x u32  offsets from base_time in ms
+             n x u16  raw values in 1/RAW_SCALE ADC counts (0xFFFF = none)
+             n x f64  converted values (NaN = sensor offline)
+    with FLAG_CHANNELS, each sensor section continues with
+             <B       channel count c (0 = no channels)
+             n*c u16  block adapter channels, sample by sample
+                      (0xFFFF = none)
+
+Raw values are the numbers calibration was applied to, in 10-bit ADC
+counts; block adapters oversample, so they can be fractional (quarter
+counts). Version 1 payloads carried whole counts unscaled and are still
+decoded; FLAG_CHANNELS is new in version 3. All integers and floats are
+little-endian; a sample costs 14 bytes, plus 2 per channel. The backend
+decodes it with its copy of this module in
+``Interface/backend/api/wire_format.py``; keep the two in sync.
+"""
+
+import json
+import math
+import struct
+import sys
+from array import array
+
+
+BINARY_MAGIC = 0xB5
+FORMAT_VERSION = 3
+
+FLAG_BACKFILL = 0x01
+# Sensor sections end with a channel column
+FLAG_CHANNELS = 0x02
+
+RAW_MISSING = 0xFFFF
+# Raw values travel as integers in 1/RAW_SCALE counts (version 2 onwards)
+RAW_SCALE = 4
+
+HEADER = struct.Struct('<BBBQB')
+SENSOR_COUNT = struct.Struct('<B')
+SECTION = struct.Struct('<BH')
+CHANNEL_COUNT = struct.Struct('<B')
+
+_SWAP = sys.byteorder != 'little'
+
+
+class PayloadError(ValueError):
+    """Raised when a sensors payload cannot be decoded."""
+
+
+def is_binary(data):
+    """Return True if raw MQTT payload bytes use the binary format."""
+    return bool(data) and data[0] == BINARY_MAGIC
+
+
+def decode_payload(data):
+    """
+    Decode raw MQTT payload bytes (JSON or binary) into a dict.
+
+    Binary payloads are returned in the version 2 JSON shape.
+    """
+    if is_binary(data):
+        return decode_binary(data)
+    try:
+        return json.loads(data.decode())
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise PayloadError(str(e)) from e
+
+
+def _column(typecode, values):
+    column = array(typecode, values)
+    if _SWAP:
+        column.byteswap()
+    return column.tobytes()
+
+
+def encode_binary(payload):
+    """Encode a version 2 sensors payload into the binary format."""
+    board_id = payload["baseboard_id"].encode()
+    flags = FLAG_BACKFILL if payload.get("backfill") else 0
+    sensors = payload["sensors"]
+    if any(sensor.get("ch") for sensor in sensors):
+        flags |= FLAG_CHANNELS
+
+    parts = [
+        HEADER.pack(BINARY_MAGIC, FORMAT_VERSION, flags, payload["base_time"], len(board_id)),
+        board_id,
+        SENSOR_COUNT.pack(len(sensors)),
+    ]
+    for sensor in sensors:
+        values = sensor["v"]
+        raws = sensor.get("raw") or [None] * len(values)
+        parts.append(SECTION.pack(int(sensor["i2c_address"], 16), len(values)))
+        parts.append(_column('I', sensor["t"]))
+        parts.append(_column('H', [RAW_MISSING if r is None else round(r * RAW_SCALE) for r in raws]))
+        parts.append(_column('d', [math.nan if v is None else v for v in values]))
+        if flags & FLAG_CHANNELS:
+            samples = sensor.get("ch") or []
+            count = max((len(c) for c in samples if c), default=0)
+            parts.append(CHANNEL_COUNT.pack(count))
+            if count:
+                parts.append(_column('H', [
+                    channels[i] if channels and i < len(channels) else RAW_MISSING
+                    for channels in samples for i in range(count)
+                ]))
+    return b''.join(parts)
+
+
+def _read_column(typecode, data, offset, count):
+    column = array(typecode)
+    end = offset + count * column.itemsize
+    if end > len(data):
+        raise PayloadError("Truncated binary payload")
+    column.frombytes(data[offset:end])
+    if _SWAP:
+        column.byteswap()
+    return column.tolist(), end
+
+
+def decode_binary(data):
+    """Decode a binary sensors payload into the version 2 JSON shape."""
+    try:
+        magic, version, flags, base_time, id_len = HEADER.unpack_from(data, 0)
+        if version not in (1, 2, FORMAT_VERSION):
+            raise PayloadError(f"Unsupported binary payload version {version}")
+        offset = HEADER.size
+        board_id = bytes(data[offset:offset + id_len]).decode()
+        offset += id_len
+        (sensor_count,) = SENSOR_COUNT.unpack_from(data, offset)
+        offset += SENSOR_COUNT.size
+
+        sensors = []
+        for _ in range(sensor_count):
+            addr, count = SECTION.unpack_from(data, offset)
+            offset += SECTION.size
+            offsets, offset = _read_column('I', data, offset, count)
+            raws, offset = _read_column('H', data, offset, count)
+            values, offset = _read_column('d', data, offset, count)
+            channels = None
+            if flags & FLAG_CHANNELS:
+                (width,) = CHANNEL_COUNT.unpack_from(data, offset)
+                offset += CHANNEL_COUNT.size
+                if width:
+                    column, offset = _read_column('H', data, offset, count * width)
+                    # Samples with fewer channels were padded with RAW_MISSING
+                    channels = [
+                        [c for c in column[i:i + width] if c != RAW_MISSING] or None
+                        for i in range(0, count * width, width)
+                    ]
+
+            # NaN marks samples taken while the sensor was offline
+            if any(v != v for v in values):
+                values = [None if v != v else v for v in values]
+            if version > 1:
+                raws = [None if r == RAW_MISSING else r / RAW_SCALE for r in raws]
+            elif RAW_MISSING in raws:
+                raws = [None if r == RAW_MISSING else r for r in raws]
+            sensor = {
+                "i2c_address": f"0x{addr:02X}",
+                "status": "active" if values and values[-1] is not None else "offline",
+                "t": offsets,
+                "v": values,
+                "raw": raws,
+            }
+            if channels is not None:
+                sensor["ch"] = channels
+            sensors.append(sensor)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise PayloadError(str(e)) from e
+
+    payload = {
+        "baseboard_id": board_id,
+        "version": 2,
+        "base_time": base_time,
+        "sensors": sensors,
+    }
+    if flags & FLAG_BACKFILL:
+        payload["backfill"] = True
+    return payload
@@ -0,0 +1,245 @@
+/**
+ * ATtiny85 Multi-Channel Sensor Adapter (Block Read Protocol)
+ *
+ * Sensor firmware that supports:
+ * - Auto-discovery: responds to IDENTIFY (0xFF) with device info,
+ *   advertising CAP_BLOCK
+ * - Block read: READ_BLOCK (0xFE) returns every channel, a sequence
+ *   counter and an oversampled value in one frame (14 bytes for 4
+ *   channels, 2 bytes less per channel left out)
+ * - Legacy read: any other read returns the 2-byte channel 0 value, as
+ *   attiny85_sensor.ino does
+ *
+ * Configure DEVICE settings below before flashing!
+ *
+ * Block frame (version 2, n = BLOCK_CHANNELS, see Pi/adapter_protocol.py):
+ *   [0]         Protocol version (2)
+ *   [1]         Sequence counter (incremented per conversion cycle)
+ *   [2]         Channel count n
+ *   [3..2+2n]   Channels 0..n-1, 10-bit, LSB first
+ *   next 2      Channel 0 oversampled 16x, 12-bit, LSB first
+ *   last        CRC-8 (poly 0x07) of all preceding bytes
+ *
+ * Channels (the first BLOCK_CHANNELS are converted and sent):
+ *   0 - A2 (PB4) sensor input
+ *   1 - A3 (PB3) auxiliary input
+ *   2 - Internal temperature sensor (1.1V reference)
+ *   3 - 1.1V bandgap against VCC (VCC = 1.1 * 1023 / value)
+ *
+ * The Pi reads single-channel adapters with the legacy read.
+ */
+
+#include <TinyWireS.h>
+
+// =============================================================================
+// DEVICE CONFIGURATION - MODIFY THESE FOR EACH ADAPTER
+// =============================================================================
+
+#define SLAVE_ADDR 8  // I2C address (8-119 valid range)
+
+// Device identification bytes (for auto-discovery)
+#define XIOT_MAGIC   0xA5  // Confirms this is an XIOT device
+#define DEV_CLASS    0x01  // 0x01=Sensor
+#define DEV_SUBTYPE  0x10  // 0x10=Temperature, 0x11=Humidity, etc.
+#define DEV_CAPS     0x29  // Capabilities: 0x01=Read, 0x08=Analog, 0x20=Block
+
+#define BLOCK_CHANNELS 4   // Channels in the block frame (1-4, see below)
+
+// =============================================================================
+// PIN DEFINITIONS
+// =============================================================================
+
+// Shift register pins (used ONLY before I2C starts)
+const int latchPin = 1;   // PB1
+const int clockPin = 0;   // PB0 (becomes SDA after I2C init)
+const int dataPin = 2;    // PB2 (becomes SCL after I2C init)
+
+// ADC multiplexer settings (ADMUX) per channel
+#define MUX_A2          0x02                   // PB4, VCC reference
+#define MUX_A3          0x03                   // PB3, VCC reference
+#define MUX_TEMPERATURE (_BV(REFS1) | 0x0F)    // ADC4, 1.1V reference
+#define MUX_BANDGAP     0x0C                   // 1.1V bandgap, VCC reference
+
+// =============================================================================
+// PROTOCOL
+// =============================================================================
+
+#define CMD_READ_BLOCK 0xFE
+#define CMD_IDENTIFY   0xFF
+
+#define BLOCK_VERSION  2
+#define FRAME_LENGTH   (3 + 2 * BLOCK_CHANNELS + 2 + 1)  // At most 14, fits the 16-byte TX buffer
+
+// Samples summed for the oversampled value: 16 samples give 2 extra bits
+#define OVERSAMPLE_COUNT 16
+
+// =============================================================================
+// STATE VARIABLES
+// =============================================================================
+
+// Frame being sent; replaced as a whole with interrupts disabled
+volatile uint8_t frame[FRAME_LENGTH];
+volatile uint16_t channel0 = 0;
+
+// Request mode (volatile for ISR access)
+#define MODE_LEGACY   0
+#define MODE_IDENTIFY 1
+#define MODE_BLOCK    2
+volatile uint8_t requestMode = MODE_LEGACY;
+
+uint8_t sequence = 0;
+
+// =============================================================================
+// SETUP FUNCTIONS
+// =============================================================================
+
+void setup_shift_register(int config_bits) {
+    digitalWrite(latchPin, LOW);
+    shiftOut(dataPin, clockPin, LSBFIRST, config_bits);
+    digitalWrite(latchPin, HIGH);
+    delay(1000);
+}
+
+void setup() {
+    // Configure shift register pins BEFORE I2C initialization
+    pinMode(latchPin, OUTPUT);
+    pinMode(clockPin, OUTPUT);
+    pinMode(dataPin, OUTPUT);
+
+    // Configure shift register for sensor mode
+    setup_shift_register(B01100011);
+
+    // Enable the ADC, prescaler 64 (125 kHz at 8 MHz)
+    ADCSRA = _BV(ADEN) | _BV(ADPS2) | _BV(ADPS1);
+
+    // Initialize as I2C slave (takes over PB0=SDA, PB2=SCL)
+    TinyWireS.begin(SLAVE_ADDR);
+    TinyWireS.onReceive(receiveEvent);
+    TinyWireS.onRequest(requestEvent);
+}
+
+// =============================================================================
+// MAIN LOOP
+// =============================================================================
+
+void loop() {
+    uint16_t channels[BLOCK_CHANNELS];
+
+    // Oversample channel 0: sum 16 samples, drop 2 bits -> 12-bit value
+    uint16_t sum = 0;
+    for (uint8_t i = 0; i < OVERSAMPLE_COUNT; i++) {
+        sum += readADC(MUX_A2);
+        TinyWireS_stop_check();
+    }
+    uint16_t oversampled = sum >> 2;
+    channels[0] = oversampled >> 2;
+#if BLOCK_CHANNELS > 1
+    channels[1] = readADC(MUX_A3);
+#endif
+#if BLOCK_CHANNELS > 2
+    channels[2] = readADC(MUX_TEMPERATURE);
+#endif
+#if BLOCK_CHANNELS > 3
+    channels[3] = readADC(MUX_BANDGAP);
+#endif
+
+    buildFrame(channels, oversampled);
+
+    // Required for TinyWireS to work properly
+    TinyWireS_stop_check();
+    delay(10);
+}
+
+// =============================================================================
+// ADC AND FRAME
+// =============================================================================
+
+uint16_t readADC(uint8_t mux) {
+    if (ADMUX != mux) {
+        ADMUX = mux;
+        delay(1);                  // Let the reference/input settle
+        ADCSRA |= _BV(ADSC);       // Discard the first conversion
+        while (ADCSRA & _BV(ADSC));
+    }
+    ADCSRA |= _BV(ADSC);
+    while (ADCSRA & _BV(ADSC));
+    return ADC;
+}
+
+uint8_t crc8(const uint8_t *data, uint8_t length) {
+    uint8_t crc = 0;
+    for (uint8_t i = 0; i < length; i++) {
+        crc ^= data[i];
+        for (uint8_t bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x80) ? (uint8_t)((crc << 1) ^ 0x07) : (uint8_t)(crc << 1);
+        }
+    }
+    return crc;
+}
+
+void buildFrame(const uint16_t *channels, uint16_t oversampled) {
+    uint8_t next[FRAME_LENGTH];
+
+    sequence++;
+    next[0] = BLOCK_VERSION;
+    next[1] = sequence;
+    next[2] = BLOCK_CHANNELS;
+    for (uint8_t i = 0; i < BLOCK_CHANNELS; i++) {
+        next[3 + 2 * i] = channels[i] & 0xFF;
+        next[4 + 2 * i] = (channels[i] >> 8) & 0x03;
+    }
+    next[3 + 2 * BLOCK_CHANNELS] = oversampled & 0xFF;
+    next[4 + 2 * BLOCK_CHANNELS] = (oversampled >> 8) & 0x0F;
+    next[FRAME_LENGTH - 1] = crc8(next, FRAME_LENGTH - 1);
+
+    // Swap in the new frame atomically so a read never sees half of it
+    noInterrupts();
+    for (uint8_t i = 0; i < FRAME_LENGTH; i++) {
+        frame[i] = next[i];
+    }
+    channel0 = channels[0];
+    interrupts();
+}
+
+// =============================================================================
+// I2C HANDLERS
+// =============================================================================
+
+// Called when master sends data to us (command or SMBus register byte)
+void receiveEvent(uint8_t numBytes) {
+    if (numBytes > 0) {
+        uint8_t cmd = TinyWireS.read();
+        if (cmd == CMD_IDENTIFY) {
+            requestMode = MODE_IDENTIFY;
+        } else if (cmd == CMD_READ_BLOCK) {
+            requestMode = MODE_BLOCK;
+        } else {
+            requestMode = MODE_LEGACY;
+        }
+    }
+    // Drain any extra bytes
+    while (TinyWireS.available()) {
+        TinyWireS.read();
+    }
+}
+
+// Called when master requests data from us
+void requestEvent() {
+    if (requestMode == MODE_IDENTIFY) {
+        // Send device identification (4 bytes)
+        TinyWireS.write(XIOT_MAGIC);    // Byte 0: 0xA5
+        TinyWireS.write(DEV_CLASS);     // Byte 1: Device class
+        TinyWireS.write(DEV_SUBTYPE);   // Byte 2: Device subtype
+        TinyWireS.write(DEV_CAPS);      // Byte 3: Capabilities
+    } else if (requestMode == MODE_BLOCK) {
+        // Send the whole frame
+        for (uint8_t i = 0; i < FRAME_LENGTH; i++) {
+            TinyWireS.write(frame[i]);
+        }
+    } else {
+        // Legacy: channel 0, 2 bytes, LSB first
+        TinyWireS.write((uint8_t)(channel0 & 0xFF));
+        TinyWireS.write((uint8_t)((channel0 >> 8) & 0x03));
+    }
+    requestMode = MODE_LEGACY;
+}